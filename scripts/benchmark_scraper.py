@@ -0,0 +1,114 @@
+# scripts/benchmark_scraper.py
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+from datetime import datetime
+
+from scripts.config import SCRAPER_CONCURRENCY, MEDIA_DOWNLOAD_CONCURRENCY
+from scripts.fake_telegram_client import FakeTelegramClient
+from scripts.jsonl_writer import BufferedJsonlWriter
+from scripts.media_downloader import MediaDownloader
+from scripts.rate_limiter import TelegramCallScheduler, TokenBucket
+from scripts.scrape_checkpoint import ScrapeCheckpoint
+from scripts.telegram_scraper import get_channel_entities, scrape_channels_concurrently, make_checkpoint_committer
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+async def run_benchmark(args, work_dir):
+    """Scrapes the fake channels end to end into `work_dir` and returns the measured numbers."""
+    client = FakeTelegramClient(num_channels=args.channels, messages_per_channel=args.messages,
+                                photo_ratio=args.photo_ratio, document_ratio=args.document_ratio,
+                                media_size=args.media_kb * 1024, latency=args.latency_ms / 1000,
+                                error_rate=args.error_rate, seed=args.seed)
+    scheduler = TelegramCallScheduler(bucket=TokenBucket(rate=args.requests_per_second,
+                                                         capacity=args.requests_per_second),
+                                      backoff_base=0.05)
+    checkpoint = ScrapeCheckpoint(os.path.join(work_dir, 'scrape_checkpoint.json'))
+    images_dir = os.path.join(work_dir, 'images')
+    documents_dir = os.path.join(work_dir, 'documents')
+    os.makedirs(images_dir, exist_ok=True)
+    os.makedirs(documents_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    async with client:
+        entities = await get_channel_entities(client, client.channel_urls, args.concurrency, scheduler)
+        media_downloader = MediaDownloader(concurrency=args.media_concurrency, scheduler=scheduler,
+                                           failures_path=os.path.join(work_dir, 'media_failures.jsonl'),
+                                           images_dir=images_dir, documents_dir=documents_dir)
+        media_downloader.start()
+        try:
+            with BufferedJsonlWriter(os.path.join(work_dir, 'telegram_messages.jsonl'), mode='w',
+                                     on_flush=make_checkpoint_committer(checkpoint)) as writer:
+                scrape_start = time.perf_counter()
+                # No per-channel limit: every synthetic message is scraped
+                await scrape_channels_concurrently(client, entities, checkpoint, writer, args.concurrency,
+                                                   media_downloader, scheduler, limit=None)
+                scrape_seconds = time.perf_counter() - scrape_start
+        finally:
+            await media_downloader.close()
+    total_seconds = time.perf_counter() - start
+
+    media_mb = media_downloader.bytes_downloaded / (1024 * 1024)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'config': vars(args),
+        'messages': writer.records_written,
+        'scrape_seconds': round(scrape_seconds, 3),
+        'total_seconds': round(total_seconds, 3),
+        'messages_per_sec': round(writer.records_written / scrape_seconds, 1) if scrape_seconds else None,
+        'media_files': media_downloader.downloaded,
+        'media_duplicates_skipped': media_downloader.skipped_duplicates,
+        'media_failed': media_downloader.failed,
+        'media_mb': round(media_mb, 2),
+        'media_mb_per_sec': round(media_mb / total_seconds, 2) if total_seconds else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'api_stats': {str(channel): dict(counters) for channel, counters in scheduler.stats.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Telegram scraper against an offline fake client.")
+    parser.add_argument('--channels', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=2000, help="Messages per channel.")
+    parser.add_argument('--photo-ratio', type=float, default=0.6)
+    parser.add_argument('--document-ratio', type=float, default=0.05)
+    parser.add_argument('--media-kb', type=int, default=100, help="Size of each photo (documents are 5x).")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Simulated round-trip latency per call.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Probability of an injected error per call.")
+    parser.add_argument('--concurrency', type=int, default=SCRAPER_CONCURRENCY)
+    parser.add_argument('--media-concurrency', type=int, default=MEDIA_DOWNLOAD_CONCURRENCY)
+    parser.add_argument('--requests-per-second', type=float, default=1000.0,
+                        help="Rate limit used during the benchmark (high by default so it measures the scraper).")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-json', help="Append the result as one JSON line to this file.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='scraper_benchmark_')
+    try:
+        result = asyncio.run(run_benchmark(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\n--- Scraper Benchmark ---")
+    for key in ('messages', 'scrape_seconds', 'messages_per_sec', 'media_files', 'media_duplicates_skipped',
+                'media_failed', 'media_mb', 'media_mb_per_sec', 'total_seconds', 'peak_rss_mb'):
+        print(f"{key:>26}: {result[key]}")
+    if args.output_json:
+        with open(args.output_json, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        print(f"Result appended to {args.output_json}")
+
+
+if __name__ == '__main__':
+    main()
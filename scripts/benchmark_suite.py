@@ -0,0 +1,273 @@
+# scripts/benchmark_suite.py
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import resource
+import subprocess
+import contextlib
+from array import array
+from datetime import datetime
+
+import numpy as np
+
+from scripts.config import BASE_DIR, BENCHMARK_RESULTS_JSONL, SYNTHETIC_LABELED_MESSAGES, PREPROCESS_WORKERS
+from scripts.convert_to_conll import convert_to_conll_format
+from scripts.main_data_pipeline import iter_jsonl, preprocess_messages
+from scripts.metrics import peak_rss_mb
+from scripts.prepare_for_labeling import extract_messages_for_labeling
+from scripts.synthetic_corpus import generate_corpus
+from scripts.text_preprocessor import AmharicPreprocessor
+
+# Benchmarks in the order they run; extract_messages_for_labeling reads the structured output of step2
+BENCHMARKS = ('preprocess_text', 'extract_price', 'extract_phone_number', 'step2',
+              'extract_messages_for_labeling', 'convert_to_conll_format')
+PERCENTILES = (50, 90, 99)
+# Throughput changes smaller than this (as a fraction) are reported as noise when comparing runs
+CHANGE_THRESHOLD = 0.10
+# Describes the corpus in a --corpus-dir, so it is only reused for the same settings
+CORPUS_META_FILE = 'corpus.json'
+
+
+def reset_peak_rss():
+    """
+    Resets this process's peak RSS (on Linux, by writing 5 to /proc/self/clear_refs), so that
+    current_peak_rss_mb() covers only what runs afterwards. Returns False where that is not
+    possible; the peak then covers everything since the process started.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _proc_status_mb(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_peak_rss_mb():
+    """Peak RSS since the last reset_peak_rss() (VmHWM), or since the process started where there is no /proc."""
+    peak = _proc_status_mb('VmHWM')
+    return peak if peak is not None else peak_rss_mb()
+
+
+def summarize(name, items, seconds, latencies, rss_before, **extra):
+    """One benchmark result; `latencies` are in seconds, per call or per run."""
+    peak = current_peak_rss_mb()
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'benchmark': name,
+        'items': items,
+        'seconds': round(seconds, 4),
+        'items_per_sec': round(items / seconds, 1) if seconds else None,
+        'latency_ms': {**{f"p{p}": round(float(value), 4)
+                          for p, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES))},
+                       'max': round(float(latencies_ms.max()), 4)} if len(latencies_ms) else None,
+        'peak_rss_mb': round(peak, 1),
+        'rss_growth_mb': round(peak - rss_before, 1) if rss_before is not None else None,
+        **extra,
+    }
+
+
+def benchmark_calls(name, func, texts):
+    """Calls func(text) once per text, timing each call; throughput counts the time spent inside func only."""
+    reset_peak_rss()
+    rss_before = _proc_status_mb('VmRSS')
+    latencies = array('d')
+    clock = time.perf_counter
+    for text in texts:
+        start = clock()
+        func(text)
+        latencies.append(clock() - start)
+    return summarize(name, len(latencies), sum(latencies), latencies, rss_before, latency_unit='call')
+
+
+def benchmark_runs(name, run, repeats=1):
+    """Times `repeats` calls of run(), which processes a whole file and returns how many messages it handled."""
+    reset_peak_rss()
+    rss_before = _proc_status_mb('VmRSS')
+    latencies, items = [], 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        # The functions report their progress on stdout; only the numbers are of interest here
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            items += run()
+        latencies.append(time.perf_counter() - start)
+    return summarize(name, items, sum(latencies), latencies, rss_before, latency_unit='run', runs=repeats)
+
+
+def prepare_corpus(corpus_dir, messages, labeled_messages, seed):
+    """Generates the synthetic corpus in `corpus_dir`, unless one with the same settings is there already."""
+    meta = {'messages': messages, 'labeled_messages': labeled_messages, 'seed': seed}
+    meta_path = os.path.join(corpus_dir, CORPUS_META_FILE)
+    raw_path = os.path.join(corpus_dir, 'telegram_messages.jsonl')
+    labeled_path = os.path.join(corpus_dir, 'labeled_data_raw.txt')
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == meta:
+                print(f"Reusing the synthetic corpus in {corpus_dir}")
+                return raw_path, labeled_path
+    generate_corpus(messages, raw_path, labeled_path, labeled_messages, seed)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return raw_path, labeled_path
+
+
+def run_suite(benchmarks=BENCHMARKS, messages=100_000, labeled_messages=SYNTHETIC_LABELED_MESSAGES, seed=42,
+              workers=PREPROCESS_WORKERS, repeats=3, corpus_dir=None):
+    """
+    Runs the selected benchmarks on a synthetic corpus of `messages` posts (see synthetic_corpus.py):
+    - preprocess_text, extract_price, extract_phone_number: every message text, timed per call, each
+      on a new AmharicPreprocessor (so caches start empty, as in a fresh pipeline run);
+    - step2: the end-to-end Step 2 (preprocess_messages with `workers` processes, near-duplicate
+      detection, JSONL, Parquet and message store output) into a scratch directory, without the
+      preprocessing cache;
+    - extract_messages_for_labeling: all structured messages of step2, `repeats` times;
+    - convert_to_conll_format: the labeled tokens of the first `labeled_messages` posts, `repeats` times.
+    Peak RSS is measured per benchmark where the platform allows it (see reset_peak_rss).
+    Returns the run as a dict (settings, environment and one result per benchmark).
+    """
+    work_dir = tempfile.mkdtemp(prefix='benchmark_suite_')
+    try:
+        corpus_start = time.perf_counter()
+        raw_path, labeled_path = prepare_corpus(corpus_dir or work_dir, messages, labeled_messages, seed)
+        corpus_seconds = time.perf_counter() - corpus_start
+        structured_path = os.path.join(work_dir, 'structured_telegram_data.jsonl')
+        results = []
+
+        def texts():
+            return (record.get('text') for record in iter_jsonl(raw_path))
+
+        for name in ('preprocess_text', 'extract_price', 'extract_phone_number'):
+            if name in benchmarks:
+                print(f"Benchmarking {name}...")
+                results.append(benchmark_calls(name, getattr(AmharicPreprocessor(), name), texts()))
+
+        if 'step2' in benchmarks or 'extract_messages_for_labeling' in benchmarks:
+            print("Benchmarking step2...")
+            result = benchmark_runs('step2', lambda: preprocess_messages(
+                iter_jsonl(raw_path), structured_path, workers, use_cache=False,
+                parquet_dir=os.path.join(work_dir, 'structured_telegram_data.parquet'),
+                message_store_path=os.path.join(work_dir, 'messages.sqlite3'),
+                near_duplicate_index_path=os.path.join(work_dir, 'near_duplicate_index.pkl')))
+            if workers > 1:
+                result['peak_rss_children_mb'] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+            if 'step2' in benchmarks:
+                results.append(result)
+
+        if 'extract_messages_for_labeling' in benchmarks:
+            print("Benchmarking extract_messages_for_labeling...")
+            output_path = os.path.join(work_dir, 'messages_for_labeling.txt')
+
+            results.append(benchmark_runs('extract_messages_for_labeling', lambda: extract_messages_for_labeling(
+                messages, output_path, structured_path), repeats))
+
+        if 'convert_to_conll_format' in benchmarks and labeled_messages:
+            print("Benchmarking convert_to_conll_format...")
+            output_path = os.path.join(work_dir, 'labeled_data_conll.txt')
+            results.append(benchmark_runs('convert_to_conll_format', lambda: convert_to_conll_format(
+                labeled_path, output_path)['sentences'], repeats))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {'messages': messages, 'labeled_messages': labeled_messages, 'seed': seed, 'workers': workers,
+                   'repeats': repeats},
+        'corpus_seconds': round(corpus_seconds, 3),
+        'results': results,
+    }
+
+
+def git_commit():
+    """Short hash of the checked-out commit (with '+' if there are uncommitted changes), None outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BASE_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+' if dirty else '')
+
+
+def load_runs(path=BENCHMARK_RESULTS_JSONL):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_run(run, path=BENCHMARK_RESULTS_JSONL):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, ensure_ascii=False) + '\n')
+
+
+def previous_run(runs, run):
+    """The latest earlier run with the same settings (corpus size, seed, workers), or None."""
+    matching = [earlier for earlier in runs if earlier['config'] == run['config']]
+    return matching[-1] if matching else None
+
+
+def print_run(run, baseline=None):
+    """Prints the results, with the throughput change against `baseline` (an earlier run) when given."""
+    print(f"\n--- Benchmark Suite ({run['config']['messages']} messages, commit {run['git_commit']}) ---")
+    if baseline is not None:
+        print(f"Compared with the run of {baseline['timestamp']} (commit {baseline['git_commit']})")
+    earlier = {result['benchmark']: result for result in baseline['results']} if baseline else {}
+    print(f"{'benchmark':<30} {'items/s':>11} {'per':>5} {'p50 ms':>10} {'p99 ms':>10} {'peak MB':>8} {'+MB':>7} "
+          f"{'change':>16}")
+    for result in run['results']:
+        latency = result['latency_ms'] or {}
+        change = ''
+        before = earlier.get(result['benchmark'])
+        if before and before['items_per_sec'] and result['items_per_sec']:
+            ratio = result['items_per_sec'] / before['items_per_sec'] - 1
+            verdict = 'faster' if ratio > CHANGE_THRESHOLD else 'slower' if ratio < -CHANGE_THRESHOLD else 'same'
+            change = f"{ratio:+.1%} {verdict}"
+        print(f"{result['benchmark']:<30} {result['items_per_sec']:>11,.1f} {result['latency_unit']:>5} "
+              f"{latency.get('p50', 0):>10.4f} {latency.get('p99', 0):>10.4f} {result['peak_rss_mb']:>8.1f} "
+              f"{result['rss_growth_mb'] or 0:>7.1f} {change:>16}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, Step 2 and the labeling helpers "
+                                                 "on a synthetic corpus, and compare with earlier runs.")
+    parser.add_argument('--messages', type=int, default=100_000, help="Corpus size (e.g. 10000 to 10000000).")
+    parser.add_argument('--labeled-messages', type=int, default=SYNTHETIC_LABELED_MESSAGES,
+                        help="Messages in the labeled file converted to CoNLL.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=PREPROCESS_WORKERS, help="Step 2 worker processes.")
+    parser.add_argument('--repeats', type=int, default=3, help="Runs of the file-level labeling benchmarks.")
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--corpus-dir', help="Keep the generated corpus here and reuse it in later runs.")
+    parser.add_argument('--results', default=BENCHMARK_RESULTS_JSONL, help="JSONL file the runs are appended to.")
+    parser.add_argument('--no-save', action='store_true', help="Print the results without saving them.")
+    args = parser.parse_args()
+
+    suite_run = run_suite(args.benchmarks, args.messages, args.labeled_messages, args.seed, args.workers,
+                          args.repeats, args.corpus_dir)
+    print_run(suite_run, previous_run(load_runs(args.results), suite_run))
+    if not args.no_save:
+        save_run(suite_run, args.results)
+        print(f"Results appended to {args.results}")
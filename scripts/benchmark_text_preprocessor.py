@@ -0,0 +1,73 @@
+# scripts/benchmark_text_preprocessor.py
+import os
+import json
+import time
+import random
+import argparse
+
+from scripts.config import RAW_MESSAGES_JSONL, AMHARIC_HOMOPHONE_MAP
+from scripts.text_preprocessor import AmharicPreprocessor
+
+SAMPLE_TEXT = "ጤና ይስጥልኝ! ይህ በጣም ቆንጆ ስልክ ነው። ዋጋው 5,000 ብር ብቻ። 📞 ለበለጠ መረጃ ይደውሉልን። 0912345678"
+EXTRA_TOKENS = ["📞", "🔥", "✅", "👉", "Samsung", "iPhone", "Nike", "(ቦሌ)", "[አዲስ]", "ዋጋ:", "—", "“ቅናሽ”",
+                "@shop", "#sale", "ሠላም", "ዐለም", "ሸሚዝ", "ፅጌ", "ሀገር", "\n", "\t"]
+
+
+def load_texts(input_path, size, seed):
+    """
+    Returns `size` message texts. Real texts from `input_path` are used (and repeated) when available,
+    otherwise the sample message is shuffled and mixed with emojis, symbols and homophone variants.
+    """
+    texts = []
+    if input_path and os.path.exists(input_path):
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                text = json.loads(line).get('text')
+                if text:
+                    texts.append(text)
+                if len(texts) >= size:
+                    break
+    if texts:
+        return [texts[i % len(texts)] for i in range(size)]
+
+    rng = random.Random(seed)
+    base_tokens = SAMPLE_TEXT.split() + list(AMHARIC_HOMOPHONE_MAP)
+    corpus = []
+    for _ in range(size):
+        tokens = rng.choices(base_tokens, k=rng.randint(10, 60)) + rng.choices(EXTRA_TOKENS, k=rng.randint(0, 10))
+        rng.shuffle(tokens)
+        tokens.append(f"{rng.randint(1, 999)},{rng.randint(0, 999):03d}")
+        corpus.append(' '.join(tokens))
+    return corpus
+
+
+def time_function(func, texts):
+    start = time.perf_counter()
+    outputs = [func(text) for text in texts]
+    return time.perf_counter() - start, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare step-by-step and fused Amharic text preprocessing.")
+    parser.add_argument('--input', default=RAW_MESSAGES_JSONL, help="Raw messages JSONL to take texts from.")
+    parser.add_argument('--size', type=int, default=200_000, help="Number of messages to preprocess.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    texts = load_texts(args.input, args.size, args.seed)
+    total_chars = sum(len(text) for text in texts)
+    print(f"Benchmarking on {len(texts)} messages ({total_chars / 1e6:.1f}M characters)...")
+
+    preprocessor = AmharicPreprocessor()
+    stepwise_seconds, stepwise_outputs = time_function(preprocessor.preprocess_text_stepwise, texts)
+    fused_seconds, fused_outputs = time_function(preprocessor.preprocess_text, texts)
+
+    mismatches = sum(1 for a, b in zip(stepwise_outputs, fused_outputs) if a != b)
+    print(f"  Step-by-step: {stepwise_seconds:.2f}s ({len(texts) / stepwise_seconds:,.0f} messages/s)")
+    print(f"  Fused:        {fused_seconds:.2f}s ({len(texts) / fused_seconds:,.0f} messages/s)")
+    print(f"  Speedup:      {stepwise_seconds / fused_seconds:.1f}x")
+    print(f"  Identical outputs: {'yes' if mismatches == 0 else f'NO ({mismatches} mismatches)'}")
+
+
+if __name__ == '__main__':
+    main()
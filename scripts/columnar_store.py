@@ -0,0 +1,270 @@
+# scripts/columnar_store.py
+import os
+import json
+import time
+import shutil
+import argparse
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from scripts import metrics
+from scripts.config import STRUCTURED_DATA_JSONL, STRUCTURED_DATA_PARQUET_DIR, PARQUET_ROW_GROUP_SIZE, \
+                           PARQUET_MAX_BUFFERED_ROWS, PARQUET_COMPRESSION
+
+# Partition columns, encoded in the directory layout as channel_id=<id>/post_month=<YYYY-MM>.
+# A month per partition keeps the file count low for small channels while date filters still skip most files.
+PARTITION_SCHEMA = pa.schema([('channel_id', pa.int64()), ('post_month', pa.string())])
+# Directory name used for a missing partition value (pyarrow's default for hive partitioning)
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+ENTITY_TYPE = pa.struct([('type', pa.string()), ('start', pa.int32()), ('end', pa.int32()),
+                         ('text', pa.string()), ('value', pa.string()), ('currency', pa.string())])
+
+# Columns stored in every Parquet file (the partition columns live in the directory names)
+FILE_SCHEMA = pa.schema([
+    ('message_id', pa.int64()),
+    ('date', pa.timestamp('us', tz='UTC')),
+    ('text', pa.string()),
+    ('cleaned_text', pa.string()),
+    ('views', pa.int64()),
+    ('forwards', pa.int64()),
+    ('replies_count', pa.int64()),
+    # Numeric here so prices can be filtered and aggregated; the JSONL keeps the string that
+    # process_text produces (e.g. '7500.5'), and to_row converts it
+    ('extracted_price', pa.float64()),
+    ('extracted_phone', pa.string()),
+    ('entities', pa.list_(ENTITY_TYPE)),
+    ('duplicate_of', pa.string()),
+    ('has_photo', pa.bool_()),
+    ('image_path', pa.string()),
+    ('has_document', pa.bool_()),
+    ('document_name', pa.string()),
+    ('document_path', pa.string()),
+    ('media_download_error', pa.bool_()),
+])
+
+
+def partition_key(message_data):
+    """Returns the (channel_id, post_month) partition of a structured message."""
+    date = message_data.get('date')
+    # Telethon dates are UTC ISO strings, so the first 7 characters are the month
+    return message_data.get('channel_id'), date[:7] if date else None
+
+
+def partition_path(root_dir, key):
+    channel_id, post_month = key
+    return os.path.join(root_dir,
+                        f"channel_id={NULL_PARTITION if channel_id is None else channel_id}",
+                        f"post_month={post_month or NULL_PARTITION}")
+
+
+def to_row(message_data):
+    """Converts a structured message dict to the typed values of FILE_SCHEMA."""
+    row = dict(message_data)
+    if row.get('date'):
+        row['date'] = datetime.fromisoformat(row['date'])
+    if row.get('extracted_price') is not None:
+        row['extracted_price'] = float(row['extracted_price'])
+    if row.get('entities'):
+        # Entity values are numbers for prices and strings otherwise; one string column holds both
+        row['entities'] = [dict(entity, value=str(entity['value'])) for entity in row['entities']]
+    return row
+
+
+class ParquetDatasetWriter:
+    """
+    Writes structured messages to a Parquet dataset partitioned by channel_id and post_month.
+
+    Rows are buffered per partition and written as one row group once a partition holds
+    `row_group_size` rows (or once `max_buffered_rows` are buffered overall), so memory stays
+    bounded and files are not fragmented into tiny row groups. Every partition gets a single
+    file that stays open until close().
+
+    Like an atomic BufferedJsonlWriter, the dataset is built in a temporary directory that
+    replaces `root_dir` only when the writer is closed successfully. Each finished dataset is
+    kept in its own versioned directory and `root_dir` is a symlink to the current one,
+    so the switch is a single atomic rename and `root_dir` never goes missing.
+    """
+
+    def __init__(self, root_dir=STRUCTURED_DATA_PARQUET_DIR, row_group_size=PARQUET_ROW_GROUP_SIZE,
+                 max_buffered_rows=PARQUET_MAX_BUFFERED_ROWS, compression=PARQUET_COMPRESSION):
+        self.root_dir = root_dir
+        self.row_group_size = max(1, row_group_size)
+        self.max_buffered_rows = max(self.row_group_size, max_buffered_rows)
+        self.compression = compression
+        self.records_written = 0
+        self._buffers = defaultdict(list)
+        self._buffered_rows = 0
+        self._writers = {}
+        self._closed = False
+        self._write_dir = root_dir + '.tmp'
+        self._old_dir = root_dir + '.old'
+        # A crash while replacing a plain-directory dataset (see _publish) leaves it at .old
+        if not os.path.lexists(root_dir) and os.path.isdir(self._old_dir):
+            os.replace(self._old_dir, root_dir)
+        shutil.rmtree(self._write_dir, ignore_errors=True)
+        os.makedirs(self._write_dir)
+
+    def write(self, message_data):
+        """Buffers one message and writes its partition's row group once it is full."""
+        key = partition_key(message_data)
+        buffer = self._buffers[key]
+        buffer.append(to_row(message_data))
+        self._buffered_rows += 1
+        if len(buffer) >= self.row_group_size:
+            self._flush_partition(key)
+        elif self._buffered_rows >= self.max_buffered_rows:
+            self.flush()
+
+    def _flush_partition(self, key):
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        writer = self._writers.get(key)
+        if writer is None:
+            directory = partition_path(self._write_dir, key)
+            os.makedirs(directory, exist_ok=True)
+            writer = pq.ParquetWriter(os.path.join(directory, 'part-0.parquet'), FILE_SCHEMA,
+                                      compression=self.compression)
+            self._writers[key] = writer
+        with metrics.timer('parquet.write', len(rows)):
+            writer.write_table(pa.Table.from_pylist(rows, schema=FILE_SCHEMA), row_group_size=self.row_group_size)
+        self._buffered_rows -= len(rows)
+        self.records_written += len(rows)
+
+    def flush(self):
+        """Writes every buffered row."""
+        for key in list(self._buffers):
+            self._flush_partition(key)
+
+    def close(self):
+        """Writes the remaining rows, closes every file and moves the dataset into place."""
+        if self._closed:
+            return
+        try:
+            self.flush()
+            for writer in self._writers.values():
+                writer.close()
+        except BaseException:
+            self.abort()
+            raise
+        self._closed = True
+        self._publish()
+
+    def _publish(self):
+        """Points `root_dir` at the finished dataset, then removes the previous one."""
+        version_dir = f"{self.root_dir}.{time.time_ns()}"
+        os.replace(self._write_dir, version_dir)
+        previous_dir = os.path.realpath(self.root_dir) if os.path.islink(self.root_dir) else None
+        if previous_dir is None and os.path.exists(self.root_dir):
+            # A plain directory (written before datasets were versioned) cannot be replaced by a
+            # symlink in one rename; it is moved aside once and restored by __init__ after a crash
+            os.replace(self.root_dir, self._old_dir)
+            previous_dir = self._old_dir
+        link_path = self.root_dir + '.link'
+        if os.path.lexists(link_path):
+            os.remove(link_path)
+        os.symlink(os.path.basename(version_dir), link_path, target_is_directory=True)
+        os.replace(link_path, self.root_dir)
+        if previous_dir is not None:
+            shutil.rmtree(previous_dir, ignore_errors=True)
+
+    def abort(self):
+        """Closes every file and discards the partially written dataset."""
+        self._closed = True
+        for writer in self._writers.values():
+            try:
+                writer.close()
+            except Exception:
+                pass
+        shutil.rmtree(self._write_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+
+def open_dataset(dataset_dir=STRUCTURED_DATA_PARQUET_DIR):
+    """Opens the partitioned Parquet dataset as a pyarrow Dataset."""
+    return ds.dataset(dataset_dir, format='parquet',
+                      partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'))
+
+
+def to_utc_timestamp(value):
+    """Converts a date string, datetime or Timestamp to a tz-aware UTC Timestamp (naive values are taken as UTC)."""
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+
+def build_filter(channel_ids=None, start_date=None, end_date=None):
+    """
+    Builds the dataset filter for load_structured_messages.
+    Conditions on the partition columns let pyarrow skip whole directories;
+    the exact date bounds are then checked against the Parquet row group statistics.
+    """
+    conditions = []
+    if channel_ids is not None:
+        conditions.append(ds.field('channel_id').isin([int(channel_id) for channel_id in channel_ids]))
+    if start_date is not None:
+        start = to_utc_timestamp(start_date)
+        conditions.append(ds.field('post_month') >= start.strftime('%Y-%m'))
+        conditions.append(ds.field('date') >= pa.scalar(start.to_pydatetime(), type=FILE_SCHEMA.field('date').type))
+    if end_date is not None:
+        end = to_utc_timestamp(end_date)
+        conditions.append(ds.field('post_month') <= end.strftime('%Y-%m'))
+        conditions.append(ds.field('date') < pa.scalar(end.to_pydatetime(), type=FILE_SCHEMA.field('date').type))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def load_structured_messages(columns=None, channel_ids=None, start_date=None, end_date=None,
+                             dataset_dir=STRUCTURED_DATA_PARQUET_DIR):
+    """
+    Loads structured messages from the Parquet dataset into a pandas DataFrame.
+    Only the requested `columns` are read (all of them, plus channel_id and post_month, by default),
+    only the partitions of `channel_ids` are opened, and `start_date` (inclusive) /
+    `end_date` (exclusive) restrict the rows to that time range.
+
+    Example: load_structured_messages(['channel_id', 'date', 'views', 'extracted_price'], start_date='2024-01-01')
+    """
+    table = open_dataset(dataset_dir).to_table(columns=columns,
+                                               filter=build_filter(channel_ids, start_date, end_date))
+    return table.to_pandas()
+
+
+def convert_jsonl_to_parquet(input_path=STRUCTURED_DATA_JSONL, dataset_dir=STRUCTURED_DATA_PARQUET_DIR):
+    """Builds the Parquet dataset from an existing structured JSONL file. Returns the number of messages."""
+    with open(input_path, 'r', encoding='utf-8') as f_in, ParquetDatasetWriter(dataset_dir) as writer:
+        for line in tqdm(f_in, desc="Converting to Parquet"):
+            writer.write(json.loads(line))
+    return writer.records_written
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the structured messages JSONL to a partitioned Parquet dataset.")
+    parser.add_argument('--input', default=STRUCTURED_DATA_JSONL)
+    parser.add_argument('--output', default=STRUCTURED_DATA_PARQUET_DIR)
+    args = parser.parse_args()
+
+    count = convert_jsonl_to_parquet(args.input, args.output)
+    print(f"Wrote {count} messages to {args.output}")
+    print(f"  JSONL:   {os.path.getsize(args.input) / (1024 * 1024):.1f} MB")
+    print(f"  Parquet: {directory_size(args.output) / (1024 * 1024):.1f} MB")
@@ -38,6 +38,47 @@ TELEGRAM_CHANNELS = [
     # 'https://t.me/another_channel_url'
 ]
 
+# --- Scraper Concurrency ---
+# Number of asyncio workers that resolve and scrape channels at the same time.
+# All workers share a single TelegramClient. Set to 1 for sequential scraping.
+SCRAPER_CONCURRENCY = 4
+
+# Maximum number of new messages fetched per channel in one run.
+# Each run continues after the last checkpointed message, so repeated runs page
+# through the history. Set to None to fetch everything newer than the checkpoint.
+MESSAGE_LIMIT_PER_CHANNEL = 100
+
+# --- Telegram API Rate Limiting ---
+# Shared request budget for all Telethon calls (token bucket rate and burst size).
+TELEGRAM_REQUESTS_PER_SECOND = 5.0
+TELEGRAM_BURST = 10
+# Timeouts and transient errors are retried this many times with exponential backoff (seconds).
+TELEGRAM_MAX_RETRIES = 5
+TELEGRAM_BACKOFF_BASE = 1.0
+TELEGRAM_BACKOFF_MAX = 60.0
+# FloodWaits longer than this (seconds) are not waited out; the call fails instead.
+TELEGRAM_MAX_FLOOD_WAIT = 900
+
+# --- Media Downloads ---
+# Media is downloaded in the background by this many concurrent workers.
+MEDIA_DOWNLOAD_CONCURRENCY = 4
+# Maximum number of media downloads waiting in the queue before scraping pauses.
+MEDIA_QUEUE_SIZE = 1000
+
+# --- JSONL Writer Settings ---
+# Records are buffered and written in batches of this size.
+WRITER_BATCH_SIZE = 500
+# fsync the file after every N batch flushes (1 = after every flush, 0 = never).
+WRITER_FSYNC_INTERVAL = 10
+
+# --- Columnar Store Settings ---
+# Rows per Parquet row group; each partition buffers up to this many rows before writing one.
+PARQUET_ROW_GROUP_SIZE = 50_000
+# Upper bound on rows buffered across all partitions before every partition is written out.
+PARQUET_MAX_BUFFERED_ROWS = 200_000
+# Compression codec for the Parquet files.
+PARQUET_COMPRESSION = 'zstd'
+
 # --- Directory Paths ---
 # Base directory for data storage
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,13 +87,20 @@ DATA_DIR = os.path.join(BASE_DIR, 'data')
 # Raw data directory for initial scraped messages
 RAW_DATA_DIR = os.path.join(DATA_DIR, 'raw')
 RAW_MESSAGES_JSONL = os.path.join(RAW_DATA_DIR, 'telegram_messages.jsonl')
+# Highest message_id already ingested for each channel_id (used for incremental scraping)
+SCRAPE_CHECKPOINT_JSON = os.path.join(RAW_DATA_DIR, 'scrape_checkpoint.json')
 
 # Interim data directory for temporary processing files
 INTERIM_DATA_DIR = os.path.join(DATA_DIR, 'interim')
+PREPROCESSING_CACHE_DB = os.path.join(INTERIM_DATA_DIR, 'preprocessing_cache.sqlite3')
+# Persistent MinHash/LSH index of the messages seen by the near-duplicate stage (see near_duplicates.py)
+NEAR_DUPLICATE_INDEX = os.path.join(INTERIM_DATA_DIR, 'near_duplicate_index.pkl')
 
 # Directories for downloaded media
 IMAGES_DIR = os.path.join(DATA_DIR, 'images')
 DOCUMENTS_DIR = os.path.join(DATA_DIR, 'documents')
+# Media downloads that failed, recorded so they can be retried
+MEDIA_FAILURES_JSONL = os.path.join(RAW_DATA_DIR, 'media_download_failures.jsonl')
 
 # Processed data directory
 PROCESSED_DATA_DIR = os.path.join(DATA_DIR, 'processed')
@@ -60,6 +108,14 @@ PROCESSED_MESSAGES_JSON = os.path.join(PROCESSED_DATA_DIR, 'processed_messages.j
 
 # Path for structured data output (after preprocessing)
 STRUCTURED_DATA_JSONL = os.path.join(PROCESSED_DATA_DIR, 'structured_telegram_data.jsonl')
+# The same data as a Parquet dataset partitioned by channel_id and post_month (see columnar_store.py)
+STRUCTURED_DATA_PARQUET_DIR = os.path.join(PROCESSED_DATA_DIR, 'structured_telegram_data.parquet')
+
+# SQLite store of every message, keyed on (channel_id, message_id) (see message_store.py)
+MESSAGE_STORE_DB = os.path.join(DATA_DIR, 'messages.sqlite3')
+
+# JSON run reports (and cProfile output) written when metrics are enabled (see metrics.py)
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
 
 # --- Text Preprocessing Constants ---
 # Characters to remove during text cleaning (using a raw string for regex pattern)
@@ -92,9 +148,104 @@ AMHARIC_STOPWORDS = [
     "ፐ", "ፑ", "ፒ", "ፓ", "ፔ", "ፕ"
 ]
 
+# Homophone / look-alike Ethiopic characters merged during normalization (source -> target)
+AMHARIC_HOMOPHONE_MAP = {
+    "ሀ": "ሃ", # ha
+    "ሑ": "ሁ", # hu
+    "ሒ": "ሂ", # hi
+    "ኅ": "ህ", # he
+    "ኈ": "ሆ", # ho
+    "ሠ": "ሰ", # se
+    "ሸ": "ሰ", # se (if sh is considered same as s)
+    "ዐ": "አ", # a'in
+    "ዒ": "ኢ", # i'in
+    "ዑ": "ኡ", # u'in
+    "ዓ": "አ", # a'in
+    "ፅ": "ጽ", # ts'i
+    "ጾ": "ፆ", # tso
+}
+
+# --- Preprocessing Parallelism ---
+# Number of worker processes used for Step 2 of the pipeline (1 = run in the main process).
+PREPROCESS_WORKERS = 1
+# Number of messages sent to a worker process at a time.
+PREPROCESS_CHUNK_SIZE = 1000
+# Pipelined mode (--pipelined): scraped messages waiting to be preprocessed. When the queue is full
+# the scraper waits, so memory stays bounded however far scraping runs ahead of preprocessing.
+PIPELINE_QUEUE_SIZE = 5000
+
+# --- Preprocessing Result Cache ---
+# Results of preprocess_text / extract_price / extract_phone_number, keyed by a hash of the message text.
+# The cache is cleared automatically whenever the preprocessing configuration changes.
+PREPROCESSING_CACHE_MAX_ENTRIES = 2_000_000
+
+# --- Near-Duplicate Detection ---
+# Messages are compared on character shingles (substrings of this length) of their cleaned_text.
+DEDUP_SHINGLE_SIZE = 5
+# MinHash signature length; split into DEDUP_BANDS LSH bands of DEDUP_NUM_PERM / DEDUP_BANDS values each.
+# 120 values in 20 bands of 6 find ~99.8% of pairs at 0.8 similarity and ~27% of pairs at 0.5.
+DEDUP_NUM_PERM = 120
+DEDUP_BANDS = 20
+# Estimated Jaccard similarity above which a message counts as a near-duplicate of an earlier one.
+DEDUP_THRESHOLD = 0.8
+
 # Regular expression patterns for extracting information
-PRICE_PATTERN = r"(\d{1,3}(?:,\d{3})*(?:\.\d+)?)\s*(?:ETB|ብር)?"
-PHONE_PATTERN = r"(?:\+251|0)?(?:9|7)\d{8}" # Common Ethiopian phone number patterns # <--- ADD THIS LINE
+# Common Ethiopian phone number patterns: 09XXXXXXXX, 9XXXXXXXX, 251 9XXXXXXXX and +251 9XXXXXXXX (also 7 for Safaricom)
+PHONE_PATTERN = r"(?:\+?251\s?|0)?(?:9|7)\d{8}"
+
+# Patterns used by the entity extraction engine (scripts/entity_extractor.py)
+# Amounts: Western digits (with optional thousands separators and decimals) or Ethiopic numerals (U+1369-U+137C)
+AMOUNT_PATTERN = r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|[\u1369-\u137C]+"
+# Currency markers: ETB / E.T.B / Birr in any case, and ብር when it is not the start of a longer word
+CURRENCY_PATTERN = r"(?<![A-Za-z])(?i:E\.T\.B\.?|ETB|birr)(?![A-Za-z])|ብር(?![\u1200-\u135A])"
+# A bare amount counts as a price when one of these words appears shortly before it (e.g. "ዋጋ: 1,300")
+PRICE_KEYWORDS = ["ዋጋ", "price"]
+
+# --- NER Labels ---
+# BIO tag set used for labeling and by the fine-tuned NER model (label ids follow this order).
+NER_LABELS = ["O", "B-PRODUCT", "I-PRODUCT", "B-PRICE", "I-PRICE", "B-LOC", "I-LOC"]
+
+# --- NER Inference ---
+# Fine-tuned token-classification model (saved with save_pretrained) used by ner_inference.py
+NER_MODEL_DIR = os.path.join(BASE_DIR, 'fine_tuned_amharic_ner_model_v1')
+# Structured messages with the model's entities added as `ner_entities`
+NER_ENTITIES_JSONL = os.path.join(PROCESSED_DATA_DIR, 'structured_telegram_data_ner.jsonl')
+# Messages per forward pass, and the longest tokenized message (longer ones are truncated).
+NER_BATCH_SIZE = 32
+NER_MAX_LENGTH = 512
+# Messages tokenized together and sorted by length, so each batch holds messages of similar length.
+NER_SORT_WINDOW = 2048
+# CPU threads used by the model (0 = library default).
+NER_NUM_THREADS = 0
+# ONNX export of the model (model.onnx, model.int8.onnx and the tokenizer) used by ner_onnx.py
+NER_ONNX_DIR = os.path.join(BASE_DIR, 'onnx_amharic_ner_model')
+
+# --- Vendor Scorecard ---
+# Per-vendor running totals that vendor_scorecard.py folds new messages into
+VENDOR_AGGREGATES_PARQUET = os.path.join(PROCESSED_DATA_DIR, 'vendor_aggregates.parquet')
+# Weights of the normalized metrics in the lending score (as in the scorecard notebook)
+LENDING_SCORE_WEIGHTS = {'views': 0.5, 'frequency': 0.3, 'price': 0.2}
+# Messages read from the JSONL file per aggregation round
+SCORECARD_CHUNK_SIZE = 50_000
+
+# --- Search Index ---
+# Inverted index over the cleaned_text tokens of the structured messages (see search_index.py)
+SEARCH_INDEX_DIR = os.path.join(PROCESSED_DATA_DIR, 'search_index')
+# Each update adds the new messages as a segment of at most this many messages (larger updates write several).
+SEARCH_SEGMENT_SIZE = 1_000_000
+# Once more than this many segments are smaller than SEARCH_SEGMENT_SIZE, they are merged into one,
+# so frequent small updates do not slow down queries.
+SEARCH_MAX_SEGMENTS = 8
+
+# --- Synthetic Corpus and Benchmarks ---
+# Generated posts (raw scraper format) and their labeled tokens (the format convert_to_conll.py reads), see synthetic_corpus.py
+SYNTHETIC_DATA_DIR = os.path.join(DATA_DIR, 'synthetic')
+SYNTHETIC_RAW_JSONL = os.path.join(SYNTHETIC_DATA_DIR, 'telegram_messages.jsonl')
+SYNTHETIC_LABELED_RAW = os.path.join(SYNTHETIC_DATA_DIR, 'labeled_data_raw.txt')
+# Only the first posts are also written as labeled tokens, as labeled data is much smaller than the corpus.
+SYNTHETIC_LABELED_MESSAGES = 10_000
+# Every run of benchmark_suite.py is appended here as one JSON line, so runs can be compared over time.
+BENCHMARK_RESULTS_JSONL = os.path.join(DATA_DIR, 'benchmarks', 'benchmark_results.jsonl')
 
 
 # Path for the SQLite database (used by Telethon for session)
@@ -1,58 +1,271 @@
 import os
+import re
+import sys
+import json
+import shutil
+import argparse
+from array import array
+
+import numpy as np
+
+from scripts.config import NER_LABELS
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PROCESSED_DATA_DIR = os.path.join(BASE_DIR, 'data', 'processed')
 RAW_LABELED_DATA_PATH = os.path.join(PROCESSED_DATA_DIR, 'my_labeled_data_raw.txt') # Your manually created file
 FINAL_CONLL_DATA_PATH = os.path.join(PROCESSED_DATA_DIR, 'labeled_data_conll.txt') # The final CoNLL output file
+BINARY_CORPUS_DIR = os.path.join(PROCESSED_DATA_DIR, 'labeled_data_corpus') # Optional memory-mappable corpus
+
+# Message headers copied over from messages_for_labeling.txt separate messages like a blank line
+MESSAGE_HEADER_PATTERN = re.compile(r"^-+\s*Message ID:.*-+$")
+
+# Bump whenever the binary corpus layout changes
+CORPUS_FORMAT_VERSION = 1
+TOKEN_DTYPE = np.uint32
+LABEL_DTYPE = np.uint8
+OFFSET_DTYPE = np.uint64
+
+
+def bio_error(label, previous_label, labels):
+    """Returns why `label` may not follow `previous_label` in a BIO sequence, or None if it is valid."""
+    if label not in labels:
+        return f"unknown label '{label}'"
+    if label.startswith('I-') and previous_label not in (f"B-{label[2:]}", label):
+        return f"'{label}' does not continue a {label[2:]} entity (previous tag: '{previous_label or 'none'}')"
+    return None
+
+
+class BinaryCorpusWriter:
+    """
+    Writes a labeled corpus as flat arrays that can be memory-mapped (see BinaryConllCorpus):
+    tokens.bin (uint32 token ids), labels.bin (uint8 label ids), offsets.bin (uint64 start of
+    every sentence plus the total length), vocab.txt (one interned token per line, in id order)
+    and meta.json (label names, counts and dtypes). Only the vocabulary is held in memory.
 
-def convert_to_conll_format(input_path, output_path):
+    The files are written to a temporary directory that replaces `corpus_dir` only when
+    close() succeeds; abort() discards them and leaves any previous corpus untouched.
+    """
+
+    def __init__(self, corpus_dir, labels=NER_LABELS):
+        self.corpus_dir = corpus_dir
+        self.labels = list(labels)
+        self.label_ids = {label: index for index, label in enumerate(self.labels)}
+        self.vocab = {}
+        self.num_tokens = 0
+        self.num_sentences = 0
+        self._write_dir = corpus_dir + '.tmp'
+        self._old_dir = corpus_dir + '.old'
+        # A crash between the two renames in close() leaves the previous corpus at .old
+        if not os.path.exists(corpus_dir) and os.path.isdir(self._old_dir):
+            os.replace(self._old_dir, corpus_dir)
+        shutil.rmtree(self._write_dir, ignore_errors=True)
+        os.makedirs(self._write_dir)
+        self._tokens_file = open(os.path.join(self._write_dir, 'tokens.bin'), 'wb')
+        self._labels_file = open(os.path.join(self._write_dir, 'labels.bin'), 'wb')
+        self._offsets_file = open(os.path.join(self._write_dir, 'offsets.bin'), 'wb')
+        self._offsets_file.write(np.array([0], dtype=OFFSET_DTYPE).tobytes())
+        self._sentence_tokens = array('I')
+        self._sentence_labels = array('B')
+
+    def add_token(self, token, label):
+        """Appends a token to the current sentence. Raises ValueError for a label outside the label set."""
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            raise ValueError(f"unknown label '{label}' for token '{token}'")
+        token_id = self.vocab.get(token)
+        if token_id is None:
+            token_id = self.vocab[token] = len(self.vocab)
+        self._sentence_tokens.append(token_id)
+        self._sentence_labels.append(label_id)
+
+    def end_sentence(self):
+        if not self._sentence_tokens:
+            return
+        self._tokens_file.write(self._sentence_tokens.tobytes())
+        self._labels_file.write(self._sentence_labels.tobytes())
+        self.num_tokens += len(self._sentence_tokens)
+        self.num_sentences += 1
+        self._offsets_file.write(np.array([self.num_tokens], dtype=OFFSET_DTYPE).tobytes())
+        self._sentence_tokens = array('I')
+        self._sentence_labels = array('B')
+
+    def close(self, errors=0):
+        """Writes the vocabulary and metadata, then moves the corpus into place."""
+        self.end_sentence()
+        for f in (self._tokens_file, self._labels_file, self._offsets_file):
+            f.close()
+        with open(os.path.join(self._write_dir, 'vocab.txt'), 'w', encoding='utf-8') as f:
+            for token in self.vocab: # dicts keep insertion order, which is id order
+                f.write(token + '\n')
+        meta = {
+            'version': CORPUS_FORMAT_VERSION,
+            'labels': self.labels,
+            'num_sentences': self.num_sentences,
+            'num_tokens': self.num_tokens,
+            'vocab_size': len(self.vocab),
+            'validation_errors': errors,
+            'byteorder': sys.byteorder,
+            'dtypes': {'tokens': np.dtype(TOKEN_DTYPE).name, 'labels': np.dtype(LABEL_DTYPE).name,
+                       'offsets': np.dtype(OFFSET_DTYPE).name},
+        }
+        with open(os.path.join(self._write_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        # The previous corpus is only removed once the new one is in place
+        shutil.rmtree(self._old_dir, ignore_errors=True)
+        if os.path.exists(self.corpus_dir):
+            os.replace(self.corpus_dir, self._old_dir)
+        os.replace(self._write_dir, self.corpus_dir)
+        shutil.rmtree(self._old_dir, ignore_errors=True)
+
+    def abort(self):
+        """Closes and discards the partially written corpus."""
+        for f in (self._tokens_file, self._labels_file, self._offsets_file):
+            f.close()
+        shutil.rmtree(self._write_dir, ignore_errors=True)
+
+
+class BinaryConllCorpus:
+    """
+    Read-only, memory-mapped view of a corpus written by BinaryCorpusWriter.
+    corpus[i] returns sentence i as (tokens, labels) without parsing any text;
+    token_ids(i) and label_ids(i) return the underlying numpy slices for training code.
+    """
+
+    def __init__(self, corpus_dir=BINARY_CORPUS_DIR):
+        with open(os.path.join(corpus_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != CORPUS_FORMAT_VERSION or self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"Unsupported corpus format in {corpus_dir}; convert the CoNLL file again.")
+        self.labels = self.meta['labels']
+        with open(os.path.join(corpus_dir, 'vocab.txt'), 'r', encoding='utf-8') as f:
+            self.vocab = [line.rstrip('\n') for line in f]
+        self.tokens = self._map(os.path.join(corpus_dir, 'tokens.bin'), TOKEN_DTYPE)
+        self.labels_array = self._map(os.path.join(corpus_dir, 'labels.bin'), LABEL_DTYPE)
+        self.offsets = self._map(os.path.join(corpus_dir, 'offsets.bin'), OFFSET_DTYPE)
+
+    @staticmethod
+    def _map(path, dtype):
+        # np.memmap cannot map an empty file
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _bounds(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"sentence index {index} out of range")
+        index %= len(self)
+        return int(self.offsets[index]), int(self.offsets[index + 1])
+
+    def token_ids(self, index):
+        start, end = self._bounds(index)
+        return self.tokens[start:end]
+
+    def label_ids(self, index):
+        start, end = self._bounds(index)
+        return self.labels_array[start:end]
+
+    def __getitem__(self, index):
+        start, end = self._bounds(index)
+        return ([self.vocab[token_id] for token_id in self.tokens[start:end]],
+                [self.labels[label_id] for label_id in self.labels_array[start:end]])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def convert_to_conll_format(input_path, output_path, labels=NER_LABELS, corpus_dir=None, strict=False):
     """
     Reads a raw labeled text file and converts it to a strict CoNLL format.
     Ensures each line has one token and one label, separated by a space,
     and messages are separated by a single blank line.
+
+    The file is processed in a single streaming pass, so memory does not grow with its size.
+    Every tag is validated against `labels` and the BIO scheme (an I-X tag must follow B-X or I-X);
+    problems are reported with their line number. With `corpus_dir`, a memory-mappable binary copy
+    of the corpus is written as well (see BinaryCorpusWriter); tokens with an unknown label are
+    counted as errors and stored as 'O' there. With `strict`, any validation error makes the
+    conversion fail instead of producing the output file or the corpus.
+    Returns a dict with the number of sentences, tokens, skipped lines and validation errors.
     """
     print(f"Reading raw labeled data from: {input_path}")
-    cleaned_lines = []
-    with open(input_path, 'r', encoding='utf-8') as infile:
-        for line in infile:
-            line = line.strip() # Remove leading/trailing whitespace
-            if line:
+    label_set = set(labels)
+    stats = {'sentences': 0, 'tokens': 0, 'skipped_lines': 0, 'errors': 0}
+    corpus_writer = BinaryCorpusWriter(corpus_dir, labels) if corpus_dir else None
+    tmp_path = output_path + '.tmp'
+    previous_label = None # Label of the previous token in the current sentence (None at a sentence start)
+    pending_blank = False # A message separator is owed before the next token
+
+    # Any error, including a failed strict check, leaves neither a partial output file nor a partial corpus
+    try:
+        with open(input_path, 'r', encoding='utf-8') as infile, open(tmp_path, 'w', encoding='utf-8') as outfile:
+            for line_number, line in enumerate(infile, start=1):
+                line = line.strip() # Remove leading/trailing whitespace
+                if not line or MESSAGE_HEADER_PATTERN.match(line):
+                    if previous_label is not None:
+                        stats['sentences'] += 1
+                        if corpus_writer is not None:
+                            corpus_writer.end_sentence()
+                        # Blank lines are only written between messages, never at the start or end
+                        pending_blank = True
+                    previous_label = None
+                    continue
+
                 # Basic check for token and label presence
                 parts = line.split(' ')
-                if len(parts) >= 2:
-                    token = parts[0]
-                    label = parts[-1] # Take the last part as the label
-                    cleaned_lines.append(f"{token} {label}")
-                else:
-                    print(f"Warning: Skipping malformed line (no token-label pair): '{line}'")
-            else:
-                cleaned_lines.append("") # Keep blank lines for message separation
-
-    # Ensure consistent single blank lines between messages
-    final_output_lines = []
-    prev_blank = False
-    for line in cleaned_lines:
-        if line == "":
-            if not prev_blank:
-                final_output_lines.append(line)
-            prev_blank = True
-        else:
-            final_output_lines.append(line)
-            prev_blank = False
-
-    # Ensure no leading/trailing blank lines
-    while final_output_lines and final_output_lines[0] == "":
-        final_output_lines.pop(0)
-    while final_output_lines and final_output_lines[-1] == "":
-        final_output_lines.pop()
-
-    with open(output_path, 'w', encoding='utf-8') as outfile:
-        for line in final_output_lines:
-            outfile.write(line + '\n')
+                if len(parts) < 2:
+                    print(f"Warning: Skipping malformed line {line_number} (no token-label pair): '{line}'")
+                    stats['skipped_lines'] += 1
+                    continue
+                token = parts[0]
+                label = parts[-1] # Take the last part as the label
+
+                error = bio_error(label, previous_label, label_set)
+                if error:
+                    print(f"  -> Line {line_number}: {error} (token '{token}')")
+                    stats['errors'] += 1
+
+                if pending_blank:
+                    outfile.write('\n')
+                    pending_blank = False
+                outfile.write(f"{token} {label}\n")
+                if corpus_writer is not None:
+                    corpus_writer.add_token(token, label if label in label_set else 'O')
+                stats['tokens'] += 1
+                previous_label = label
+
+        if previous_label is not None:
+            stats['sentences'] += 1
+        if strict and stats['errors']:
+            raise ValueError(f"{stats['errors']} invalid tags in {input_path}; {output_path} was not written.")
+        if corpus_writer is not None:
+            corpus_writer.close(errors=stats['errors'])
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if corpus_writer is not None:
+            corpus_writer.abort()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
     print(f"Successfully converted to CoNLL format and saved to: {output_path}")
+    print(f"  {stats['sentences']} messages, {stats['tokens']} tokens, "
+          f"{stats['skipped_lines']} malformed lines skipped, {stats['errors']} invalid tags.")
+    if corpus_dir:
+        print(f"Binary corpus written to: {corpus_dir}")
     print("Please review the generated file for correctness.")
+    return stats
 
 if __name__ == "__main__":
-    convert_to_conll_format(RAW_LABELED_DATA_PATH, FINAL_CONLL_DATA_PATH)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convert manually labeled data to strict CoNLL format.")
+    parser.add_argument('--input', default=RAW_LABELED_DATA_PATH)
+    parser.add_argument('--output', default=FINAL_CONLL_DATA_PATH)
+    parser.add_argument('--binary-corpus', nargs='?', const=BINARY_CORPUS_DIR,
+                        help=f"Also write a memory-mappable binary corpus (default directory: {BINARY_CORPUS_DIR}).")
+    parser.add_argument('--strict', action='store_true', help="Fail instead of writing output when a tag is invalid.")
+    args = parser.parse_args()
+    convert_to_conll_format(args.input, args.output, corpus_dir=args.binary_corpus, strict=args.strict)
@@ -0,0 +1,138 @@
+# scripts/entity_extractor.py
+import re
+
+from scripts.config import PHONE_PATTERN, AMOUNT_PATTERN, CURRENCY_PATTERN, PRICE_KEYWORDS
+
+# How many characters before a bare amount are searched for a price keyword
+PRICE_KEYWORD_WINDOW = 15
+
+# Characters an entity can start with (phones, amounts and currency markers from config.py).
+# Checked first at every position so the scan skips ordinary text quickly; extend it when
+# CURRENCY_PATTERN gains a marker starting with another character.
+ENTITY_START_CHARS = r"[\d+EeBbብ\u1369-\u137C]"
+
+# Ethiopic numerals: digits ፩-፱ (U+1369-U+1371) and tens ፲-፺ (U+1372-U+137A) add their value,
+# ፻ (hundred) and ፼ (ten thousand) multiply what precedes them
+ETHIOPIC_DIGIT_VALUES = {chr(0x1369 + i): i + 1 for i in range(9)}
+ETHIOPIC_DIGIT_VALUES.update({chr(0x1372 + i): (i + 1) * 10 for i in range(9)})
+ETHIOPIC_HUNDRED = '፻'
+ETHIOPIC_TEN_THOUSAND = '፼'
+
+
+def parse_ethiopic_number(numeral):
+    """Converts an Ethiopic numeral such as '፲፪፻፶' (1250) to an int."""
+    total = 0 # Everything already multiplied by ፼
+    hundreds = 0 # Everything already multiplied by ፻ since the last ፼
+    current = 0 # Digits and tens since the last multiplier
+    for char in numeral:
+        if char == ETHIOPIC_HUNDRED:
+            hundreds += (current or 1) * 100
+            current = 0
+        elif char == ETHIOPIC_TEN_THOUSAND:
+            total = (total + hundreds + current or 1) * 10_000
+            hundreds = current = 0
+        else:
+            current += ETHIOPIC_DIGIT_VALUES[char]
+    return total + hundreds + current
+
+
+def parse_amount(text):
+    """
+    Returns the value of an AMOUNT_PATTERN match: an int for whole amounts, and for amounts with
+    decimals the digits as written without thousands separators ('1,200.50' -> '1200.50'),
+    so no amount loses precision or changes its form.
+    """
+    if text[0] in ETHIOPIC_DIGIT_VALUES or text[0] in (ETHIOPIC_HUNDRED, ETHIOPIC_TEN_THOUSAND):
+        return parse_ethiopic_number(text)
+    digits = text.replace(',', '')
+    return digits if '.' in digits else int(digits)
+
+
+def normalize_phone(text):
+    """Normalizes an Ethiopian phone number to the local ten-digit form, e.g. '+251 912...' -> '0912...'."""
+    digits = re.sub(r'\D', '', text)
+    if digits.startswith('251'):
+        digits = digits[3:]
+    if len(digits) == 9:
+        digits = '0' + digits
+    return digits
+
+
+def format_amount(value):
+    """
+    Formats a parsed amount the way extracted_price has always been stored: without thousands
+    separators and with decimals as written, e.g. '5000' or '1200.50'.
+    """
+    return None if value is None else str(value)
+
+
+class EntityExtractor:
+    """
+    Finds every price, phone number and currency marker in a text with one compiled regex scan.
+
+    The alternatives are tried in order at each position: a phone number, a currency marker
+    followed by an amount ('ETB 1,200'), an amount optionally followed by a currency marker
+    ('1,200 ብር', '፲፪፻ ብር'), and finally a standalone currency marker.
+    An amount only counts as a PRICE when a currency marker is attached to it or a price keyword
+    (e.g. 'ዋጋ') appears just before it, so model numbers, dates and counts are not reported.
+
+    extract() returns dicts with 'type' (PRICE, PHONE or CURRENCY), 'start' and 'end' character
+    offsets into the original text, the matched 'text' and a normalized 'value'
+    (see parse_amount for prices, the local 09XXXXXXXX form for phones, 'ETB' for currency markers).
+    Digit runs shaped like a phone number are never read as amounts, even after a price keyword.
+    Prices also carry 'currency': 'ETB' when a marker was attached, otherwise None.
+    """
+
+    def __init__(self, phone_pattern=PHONE_PATTERN, amount_pattern=AMOUNT_PATTERN,
+                 currency_pattern=CURRENCY_PATTERN, price_keywords=PRICE_KEYWORDS):
+        phone_run = rf"(?:{phone_pattern})(?!\d)"
+        phone = rf"(?<![\d+]){phone_run}"
+        self.pattern = re.compile(
+            rf"(?={ENTITY_START_CHARS})"
+            rf"(?:(?P<phone>{phone})"
+            # A phone number is never an amount, not even right after a currency marker
+            rf"|(?P<pre_currency>{currency_pattern})\s*[:፡፦=]?\s*(?!{phone_run})(?P<pre_amount>{amount_pattern})"
+            rf"|(?!{phone_run})(?P<amount>{amount_pattern})(?:\s*(?P<post_currency>{currency_pattern}))?"
+            rf"|(?P<currency>{currency_pattern}))"
+        )
+        self.price_keywords = [keyword.lower() for keyword in price_keywords]
+
+    def has_price_keyword(self, text, start):
+        window = text[max(0, start - PRICE_KEYWORD_WINDOW):start].lower()
+        return any(keyword in window for keyword in self.price_keywords)
+
+    def extract(self, text):
+        """Returns all entities found in `text`, in order of appearance."""
+        if not isinstance(text, str) or not text:
+            return []
+        entities = []
+        for match in self.pattern.finditer(text):
+            kind = match.lastgroup
+            if kind == 'phone':
+                entities.append({'type': 'PHONE', 'start': match.start(), 'end': match.end(),
+                                 'text': match.group(), 'value': normalize_phone(match.group())})
+            elif kind == 'currency':
+                entities.append({'type': 'CURRENCY', 'start': match.start(), 'end': match.end(),
+                                 'text': match.group(), 'value': 'ETB'})
+            else:
+                amount = match.group('pre_amount') or match.group('amount')
+                anchored = match.group('pre_currency') or match.group('post_currency')
+                if not anchored and not self.has_price_keyword(text, match.start()):
+                    continue
+                entities.append({'type': 'PRICE', 'start': match.start(), 'end': match.end(),
+                                 'text': match.group(), 'value': parse_amount(amount),
+                                 'currency': 'ETB' if anchored else None})
+        return entities
+
+    def first_value(self, entities, entity_type):
+        """Returns the value of the first entity of `entity_type`, or None."""
+        return next((entity['value'] for entity in entities if entity['type'] == entity_type), None)
+
+
+if __name__ == '__main__':
+    extractor = EntityExtractor()
+    sample_text = ("ጤና ይስጥልኝ! ዋጋው 5,000 ብር ብቻ። ትልቁ ETB 7,500.50 ነው። ፲፪፻ ብር ለትንሹ። "
+                   "iPhone 14 ይደውሉ 0912345678 ወይም +251 711223344")
+    print(f"Text: {sample_text}")
+    for entity in extractor.extract(sample_text):
+        print(f"  {entity}")
@@ -0,0 +1,179 @@
+# scripts/fake_telegram_client.py
+import random
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import DocumentAttributeFilename, DocumentAttributeVideo
+
+# Vocabulary for the synthetic posts (product words, filler and a few Latin brand names)
+SAMPLE_WORDS = ["ስልክ", "ጫማ", "ልብስ", "ላፕቶፕ", "ቦርሳ", "ሰዓት", "አዲስ", "ቆንጆ", "ጥራት", "ያለው",
+                "ዋጋ", "ቅናሽ", "አድራሻ", "ቦሌ", "መገናኛ", "ፒያሳ", "ይደውሉ", "Samsung", "iPhone", "Nike"]
+
+
+class FakePeer:
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+
+
+class FakeReplies:
+    def __init__(self, replies):
+        self.replies = replies
+
+
+class FakePhoto:
+    def __init__(self, photo_id, size):
+        self.id = photo_id
+        self.size = size
+
+
+class FakeDocument:
+    def __init__(self, document_id, mime_type, attributes, size):
+        self.id = document_id
+        self.mime_type = mime_type
+        self.attributes = attributes
+        self.size = size
+
+
+class FakeFile:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeChannel:
+    def __init__(self, channel_id, title, username):
+        self.id = channel_id
+        self.title = title
+        self.username = username
+
+
+class FakeMessage:
+    """Mimics the attributes of a Telethon Message that process_message reads."""
+
+    def __init__(self, client, channel_id, message_id, date, text, views, forwards, replies,
+                 photo=None, document=None, file_name=None):
+        self._client = client
+        self.peer_id = FakePeer(channel_id)
+        self.id = message_id
+        self.date = date
+        self.message = text
+        self.views = views
+        self.forwards = forwards
+        self.replies = FakeReplies(replies) if replies else None
+        self.photo = photo
+        self.document = document
+        self.file = FakeFile(file_name) if (photo or document) else None
+
+    async def download_media(self, file=None):
+        """Simulates a download: waits for latency plus transfer time, then writes the bytes."""
+        media = self.photo or self.document
+        if media is None:
+            return None
+        await self._client.simulate_call(transfer_bytes=media.size)
+        with open(file, 'wb') as f:
+            f.write(b'\0' * media.size)
+        return file
+
+
+class FakeTelegramClient:
+    """
+    Offline stand-in for TelegramClient that serves synthetic channels.
+
+    Messages are generated deterministically from (seed, channel_id, message_id), so memory stays
+    flat regardless of channel size and runs are reproducible. Latency, bandwidth, media mix and
+    injected errors (FloodWait, timeouts, dropped connections) are configurable, which lets
+    get_channel_entities, scrape_channel_messages and process_message run unchanged without a network.
+    """
+
+    def __init__(self, num_channels=5, messages_per_channel=1000, photo_ratio=0.6, document_ratio=0.05,
+                 media_size=200 * 1024, repost_ratio=0.2, latency=0.05, bandwidth=10 * 1024 * 1024,
+                 error_rate=0.0, flood_wait_seconds=1, seed=42):
+        self.messages_per_channel = messages_per_channel
+        self.photo_ratio = photo_ratio
+        self.document_ratio = document_ratio
+        self.media_size = media_size
+        self.repost_ratio = repost_ratio
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.seed = seed
+        self._error_rng = random.Random(f"{seed}:errors")
+        self.channels = {
+            f"fake_channel_{index}": FakeChannel(1000 + index, f"Fake Channel {index}", f"fake_channel_{index}")
+            for index in range(num_channels)
+        }
+
+    @property
+    def channel_urls(self):
+        return [f"https://t.me/{username}" for username in self.channels]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return False
+
+    async def simulate_call(self, transfer_bytes=0):
+        """Sleeps like a network round trip and raises an injected error at `error_rate`."""
+        delay = self.latency + (transfer_bytes / self.bandwidth if self.bandwidth else 0)
+        await asyncio.sleep(delay)
+        if self.error_rate and self._error_rng.random() < self.error_rate:
+            kind = self._error_rng.choice(('flood_wait', 'timeout', 'connection'))
+            if kind == 'flood_wait':
+                raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+            if kind == 'timeout':
+                raise asyncio.TimeoutError("Injected timeout")
+            raise ConnectionError("Injected connection drop")
+
+    async def get_entity(self, url):
+        await self.simulate_call()
+        username = url.rstrip('/').split('/')[-1]
+        if username not in self.channels:
+            raise ValueError(f"No user has \"{username}\" as username")
+        return self.channels[username]
+
+    def make_message(self, channel_id, message_id):
+        """Builds one synthetic message; the same ids always produce the same message."""
+        rng = random.Random(f"{self.seed}:{channel_id}:{message_id}")
+        date = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(hours=message_id * 3)
+        words = rng.choices(SAMPLE_WORDS, k=rng.randint(5, 30))
+        text = f"{' '.join(words)} ዋጋ {rng.randint(1, 99) * 100:,} ብር 09{rng.randint(10000000, 99999999)}"
+
+        photo = document = file_name = None
+        roll = rng.random()
+        if roll < self.photo_ratio:
+            # Reposted media reuses an id from a small shared pool, like forwarded photos do
+            if rng.random() < self.repost_ratio:
+                photo_id = rng.randint(1, 50)
+            else:
+                photo_id = channel_id * 10_000_000 + message_id
+            photo = FakePhoto(photo_id, self.media_size)
+        elif roll < self.photo_ratio + self.document_ratio:
+            if rng.random() < 0.5:
+                file_name = f"catalog_{message_id}.pdf"
+                attributes = [DocumentAttributeFilename(file_name=file_name)]
+                mime_type = 'application/pdf'
+            else:
+                attributes = [DocumentAttributeVideo(duration=10, w=640, h=480)]
+                mime_type = 'video/mp4'
+            document = FakeDocument(channel_id * 10_000_000 + message_id, mime_type, attributes, self.media_size * 5)
+
+        return FakeMessage(self, channel_id, message_id, date, text,
+                           views=rng.randint(50, 5000), forwards=rng.randint(0, 50), replies=rng.randint(0, 5),
+                           photo=photo, document=document, file_name=file_name)
+
+    async def iter_messages(self, entity, limit=None, reverse=False, min_id=0, offset_id=0, max_id=0):
+        """Yields messages like Telethon: pages of 100, newest first unless `reverse` is set."""
+        last_id = self.messages_per_channel
+        if reverse:
+            ids = range(max(min_id, offset_id) + 1, (max_id - 1 if max_id else last_id) + 1)
+        else:
+            upper = min(offset_id - 1 if offset_id else last_id, max_id - 1 if max_id else last_id)
+            ids = range(upper, min_id, -1)
+        for count, message_id in enumerate(ids):
+            if limit is not None and count >= limit:
+                return
+            if count % 100 == 0:
+                await self.simulate_call()
+            yield self.make_message(entity.id, message_id)
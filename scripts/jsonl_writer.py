@@ -0,0 +1,94 @@
+# scripts/jsonl_writer.py
+import os
+import json
+
+from scripts.config import WRITER_BATCH_SIZE, WRITER_FSYNC_INTERVAL
+from scripts import metrics
+
+
+class BufferedJsonlWriter:
+    """
+    Writes records to a JSONL file in batches instead of one line (or one file) at a time.
+    Every `batch_size` records the buffer is written out, and every `fsync_interval`
+    flushes the file is fsynced. While `on_flush` is set, every flush is fsynced and
+    `on_flush(batch)` is called only after that, so callers that commit checkpoints from it
+    never get ahead of data that could still be lost in an OS crash.
+
+    With `atomic=True` the records go to a temporary file next to `path`, which replaces
+    `path` only when the writer is closed successfully. If an exception escapes the
+    'with' block the temporary file is deleted, so `path` is never left half-written.
+    """
+
+    def __init__(self, path, mode='a', batch_size=WRITER_BATCH_SIZE,
+                 fsync_interval=WRITER_FSYNC_INTERVAL, on_flush=None, atomic=False):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.fsync_interval = fsync_interval
+        self.on_flush = on_flush
+        self.atomic = atomic
+        self.records_written = 0
+        self._buffer = []
+        self._flush_count = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._write_path = path + '.tmp' if atomic else path
+        self._file = open(self._write_path, 'w' if atomic else mode, encoding='utf-8')
+
+    def write(self, record):
+        """Buffers one record and writes the batch once it is full."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered records to disk."""
+        if not self._buffer:
+            return
+        batch = self._buffer
+        self._buffer = []
+        with metrics.timer('writer.serialize', len(batch)):
+            data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in batch)
+        with metrics.timer('writer.write', len(batch)):
+            self._file.write(data)
+            self._file.flush()
+            self._flush_count += 1
+            if self.on_flush is not None or (self.fsync_interval and self._flush_count % self.fsync_interval == 0):
+                os.fsync(self._file.fileno())
+        self.records_written += len(batch)
+        if self.on_flush is not None:
+            with metrics.timer('writer.on_flush', len(batch)):
+                self.on_flush(batch)
+
+    def close(self):
+        """Flushes the remaining records, fsyncs and closes the file (and, if atomic, moves it into place)."""
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+            if self.fsync_interval or self.atomic:
+                os.fsync(self._file.fileno())
+        except BaseException:
+            self.abort()
+            raise
+        self._file.close()
+        if self.atomic:
+            os.replace(self._write_path, self.path)
+
+    def abort(self):
+        """Closes the file without committing it. Only an atomic writer discards what it wrote."""
+        if not self._file.closed:
+            self._file.close()
+        if self.atomic and os.path.exists(self._write_path):
+            os.remove(self._write_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and self.atomic:
+            self.abort()
+        else:
+            # Flush even when an exception is propagating, so everything scraped so far is kept
+            self.close()
+        return False
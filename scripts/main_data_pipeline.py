@@ -2,13 +2,16 @@
 import os
 import asyncio
 import json
+import argparse
+import functools
 import pandas as pd # Import pandas if you plan to use it for data structuring/analysis later
 from tqdm import tqdm # Import tqdm for progress bars
 
 # Import constants from config.py
 from scripts.config import RAW_DATA_DIR, PROCESSED_DATA_DIR, INTERIM_DATA_DIR, \
-                           RAW_MESSAGES_JSONL, STRUCTURED_DATA_JSONL, \
-                           IMAGES_DIR, DOCUMENTS_DIR, CHARS_TO_REMOVE
+                           RAW_MESSAGES_JSONL, STRUCTURED_DATA_JSONL, STRUCTURED_DATA_PARQUET_DIR, \
+                           IMAGES_DIR, DOCUMENTS_DIR, CHARS_TO_REMOVE, PREPROCESS_WORKERS, \
+                           WRITER_BATCH_SIZE, MESSAGE_STORE_DB, PIPELINE_QUEUE_SIZE, NEAR_DUPLICATE_INDEX
 
 # Import functions from telegram_scraper.py
 from scripts.telegram_scraper import ingest_telegram_data
@@ -16,6 +19,13 @@ from scripts.telegram_scraper import ingest_telegram_data
 # Import the AmharicPreprocessor class from text_preprocessor.py
 from scripts.text_preprocessor import AmharicPreprocessor
 
+from scripts.jsonl_writer import BufferedJsonlWriter
+from scripts.preprocessing_cache import PreprocessingCache
+from scripts.columnar_store import ParquetDatasetWriter
+from scripts.message_store import MessageStore
+from scripts.near_duplicates import NearDuplicateIndex
+from scripts import metrics
+
 
 def setup_directories():
     """Ensures that the necessary directories exist."""
@@ -27,52 +37,197 @@ def setup_directories():
     os.makedirs(DOCUMENTS_DIR, exist_ok=True)
     print("Directories are ready.")
 
-async def main_pipeline_execution():
+def iter_jsonl(path):
+    """Yields one parsed record per line of a JSONL file."""
+    with open(path, 'r', encoding='utf-8') as f_in:
+        for line in f_in:
+            yield json.loads(line)
+
+def preprocess_messages(messages, output_path=STRUCTURED_DATA_JSONL, workers=PREPROCESS_WORKERS,
+                        batch_size=WRITER_BATCH_SIZE, use_cache=True, parquet_dir=STRUCTURED_DATA_PARQUET_DIR,
+                        message_store_path=MESSAGE_STORE_DB, dedup=True, drop_duplicates=False, keep_existing=False,
+                        near_duplicate_index_path=NEAR_DUPLICATE_INDEX):
     """
-    Orchestrates the entire data pipeline:
-    1. Ingests raw data from Telegram.
-    2. Preprocesses the text data and extracts entities.
-    3. Saves structured data.
+    Step 2 as a streaming generator pipeline: read -> preprocess/extract -> serialize -> write.
+    `messages` is any iterable of raw message dicts; it is consumed lazily, so only a bounded
+    number of messages is in memory at any time, whatever the corpus size.
+    Output is written in batches of `batch_size` to a temporary file that replaces
+    `output_path` only once every message has been written.
+    With `keep_existing`, the structured messages already in `output_path` are copied ahead of the
+    new ones (into the Parquet dataset too), so a run over newly scraped messages only extends the output.
+    With `use_cache`, results of earlier runs are reused for messages whose text is unchanged.
+    Unless `parquet_dir` is None, the same messages are also written to a Parquet dataset
+    partitioned by channel and month (see columnar_store.py), which is swapped in the same way.
+    Unless `message_store_path` is None, each written batch of new messages is also upserted into the message store.
+    With `dedup`, every message gets a `duplicate_of` field from the persistent near-duplicate index
+    (see near_duplicates.py), saved at `near_duplicate_index_path`; with `drop_duplicates`,
+    near-duplicates are left out of the output.
+    Returns the number of messages written.
     """
-    setup_directories()
+    preprocessor = AmharicPreprocessor() # Initialize the preprocessor
+    cache = PreprocessingCache(preprocessor.config_fingerprint()) if use_cache else None
+    message_store = MessageStore(message_store_path) if message_store_path else None
 
-    # --- Step 1: Data Ingestion from Telegram Channels ---
-    print("\n--- Step 1: Data Ingestion from Telegram Channels ---")
-    await ingest_telegram_data()
+    try:
+        # Adds cleaned_text, extracted_price, extracted_phone and entities to every message,
+        # fanning chunks out to `workers` processes while preserving the input order
+        processed_messages = preprocessor.process_stream(messages, workers=workers, cache=cache)
+        near_duplicate_index = NearDuplicateIndex(near_duplicate_index_path) if dedup else None
+        if near_duplicate_index is not None:
+            processed_messages = near_duplicate_index.annotate_stream(processed_messages, drop_duplicates)
 
-    # --- Step 2: Data Preprocessing and Structuring ---
-    print("\n--- Step 2: Data Preprocessing and Structuring ---")
-    if os.path.exists(RAW_MESSAGES_JSONL):
-        preprocessor = AmharicPreprocessor() # Initialize the preprocessor
+        print(f"Writing processed data to {output_path}...")
+        parquet_writer = ParquetDatasetWriter(parquet_dir) if parquet_dir else None
+        try:
+            with BufferedJsonlWriter(output_path, mode='w', batch_size=batch_size, atomic=True) as writer:
+                if keep_existing and os.path.exists(output_path):
+                    for message_data in iter_jsonl(output_path):
+                        writer.write(message_data)
+                        if parquet_writer is not None:
+                            parquet_writer.write(message_data)
+                    writer.flush()
+                    print(f"Kept {writer.records_written} previously structured messages.")
+                # Messages kept from the previous output are in the store already; only new ones are upserted
+                writer.on_flush = message_store.upsert_messages if message_store else None
+                for message_data in tqdm(processed_messages, desc="Preprocessing messages"):
+                    writer.write(message_data)
+                    if parquet_writer is not None:
+                        parquet_writer.write(message_data)
+        except BaseException:
+            if parquet_writer is not None:
+                parquet_writer.abort()
+            raise
+        if parquet_writer is not None:
+            parquet_writer.close()
+            print(f"Wrote {parquet_writer.records_written} messages to the Parquet dataset at {parquet_dir}")
+        if near_duplicate_index is not None:
+            # Only saved after a successful run; a failed run hashes its new messages again next time
+            near_duplicate_index.save()
+            near_duplicate_index.print_stats()
+    finally:
+        if cache is not None:
+            cache.close()
+            cache.print_stats()
+        if message_store is not None:
+            message_store.close()
+    return writer.records_written
+
+def preprocess_raw_messages(input_path=RAW_MESSAGES_JSONL, output_path=STRUCTURED_DATA_JSONL,
+                            workers=PREPROCESS_WORKERS, batch_size=WRITER_BATCH_SIZE, use_cache=True,
+                            parquet_dir=STRUCTURED_DATA_PARQUET_DIR, message_store_path=MESSAGE_STORE_DB,
+                            dedup=True, drop_duplicates=False):
+    """Runs Step 2 over every message of the raw JSONL file (see preprocess_messages)."""
+    return preprocess_messages(iter_jsonl(input_path), output_path, workers, batch_size, use_cache, parquet_dir,
+                               message_store_path, dedup, drop_duplicates)
+
+async def ingest_and_preprocess_pipelined(full_refresh=False, workers=PREPROCESS_WORKERS,
+                                          batch_size=WRITER_BATCH_SIZE, use_cache=True,
+                                          parquet_dir=STRUCTURED_DATA_PARQUET_DIR, message_store_path=MESSAGE_STORE_DB,
+                                          dedup=True, drop_duplicates=False, queue_size=PIPELINE_QUEUE_SIZE):
+    """
+    Steps 1 and 2 overlapped as producer and consumer: every scraped message is put on a bounded
+    asyncio.Queue and preprocessed by preprocess_messages in an executor thread while scraping goes
+    on, so the run takes about as long as the slower of the two instead of their sum. When the
+    queue is full the scraper waits for preprocessing to catch up, which keeps memory bounded.
 
-        processed_messages = []
-        with open(RAW_MESSAGES_JSONL, 'r', encoding='utf-8') as f_in:
-            for line in tqdm(f_in, desc="Preprocessing messages"):
-                message_data = json.loads(line)
+    The raw JSONL file, checkpoint and message store are written by the scraper exactly as in
+    the sequential mode. Since only new messages are scraped, the structured output keeps its
+    existing messages (unless `full_refresh` is set) and is replaced once scraping has finished
+    and the last message is written; if preprocessing fails, scraping stops and the previous
+    structured output is left in place. Returns the number of structured messages written.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+
+    def queued_messages():
+        # Runs in the executor thread; every get() is scheduled on the event loop, which owns the queue
+        while True:
+            message_data = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+            if message_data is None:
+                return
+            if isinstance(message_data, BaseException):
+                raise message_data
+            yield message_data
 
-                # Initialize new fields
-                message_data['cleaned_text'] = None
-                message_data['extracted_price'] = None
-                message_data['extracted_phone'] = None
+    consumer = loop.run_in_executor(None, functools.partial(
+        preprocess_messages, queued_messages(), STRUCTURED_DATA_JSONL, workers, batch_size, use_cache, parquet_dir,
+        message_store_path, dedup, drop_duplicates, keep_existing=not full_refresh))
 
-                if 'text' in message_data and message_data['text']:
-                    original_text = message_data['text']
+    async def enqueue(message_data):
+        """Waits while the queue is full; raises the preprocessing error if the consumer stopped."""
+        if message_data is not None:
+            # Preprocessing adds fields in place, and the scraper's writer may not have serialized this record yet
+            message_data = dict(message_data)
+        try:
+            queue.put_nowait(message_data)
+            return
+        except asyncio.QueueFull:
+            pass
+        put = asyncio.ensure_future(queue.put(message_data))
+        await asyncio.wait({put, consumer}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            consumer.result()
+            raise RuntimeError("Preprocessing stopped before every scraped message was queued.")
 
-                    # Apply preprocessing steps
-                    message_data['cleaned_text'] = preprocessor.preprocess_text(original_text)
+    try:
+        await ingest_telegram_data(full_refresh=full_refresh, message_store_path=message_store_path,
+                                   message_sink=enqueue)
+        await enqueue(None) # End of the stream
+        return await consumer
+    except BaseException:
+        if not consumer.done():
+            # Make the consumer discard its partial output instead of waiting for more messages
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RuntimeError("Ingestion was interrupted; the structured output was not replaced."))
+            await asyncio.wait({consumer})
+        raise
 
-                    # Extract entities
-                    message_data['extracted_price'] = preprocessor.extract_price(original_text)
-                    message_data['extracted_phone'] = preprocessor.extract_phone_number(original_text)
+async def main_pipeline_execution(full_refresh=False, workers=PREPROCESS_WORKERS, batch_size=WRITER_BATCH_SIZE,
+                                  use_cache=True, write_parquet=True, use_message_store=True, dedup=True,
+                                  drop_duplicates=False, pipelined=False):
+    """
+    Orchestrates the entire data pipeline:
+    1. Ingests raw data from Telegram (incrementally, unless full_refresh is set).
+    2. Preprocesses the text data and extracts entities, using `workers` processes
+       and the preprocessing cache (unless use_cache is False).
+    3. Saves structured data, `batch_size` messages per write, as JSONL and
+       (unless write_parquet is False) as a partitioned Parquet dataset.
+    Both steps also upsert into the SQLite message store unless use_message_store is False.
+    Near-duplicate posts are marked with `duplicate_of` unless dedup is False,
+    and left out of the structured output when drop_duplicates is set.
+    With `pipelined`, Steps 1 and 2 run at the same time (see ingest_and_preprocess_pipelined).
+    """
+    setup_directories()
+    message_store_path = MESSAGE_STORE_DB if use_message_store else None
 
-                processed_messages.append(message_data)
+    if pipelined:
+        print("\n--- Steps 1 and 2: Ingestion and Preprocessing (pipelined) ---")
+        with metrics.timer('pipeline.ingest_and_preprocess') as stage:
+            processed_count = await ingest_and_preprocess_pipelined(full_refresh, workers, batch_size, use_cache,
+                                                                    STRUCTURED_DATA_PARQUET_DIR if write_parquet else None,
+                                                                    message_store_path, dedup, drop_duplicates)
+            stage.items = processed_count
+        print(f"Successfully processed and structured {processed_count} messages to {STRUCTURED_DATA_JSONL}")
+        print("\nData pipeline execution completed.")
+        return
 
-        # Save the processed data to the structured JSONL file
-        print(f"Saving processed data to {STRUCTURED_DATA_JSONL}...")
-        with open(STRUCTURED_DATA_JSONL, 'w', encoding='utf-8') as f_out:
-            for msg_data in processed_messages:
-                f_out.write(json.dumps(msg_data, ensure_ascii=False) + '\n')
-        print(f"Successfully processed and structured {len(processed_messages)} messages to {STRUCTURED_DATA_JSONL}")
+    # --- Step 1: Data Ingestion from Telegram Channels ---
+    print("\n--- Step 1: Data Ingestion from Telegram Channels ---")
+    with metrics.timer('pipeline.ingest'):
+        await ingest_telegram_data(full_refresh=full_refresh, message_store_path=message_store_path)
+
+    # --- Step 2: Data Preprocessing and Structuring ---
+    print("\n--- Step 2: Data Preprocessing and Structuring ---")
+    if os.path.exists(RAW_MESSAGES_JSONL):
+        with metrics.timer('pipeline.preprocess') as stage:
+            processed_count = preprocess_raw_messages(RAW_MESSAGES_JSONL, STRUCTURED_DATA_JSONL, workers, batch_size,
+                                                      use_cache,
+                                                      STRUCTURED_DATA_PARQUET_DIR if write_parquet else None,
+                                                      message_store_path, dedup, drop_duplicates)
+            stage.items = processed_count
+        print(f"Successfully processed and structured {processed_count} messages to {STRUCTURED_DATA_JSONL}")
     else:
         print(f"No raw messages found at {RAW_MESSAGES_JSONL}. Skipping preprocessing.")
 
@@ -80,7 +235,42 @@ async def main_pipeline_execution():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the Telegram ingestion and preprocessing pipeline.")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Re-scrape every channel from the start instead of fetching only new messages.")
+    parser.add_argument('--workers', type=int, default=PREPROCESS_WORKERS,
+                        help="Number of processes used to preprocess messages (1 = no process pool).")
+    parser.add_argument('--batch-size', type=int, default=WRITER_BATCH_SIZE,
+                        help="Number of structured messages written to disk per batch.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Recompute every message instead of reusing cached preprocessing results.")
+    parser.add_argument('--no-parquet', action='store_true',
+                        help="Only write the structured JSONL, not the partitioned Parquet dataset.")
+    parser.add_argument('--no-store', action='store_true',
+                        help="Do not upsert messages into the SQLite message store.")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Skip near-duplicate detection (no duplicate_of field).")
+    parser.add_argument('--drop-duplicates', action='store_true',
+                        help="Leave near-duplicate posts out of the structured output.")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="Preprocess messages while they are scraped instead of after scraping has finished.")
+    parser.add_argument('--metrics', nargs='?', const='', metavar='PATH',
+                        help="Record per-stage timings and counters and write them as a JSON report "
+                             "(to PATH, or a timestamped file in the metrics directory).")
+    parser.add_argument('--profile-stage', metavar='STAGE',
+                        help="With --metrics, also run cProfile during this stage (e.g. preprocess.normalize).")
+    args = parser.parse_args()
+    if args.metrics is not None:
+        metrics.METRICS.enable(profile_stage=args.profile_stage)
     try:
-        asyncio.run(main_pipeline_execution())
+        asyncio.run(main_pipeline_execution(full_refresh=args.full_refresh, workers=args.workers,
+                                            batch_size=args.batch_size, use_cache=not args.no_cache,
+                                            write_parquet=not args.no_parquet,
+                                            use_message_store=not args.no_store, dedup=not args.no_dedup,
+                                            drop_duplicates=args.drop_duplicates, pipelined=args.pipelined))
     except Exception as e:
-        print(f"An error occurred during the pipeline execution: {e}")
\ No newline at end of file
+        print(f"An error occurred during the pipeline execution: {e}")
+    finally:
+        if metrics.enabled():
+            metrics.METRICS.print_summary()
+            print(f"Metrics report written to {metrics.METRICS.write_report(args.metrics or None)}")
\ No newline at end of file
@@ -0,0 +1,165 @@
+# scripts/media_downloader.py
+import os
+import json
+import asyncio
+from datetime import datetime
+
+from scripts import metrics
+from scripts.jsonl_writer import BufferedJsonlWriter
+from scripts.config import MEDIA_DOWNLOAD_CONCURRENCY, MEDIA_QUEUE_SIZE, MEDIA_FAILURES_JSONL, \
+                           IMAGES_DIR, DOCUMENTS_DIR
+
+
+async def download_media_file(message, path):
+    """
+    Downloads a message's media to `path` through a temporary '.part' file,
+    so a file at `path` always means a complete download.
+    Returns the number of bytes written.
+    Raises ValueError if Telethon downloads nothing (e.g. the media is no longer available).
+    A failed download leaves no '.part' file behind.
+    """
+    tmp_path = path + '.part'
+    downloaded_path = None
+    try:
+        downloaded_path = await message.download_media(file=tmp_path)
+        if downloaded_path is None:
+            raise ValueError(f"no media was downloaded for message {message.id}")
+        os.replace(downloaded_path, path)
+    except BaseException:
+        for leftover in (tmp_path, downloaded_path):
+            if leftover and os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    return os.path.getsize(path)
+
+
+def repair_failed_media(records_path, failures_path=MEDIA_FAILURES_JSONL, message_store=None):
+    """
+    Reconciles records written while their media was still queued with the downloads that failed.
+    Every record whose image_path or document_path is listed in `failures_path` and does not exist
+    on disk gets that path cleared and media_download_error set; a path that a later download
+    completed is left alone. `records_path` is rewritten atomically, and the repaired records are
+    upserted into `message_store` if given. Returns the number of repaired records.
+    """
+    if not os.path.exists(failures_path) or not os.path.exists(records_path):
+        return 0
+    with open(failures_path, 'r', encoding='utf-8') as f:
+        failed_paths = {json.loads(line)['path'] for line in f if line.strip()}
+    missing_paths = {path for path in failed_paths if not os.path.exists(path)}
+    if not missing_paths:
+        return 0
+
+    repaired = []
+    with open(records_path, 'r', encoding='utf-8') as f_in, \
+         BufferedJsonlWriter(records_path, mode='w', atomic=True) as writer:
+        for line in f_in:
+            record = json.loads(line)
+            broken = False
+            for key in ('image_path', 'document_path'):
+                if record.get(key) in missing_paths:
+                    record[key] = None
+                    broken = True
+            if broken:
+                record['media_download_error'] = True
+                repaired.append(record)
+            writer.write(record)
+    if message_store is not None and repaired:
+        message_store.upsert_messages(repaired)
+    print(f"Marked {len(repaired)} records whose media download failed in {records_path}.")
+    return len(repaired)
+
+
+class MediaDownloader:
+    """
+    Downloads message media in the background so metadata scraping never waits on file transfers.
+
+    Media is stored under a path derived from its Telegram file id (see process_message),
+    so a photo or document reposted across messages or channels is queued and stored only once.
+    The queue is bounded: once `queue_size` downloads are pending, enqueue() waits,
+    which keeps memory flat when media arrives faster than it can be downloaded.
+    """
+
+    def __init__(self, concurrency=MEDIA_DOWNLOAD_CONCURRENCY, queue_size=MEDIA_QUEUE_SIZE,
+                 failures_path=MEDIA_FAILURES_JSONL, scheduler=None,
+                 images_dir=IMAGES_DIR, documents_dir=DOCUMENTS_DIR):
+        self.concurrency = max(1, concurrency)
+        # Where process_message places the media it hands to this downloader
+        self.images_dir = images_dir
+        self.documents_dir = documents_dir
+        # Optional TelegramCallScheduler for rate limiting and retrying downloads
+        self.scheduler = scheduler
+        self.failures_path = failures_path
+        self.downloaded = 0
+        self.skipped_duplicates = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._claimed_paths = set()
+        self._workers = []
+
+    def start(self):
+        """Starts the download workers. Must be called from a running event loop."""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def enqueue(self, message, path):
+        """
+        Schedules the media of `message` to be saved at `path`.
+        Paths that are queued or downloading, or already exist on disk, are skipped.
+        A path whose download failed can be claimed again by a later message.
+        """
+        if path in self._claimed_paths or os.path.exists(path):
+            self.skipped_duplicates += 1
+            return
+        self._claimed_paths.add(path)
+        await self._queue.put((message, path))
+
+    async def _worker(self):
+        while True:
+            message, path = await self._queue.get()
+            try:
+                # Includes rate limiting and retries; the bare Telethon calls are 'telegram.download_media'
+                with metrics.timer('media.download', 1):
+                    if self.scheduler is not None:
+                        channel_id = getattr(getattr(message, 'peer_id', None), 'channel_id', None)
+                        size = await self.scheduler.call('download_media', channel_id, download_media_file,
+                                                         message, path)
+                    else:
+                        size = await download_media_file(message, path)
+                self.bytes_downloaded += size
+                self.downloaded += 1
+                metrics.count('media.bytes_downloaded', size)
+            except Exception as e:
+                print(f"  -> ERROR downloading media for message {message.id} to {path}: {e}")
+                self.failed += 1
+                self._record_failure(message, path, e)
+            finally:
+                # Once the download is settled the file on disk (or its absence) is the record,
+                # so the claim is dropped and the set only holds in-flight paths
+                self._claimed_paths.discard(path)
+                self._queue.task_done()
+
+    def _record_failure(self, message, path, error):
+        """Appends a failed download to the failures file so it can be retried later."""
+        peer_id = getattr(message, 'peer_id', None)
+        failure = {
+            'channel_id': getattr(peer_id, 'channel_id', None),
+            'message_id': message.id,
+            'path': path,
+            'error': str(error),
+            'failed_at': datetime.now().isoformat(),
+        }
+        with open(self.failures_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(failure, ensure_ascii=False) + '\n')
+
+    async def close(self):
+        """Waits for every queued download to finish, then stops the workers."""
+        if self._workers:
+            print(f"\nWaiting for {self._queue.qsize()} queued media downloads to finish...")
+        await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        print(f"Media downloads: {self.downloaded} downloaded "
+              f"({self.bytes_downloaded / (1024 * 1024):.1f} MB), "
+              f"{self.skipped_duplicates} duplicates skipped, {self.failed} failed.")
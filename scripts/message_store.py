@@ -0,0 +1,232 @@
+# scripts/message_store.py
+import os
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+
+from tqdm import tqdm
+
+from scripts.config import MESSAGE_STORE_DB, RAW_MESSAGES_JSONL, STRUCTURED_DATA_JSONL, WRITER_BATCH_SIZE
+from scripts.jsonl_writer import BufferedJsonlWriter
+from scripts.entity_extractor import format_amount
+from scripts import metrics
+
+# Column name -> SQLite type. The key columns come first; every other column is optional in a record.
+COLUMNS = {
+    'channel_id': 'INTEGER NOT NULL',
+    'message_id': 'INTEGER NOT NULL',
+    'date': 'TEXT',
+    'text': 'TEXT',
+    'views': 'INTEGER',
+    'forwards': 'INTEGER',
+    'replies_count': 'INTEGER',
+    'has_photo': 'INTEGER',
+    'image_path': 'TEXT',
+    'has_document': 'INTEGER',
+    'document_name': 'TEXT',
+    'document_path': 'TEXT',
+    'media_download_error': 'INTEGER',
+    'cleaned_text': 'TEXT',
+    'extracted_price': 'REAL',
+    'extracted_phone': 'TEXT',
+    'entities': 'TEXT',
+    'duplicate_of': 'TEXT',
+}
+KEY_COLUMNS = ('channel_id', 'message_id')
+# Columns holding lists/dicts, stored as JSON text
+JSON_COLUMNS = {'entities'}
+# Columns stored as 0/1 and returned as bools
+BOOL_COLUMNS = {'has_photo', 'has_document', 'media_download_error'}
+
+INDEXES = {
+    'idx_messages_date': 'date',
+    'idx_messages_channel_date': 'channel_id, date',
+    'idx_messages_price': 'extracted_price',
+}
+
+
+def to_db_value(column, value):
+    if value is None:
+        return None
+    if column in JSON_COLUMNS:
+        return json.dumps(value, ensure_ascii=False)
+    if column == 'extracted_price':
+        return float(value)
+    if column in BOOL_COLUMNS:
+        return int(bool(value))
+    return value
+
+
+def from_db_value(column, value):
+    if value is None:
+        return None
+    if column in JSON_COLUMNS:
+        return json.loads(value)
+    if column in BOOL_COLUMNS:
+        return bool(value)
+    if column == 'extracted_price':
+        # Stored as REAL for range queries, returned in the digits-only string form of the JSONL files
+        return format_amount(int(value) if value.is_integer() else value)
+    return value
+
+
+def to_iso(value):
+    """Date filters are compared against the stored ISO strings."""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class MessageStore:
+    """
+    Local SQLite database of messages, keyed on (channel_id, message_id).
+
+    The scraper upserts raw messages and Step 2 upserts the preprocessed fields of the same rows,
+    so re-ingesting a channel or re-running the pipeline never creates duplicates. Each upsert
+    only overwrites the columns present in the incoming records: raw fields written by the
+    scraper do not clear the cleaned text and entities Step 2 added earlier, and vice versa.
+
+    Date, (channel, date) and extracted price are indexed, so lookups of one message, one vendor's
+    posts or a price range do not scan the whole corpus. upsert_messages() has the on_flush
+    signature of BufferedJsonlWriter, which makes the store easy to feed batch by batch.
+    """
+
+    def __init__(self, path=MESSAGE_STORE_DB):
+        self.path = path
+        self.upserted = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # check_same_thread=False: the pipeline may drive the store from an executor thread (one at a time)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        column_defs = ', '.join(f"{name} {sql_type}" for name, sql_type in COLUMNS.items())
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS messages ({column_defs}, "
+                          f"PRIMARY KEY ({', '.join(KEY_COLUMNS)})) WITHOUT ROWID")
+        # Databases created before a column was added to COLUMNS get it here
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(messages)")}
+        for name, sql_type in COLUMNS.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE messages ADD COLUMN {name} {sql_type}")
+        for index_name, indexed_columns in INDEXES.items():
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON messages ({indexed_columns})")
+        self.conn.commit()
+
+    def upsert_messages(self, records):
+        """
+        Inserts or updates a batch of message dicts in a single transaction.
+        Records without a channel_id or message_id are skipped.
+        """
+        by_columns = {}
+        for record in records:
+            if record.get('channel_id') is None or record.get('message_id') is None:
+                continue
+            # Group records by the columns they carry, so each group is one executemany
+            columns = tuple(name for name in COLUMNS if name in record)
+            by_columns.setdefault(columns, []).append(record)
+        with metrics.timer('store.upsert', sum(len(group) for group in by_columns.values())), self.conn:
+            for columns, group in by_columns.items():
+                updates = ', '.join(f"{name} = excluded.{name}" for name in columns if name not in KEY_COLUMNS)
+                self.conn.executemany(
+                    f"INSERT INTO messages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                    f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO "
+                    + (f"UPDATE SET {updates}" if updates else "NOTHING"),
+                    [[to_db_value(name, record[name]) for name in columns] for record in group])
+                self.upserted += len(group)
+
+    def _row_to_record(self, row):
+        return {name: from_db_value(name, value) for name, value in zip(COLUMNS, row)}
+
+    def get_message(self, channel_id, message_id):
+        """Returns one message dict, or None if it is not stored."""
+        row = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM messages WHERE channel_id = ? AND message_id = ?",
+                                (channel_id, message_id)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def _where(self, channel_id=None, start_date=None, end_date=None, min_price=None, max_price=None):
+        conditions, params = [], []
+        if channel_id is not None:
+            conditions.append("channel_id = ?")
+            params.append(channel_id)
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(to_iso(start_date))
+        if end_date is not None:
+            conditions.append("date < ?")
+            params.append(to_iso(end_date))
+        if min_price is not None:
+            conditions.append("extracted_price >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("extracted_price <= ?")
+            params.append(max_price)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def iter_messages(self, channel_id=None, start_date=None, end_date=None, min_price=None, max_price=None):
+        """
+        Yields stored messages, optionally restricted to one channel, a date range
+        (start inclusive, end exclusive) and a price range, in (channel_id, message_id) order.
+        """
+        where, params = self._where(channel_id, start_date, end_date, min_price, max_price)
+        cursor = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM messages{where} "
+                                   f"ORDER BY channel_id, message_id", params)
+        for row in cursor:
+            yield self._row_to_record(row)
+
+    def count(self, **filters):
+        where, params = self._where(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM messages{where}", params).fetchone()[0]
+
+    def export_jsonl(self, output_path, **filters):
+        """Writes the stored messages (see iter_messages for the filters) to a JSONL file. Returns the count."""
+        with BufferedJsonlWriter(output_path, mode='w', atomic=True) as writer:
+            for record in self.iter_messages(**filters):
+                writer.write(record)
+        return writer.records_written
+
+    def import_jsonl(self, input_path, batch_size=WRITER_BATCH_SIZE):
+        """Upserts every message of a JSONL file (raw or structured). Returns the number of lines read."""
+        batch = []
+        count = 0
+        with open(input_path, 'r', encoding='utf-8') as f_in:
+            for line in tqdm(f_in, desc=f"Importing {os.path.basename(input_path)}"):
+                batch.append(json.loads(line))
+                count += 1
+                if len(batch) >= batch_size:
+                    self.upsert_messages(batch)
+                    batch = []
+        self.upsert_messages(batch)
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import into or export from the SQLite message store.")
+    parser.add_argument('--db', default=MESSAGE_STORE_DB)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="Upsert messages from the raw and structured JSONL files.")
+    import_parser.add_argument('paths', nargs='*', default=[RAW_MESSAGES_JSONL, STRUCTURED_DATA_JSONL])
+    export_parser = subparsers.add_parser('export', help="Write stored messages to a JSONL file.")
+    export_parser.add_argument('output')
+    export_parser.add_argument('--channel-id', type=int)
+    export_parser.add_argument('--start-date', help="ISO date, inclusive (e.g. 2024-01-01).")
+    export_parser.add_argument('--end-date', help="ISO date, exclusive.")
+    args = parser.parse_args()
+
+    store = MessageStore(args.db)
+    try:
+        if args.command == 'import':
+            for path in args.paths:
+                if os.path.exists(path):
+                    print(f"Imported {store.import_jsonl(path)} messages from {path}")
+                else:
+                    print(f"  -> Skipping {path}: file not found.")
+            print(f"The store now holds {store.count()} messages.")
+        else:
+            count = store.export_jsonl(args.output, channel_id=args.channel_id,
+                                       start_date=args.start_date, end_date=args.end_date)
+            print(f"Exported {count} messages to {args.output}")
+    finally:
+        store.close()
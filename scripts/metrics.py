@@ -0,0 +1,240 @@
+# scripts/metrics.py
+import os
+import sys
+import json
+import time
+import cProfile
+import pstats
+import resource
+import threading
+from datetime import datetime
+
+from scripts.config import METRICS_DIR
+
+# Functions listed per profiled stage in the JSON report (the full profile is saved as a .prof file)
+PROFILE_TOP_FUNCTIONS = 25
+
+
+class _NullTimer:
+    """Returned by timer() while metrics are disabled: entering and leaving it does nothing."""
+    __slots__ = ()
+    items = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass # `timer.items = n` is ignored
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('registry', 'stage', 'items', 'start')
+
+    def __init__(self, registry, stage, items):
+        self.registry = registry
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        if self.stage == self.registry.profile_stage:
+            self.registry._start_profiler()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        if self.stage == self.registry.profile_stage:
+            self.registry._stop_profiler()
+        self.registry.add_time(self.stage, seconds, self.items)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Collects per-stage timings and counters for one run.
+
+    A stage ('preprocess.extract_entities', 'telegram.iter_messages', 'writer.serialize', ...) records
+    how often it ran, its total and longest duration, and how many items (messages, rows, bytes) it
+    handled, from which the report derives items per second. Counters are plain running totals.
+
+    While disabled (the default), timer() hands out a shared do-nothing context manager and count()
+    returns at once, so instrumented code costs one function call per site. Hot loops can check
+    `enabled` once and pick an instrumented code path only when it is set.
+
+    With `profile_stage`, every run of that stage is also recorded by cProfile; the profile is saved
+    next to the report. cProfile follows one thread, so this suits synchronous stages best.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.profile_stage = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stages = {} # stage -> [calls, seconds, max_seconds, items]
+        self.counters = {}
+        self.started_at = datetime.now()
+        self._start_time = time.perf_counter()
+        self._profiler = None
+        self._profile_depth = 0
+
+    def enable(self, profile_stage=None):
+        self.reset()
+        self.enabled = True
+        self.profile_stage = profile_stage
+
+    def disable(self):
+        self.enabled = False
+        self.profile_stage = None
+
+    def timer(self, stage, items=0):
+        """Context manager timing one run of `stage`; set `.items` inside the block if the count is known late."""
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, stage, items)
+
+    def add_time(self, stage, seconds, items=0):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+            stats[3] += items
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """The collected stages and counters as plain data (e.g. to send from a worker process)."""
+        with self._lock:
+            return {'stages': {stage: list(stats) for stage, stats in self.stages.items()},
+                    'counters': dict(self.counters)}
+
+    def merge(self, snapshot):
+        """Adds the stages and counters of another registry's snapshot to this one."""
+        if not self.enabled:
+            return
+        with self._lock:
+            for stage, (calls, seconds, max_seconds, items) in snapshot['stages'].items():
+                stats = self.stages.setdefault(stage, [0, 0.0, 0.0, 0])
+                stats[0] += calls
+                stats[1] += seconds
+                stats[2] = max(stats[2], max_seconds)
+                stats[3] += items
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def _start_profiler(self):
+        # Nested or overlapping runs of the profiled stage share one profiling session
+        if self._profile_depth == 0:
+            if self._profiler is None:
+                self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._profile_depth += 1
+
+    def _stop_profiler(self):
+        self._profile_depth -= 1
+        if self._profile_depth == 0:
+            self._profiler.disable()
+
+    def report(self):
+        """Returns the run's metrics as a JSON-serializable dict."""
+        wall_seconds = time.perf_counter() - self._start_time
+        stages = {}
+        for stage, (calls, seconds, max_seconds, items) in sorted(self.stages.items()):
+            stages[stage] = {
+                'calls': calls,
+                'seconds': round(seconds, 6),
+                'mean_ms': round(seconds / calls * 1000, 4) if calls else None,
+                'max_ms': round(max_seconds * 1000, 4),
+                'items': items,
+                'items_per_sec': round(items / seconds, 1) if items and seconds else None,
+                'share_of_wall_time': round(seconds / wall_seconds, 4) if wall_seconds else None,
+            }
+        return {
+            'started_at': self.started_at.isoformat(),
+            'wall_seconds': round(wall_seconds, 3),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'peak_rss_children_mb': round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            'python': sys.version.split()[0],
+            'argv': sys.argv,
+            'stages': stages,
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def write_report(self, path=None):
+        """
+        Writes report() as JSON to `path` (by default a timestamped file in METRICS_DIR), plus the
+        cProfile data of the profiled stage next to it. Returns the report's path.
+        """
+        if path is None:
+            path = os.path.join(METRICS_DIR, f"metrics_{self.started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        report = self.report()
+        if self._profiler is not None:
+            profile_path = os.path.splitext(path)[0] + '.prof'
+            self._profiler.dump_stats(profile_path)
+            stats = pstats.Stats(profile_path).sort_stats('cumulative')
+            top = []
+            for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+                top.append({'function': f"{os.path.basename(filename)}:{line}({function})", 'calls': calls,
+                            'own_seconds': round(own, 6), 'cumulative_seconds': round(cumulative, 6)})
+            top.sort(key=lambda entry: entry['cumulative_seconds'], reverse=True)
+            report['profile'] = {'stage': self.profile_stage, 'path': profile_path,
+                                 'top_functions': top[:PROFILE_TOP_FUNCTIONS]}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+    def print_summary(self):
+        """Prints the stages sorted by total time."""
+        report = self.report()
+        print(f"\nRun metrics ({report['wall_seconds']}s wall time, peak RSS {report['peak_rss_mb']} MB):")
+        for stage, stats in sorted(report['stages'].items(), key=lambda item: item[1]['seconds'], reverse=True):
+            rate = f", {stats['items_per_sec']}/s" if stats['items_per_sec'] else ""
+            print(f"  {stage}: {stats['seconds']:.3f}s over {stats['calls']} calls{rate}")
+        for name, value in report['counters'].items():
+            print(f"  {name}: {value}")
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# The registry every instrumented module reports to
+METRICS = MetricsRegistry()
+
+
+def enabled():
+    return METRICS.enabled
+
+
+def timer(stage, items=0):
+    return METRICS.timer(stage, items)
+
+
+def add_time(stage, seconds, items=0):
+    METRICS.add_time(stage, seconds, items)
+
+
+def count(name, value=1):
+    METRICS.count(name, value)
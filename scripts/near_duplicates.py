@@ -0,0 +1,222 @@
+# scripts/near_duplicates.py
+import os
+import pickle
+from itertools import islice
+
+import numpy as np
+
+from scripts import metrics
+from scripts.config import NEAR_DUPLICATE_INDEX, DEDUP_SHINGLE_SIZE, DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD
+
+# Bump whenever a code change alters signatures, so saved indexes are rebuilt instead of reused
+INDEX_VERSION = 1
+
+# Base of the polynomial rolling hash over a shingle's code points (arithmetic wraps at 2^64)
+SHINGLE_HASH_BASE = 1_000_003
+
+# Messages whose signatures are computed together; their shingles are hashed in one numpy operation
+SIGNATURE_BATCH_SIZE = 64
+# Messages read from the stream per annotation round
+STREAM_CHUNK_SIZE = 1000
+
+
+def message_key(message_data):
+    """Identifies a message across channels, e.g. '1001:42' (None if the ids are missing)."""
+    channel_id, message_id = message_data.get('channel_id'), message_data.get('message_id')
+    if channel_id is None or message_id is None:
+        return None
+    return f"{channel_id}:{message_id}"
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures over character shingles with numpy.
+    Shingles are hashed to 32 bits with a polynomial rolling hash of their code points, and each
+    of the `num_perm` permutations is x -> (a * x + b) mod 2^32 with a seeded odd `a` (a bijection
+    on 32-bit values). Signatures are identical across processes and runs (unlike Python's salted
+    hash()). Plain wrapping uint32 arithmetic is about 5x faster than the textbook (a * x + b) mod p
+    over 64 bits, with the same similarity estimation error on our posts.
+    """
+
+    def __init__(self, shingle_size=DEDUP_SHINGLE_SIZE, num_perm=DEDUP_NUM_PERM, seed=1):
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint32) | np.uint32(1)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint32)
+        with np.errstate(over='ignore'):
+            self.powers = SHINGLE_HASH_BASE ** np.arange(shingle_size, dtype=np.uint64)
+
+    def shingle_hashes(self, text):
+        """32-bit hashes of every `shingle_size`-character substring (the whole text if it is shorter)."""
+        codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32).astype(np.uint64)
+        if len(codes) < self.shingle_size:
+            codes = np.concatenate([codes, np.zeros(self.shingle_size - len(codes), dtype=np.uint64)])
+        windows = np.lib.stride_tricks.sliding_window_view(codes, self.shingle_size)
+        with np.errstate(over='ignore'):
+            hashes = windows @ self.powers
+        return (hashes ^ (hashes >> np.uint64(32))).astype(np.uint32)
+
+    def signatures(self, texts):
+        """Returns a (len(texts), num_perm) uint32 array with one MinHash signature per non-empty text."""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(texts), SIGNATURE_BATCH_SIZE):
+            batch = [self.shingle_hashes(text) for text in texts[start:start + SIGNATURE_BATCH_SIZE]]
+            offsets = np.cumsum([0] + [len(hashes) for hashes in batch[:-1]])
+            hashes = np.concatenate(batch)
+            permuted = np.outer(hashes, self.a)
+            permuted += self.b
+            # The minimum of each permutation over each text's rows of shingles
+            result[start:start + len(batch)] = np.minimum.reduceat(permuted, offsets, axis=0)
+        return result
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash/LSH index that assigns every message a `duplicate_of` key.
+
+    Each message's signature is split into `bands` bands; messages sharing any band land in
+    the same bucket and become candidates, and a candidate is a near-duplicate when the
+    estimated Jaccard similarity of the signatures reaches `threshold`. A message without
+    a near-duplicate becomes the canonical member of a new cluster; a near-duplicate points
+    at the canonical message of the best matching cluster. Only canonical messages are kept
+    in the buckets, so reposts of one ad do not grow the index.
+
+    Assignments are remembered per message key, so a message already in the index is
+    never hashed again: re-running the pipeline over the whole corpus only hashes new messages.
+    The index is saved to `path` with save() and picked up again by the next run, unless the
+    shingle/permutation/band settings changed, in which case it starts empty.
+    """
+
+    def __init__(self, path=NEAR_DUPLICATE_INDEX, shingle_size=DEDUP_SHINGLE_SIZE, num_perm=DEDUP_NUM_PERM,
+                 bands=DEDUP_BANDS, threshold=DEDUP_THRESHOLD):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands}).")
+        self.path = path
+        self.params = {'version': INDEX_VERSION, 'shingle_size': shingle_size, 'num_perm': num_perm, 'bands': bands}
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(shingle_size, num_perm)
+        with np.errstate(over='ignore'):
+            self.band_multipliers = np.uint64(0x9E3779B97F4A7C15) ** np.arange(1, self.rows + 1, dtype=np.uint64)
+        self.new_messages = 0
+        self.new_duplicates = 0
+        # Message key -> key of its canonical message (None for canonical messages and empty texts)
+        self.assignments = {}
+        # Signatures of canonical messages, in a buffer that grows by doubling
+        self.signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self.canonical_keys = []
+        # One dict per band: band hash -> indexes into canonical_keys / signatures
+        self.buckets = [{} for _ in range(bands)]
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            state = pickle.load(f)
+        if state['params'] != self.params:
+            print("Near-duplicate settings changed; starting a new near-duplicate index.")
+            return
+        self.assignments = state['assignments']
+        self.canonical_keys = state['canonical_keys']
+        self.signatures = state['signatures']
+        self.buckets = state['buckets']
+        print(f"Loaded near-duplicate index with {len(self.assignments)} messages "
+              f"in {len(self.canonical_keys)} clusters.")
+
+    def save(self):
+        """Writes the index to `path` (through a temporary file, so a crash never leaves it half-written)."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {'params': self.params, 'assignments': self.assignments, 'canonical_keys': self.canonical_keys,
+                 'signatures': self.signatures[:len(self.canonical_keys)], 'buckets': self.buckets}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def band_hashes(self, signatures):
+        """Returns a (n, bands) array with one 64-bit hash per band of each signature."""
+        banded = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over='ignore'):
+            return (banded * self.band_multipliers).sum(axis=2, dtype=np.uint64)
+
+    def _add_canonical(self, key, signature, band_hashes):
+        index = len(self.canonical_keys)
+        if index == len(self.signatures):
+            grown = np.empty((max(1024, 2 * index), self.signatures.shape[1]), dtype=np.uint32)
+            grown[:index] = self.signatures
+            self.signatures = grown
+        self.signatures[index] = signature
+        self.canonical_keys.append(key)
+        for bucket, band_hash in zip(self.buckets, band_hashes):
+            bucket.setdefault(band_hash, []).append(index)
+
+    def _find_duplicate(self, signature, band_hashes):
+        """Returns the key of the most similar canonical message at or above the threshold, or None."""
+        candidates = set()
+        for bucket, band_hash in zip(self.buckets, band_hashes):
+            candidates.update(bucket.get(band_hash, ()))
+        if not candidates:
+            return None
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        best = similarities.argmax()
+        return self.canonical_keys[candidates[best]] if similarities[best] >= self.threshold else None
+
+    def assign(self, messages):
+        """
+        Sets `duplicate_of` on a batch of message dicts: the key of the canonical message they
+        repeat, or None. Messages seen before keep their earlier assignment.
+        """
+        with metrics.timer('dedup.assign', len(messages)):
+            return self._assign(messages)
+
+    def _assign(self, messages):
+        new = []
+        for message_data in messages:
+            key = message_key(message_data)
+            if key in self.assignments:
+                message_data['duplicate_of'] = self.assignments[key]
+            elif key is None or not message_data.get('cleaned_text'):
+                message_data['duplicate_of'] = None
+            else:
+                new.append((key, message_data))
+        if not new:
+            return messages
+
+        signatures = self.hasher.signatures([message_data['cleaned_text'] for _, message_data in new])
+        all_band_hashes = self.band_hashes(signatures).tolist()
+        for (key, message_data), signature, band_hashes in zip(new, signatures, all_band_hashes):
+            # A message may appear twice within one batch; the first occurrence decides
+            if key in self.assignments:
+                message_data['duplicate_of'] = self.assignments[key]
+                continue
+            duplicate_of = self._find_duplicate(signature, band_hashes)
+            if duplicate_of is None:
+                self._add_canonical(key, signature, band_hashes)
+            else:
+                self.new_duplicates += 1
+            self.assignments[key] = duplicate_of
+            message_data['duplicate_of'] = duplicate_of
+            self.new_messages += 1
+        return messages
+
+    def annotate_stream(self, records, drop_duplicates=False):
+        """
+        Yields the messages of `records` in order with `duplicate_of` set,
+        leaving out near-duplicates when `drop_duplicates` is set.
+        """
+        records = iter(records)
+        for chunk in iter(lambda: list(islice(records, STREAM_CHUNK_SIZE)), []):
+            for message_data in self.assign(chunk):
+                if not (drop_duplicates and message_data['duplicate_of']):
+                    yield message_data
+
+    def print_stats(self):
+        total_duplicates = sum(1 for duplicate_of in self.assignments.values() if duplicate_of)
+        print(f"Near-duplicate index: {self.new_messages} new messages hashed, {self.new_duplicates} of them "
+              f"near-duplicates; {len(self.assignments)} messages in {len(self.canonical_keys)} clusters "
+              f"({total_duplicates} near-duplicates in total).")
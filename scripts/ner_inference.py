@@ -0,0 +1,268 @@
+# scripts/ner_inference.py
+import os
+import json
+import time
+import argparse
+from itertools import islice
+
+import numpy as np
+from transformers import AutoTokenizer
+from tqdm import tqdm
+
+from scripts.config import STRUCTURED_DATA_JSONL, NER_ENTITIES_JSONL, NER_MODEL_DIR, NER_BATCH_SIZE, \
+                           NER_MAX_LENGTH, NER_SORT_WINDOW, NER_NUM_THREADS, NER_LABELS
+from scripts.jsonl_writer import BufferedJsonlWriter
+
+# Keys of the per-message entity dict built by the vendor scorecard notebook, by model entity type
+ENTITY_GROUPS = {'PRODUCT': 'PRODUCT', 'PRICE': 'PRICE', 'CURRENCY': 'CURRENCY', 'LOC': 'LOCATION'}
+
+
+def group_entities(entities):
+    """Converts a list of entity spans to the notebook's {'PRODUCT': [...], 'PRICE': [...], ...} form."""
+    grouped = {key: [] for key in dict.fromkeys(ENTITY_GROUPS.values())}
+    for entity in entities:
+        grouped.setdefault(ENTITY_GROUPS.get(entity['type'], entity['type']), []).append(entity['text'])
+    return grouped
+
+
+class TorchNerBackend:
+    """
+    Runs a saved token-classification model with PyTorch on the CPU.
+    A backend takes padded (batch, length) int64 input_ids and attention_mask arrays and returns
+    the predicted label id of every token as a numpy array of the same shape; `id2label` maps
+    those ids to BIO labels. Other runtimes (e.g. ONNX Runtime) plug in with the same interface.
+    """
+
+    def __init__(self, model_dir=NER_MODEL_DIR, num_threads=NER_NUM_THREADS):
+        import torch
+        from transformers import AutoModelForTokenClassification
+
+        self.torch = torch
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = AutoModelForTokenClassification.from_pretrained(model_dir)
+        self.model.eval()
+        self.id2label = {int(label_id): label for label_id, label in self.model.config.id2label.items()}
+
+    def predict(self, input_ids, attention_mask):
+        # inference_mode skips autograd bookkeeping entirely (cheaper than no_grad)
+        with self.torch.inference_mode():
+            logits = self.model(input_ids=self.torch.from_numpy(input_ids),
+                                attention_mask=self.torch.from_numpy(attention_mask)).logits
+            return logits.argmax(dim=-1).numpy()
+
+
+class NerInferenceEngine:
+    """
+    Batched NER over a stream of messages.
+
+    Messages are tokenized `sort_window` at a time and sorted by token count, so every batch of
+    `batch_size` holds messages of similar length and is padded only to its own longest message
+    (instead of one message per forward pass, or every batch padded to `max_length`). Entities
+    are decoded for the whole batch at once with numpy from the predicted labels and the
+    tokenizer's offset mappings, and returned as character spans of the original text.
+
+    Decoding follows the notebook's extract_entities_from_text: a word's sub-tokens share the
+    label of its first token, B-X starts an entity, I-X continues an X entity and otherwise
+    starts a new one, and O ends it.
+    """
+
+    def __init__(self, model_dir=NER_MODEL_DIR, backend=None, batch_size=NER_BATCH_SIZE, max_length=NER_MAX_LENGTH,
+                 sort_window=NER_SORT_WINDOW, num_threads=NER_NUM_THREADS, bucketing=True):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        if not self.tokenizer.is_fast:
+            raise ValueError(f"The tokenizer in {model_dir} has no offset mappings; a fast tokenizer is required.")
+        self.backend = backend or TorchNerBackend(model_dir, num_threads)
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.sort_window = max(self.batch_size, sort_window)
+        self.bucketing = bucketing
+        self.pad_token_id = self.tokenizer.pad_token_id or 0
+
+        # Lookup tables indexed by label id: entity type (0 for O) and whether the label is a B- tag
+        num_labels = max(self.backend.id2label) + 1
+        self.entity_types = [None]
+        self.label_types = np.zeros(num_labels, dtype=np.int64)
+        self.label_begins = np.zeros(num_labels, dtype=bool)
+        for label_id, label in self.backend.id2label.items():
+            if label == 'O':
+                continue
+            prefix, entity_type = label.split('-', 1)
+            if entity_type not in self.entity_types:
+                self.entity_types.append(entity_type)
+            self.label_types[label_id] = self.entity_types.index(entity_type)
+            self.label_begins[label_id] = prefix == 'B'
+
+    def _pad(self, encoding, indexes):
+        """Pads the tokenized messages at `indexes` to their longest one."""
+        width = max(len(encoding['input_ids'][i]) for i in indexes)
+        input_ids = np.full((len(indexes), width), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(indexes), width), dtype=np.int64)
+        offsets = np.zeros((len(indexes), width, 2), dtype=np.int64)
+        # Special tokens and padding have word id -1
+        word_ids = np.full((len(indexes), width), -1, dtype=np.int64)
+        for row, i in enumerate(indexes):
+            length = len(encoding['input_ids'][i])
+            input_ids[row, :length] = encoding['input_ids'][i]
+            attention_mask[row, :length] = 1
+            offsets[row, :length] = encoding['offset_mapping'][i]
+            # word_ids() has None for special tokens, which becomes NaN in a float array
+            word_ids[row, :length] = np.nan_to_num(np.array(encoding.word_ids(i), dtype=np.float64), nan=-1)
+        return input_ids, attention_mask, offsets, word_ids
+
+    def decode(self, predictions, offsets, word_ids):
+        """
+        Turns a batch of predicted label ids into entity spans.
+        Returns (rows, entity types, start characters, end characters) as numpy arrays.
+        """
+        width = predictions.shape[1]
+        labels, word_ids = predictions.ravel(), word_ids.ravel()
+        positions = np.arange(len(labels))
+        valid = word_ids >= 0
+        previous_words = np.concatenate(([-1], word_ids[:-1]))
+        word_starts = valid & (word_ids != previous_words)
+        # Every sub-token takes the label of its word's first token
+        first_tokens = np.maximum.accumulate(np.where(word_starts | ~valid, positions, 0))
+        types = np.where(valid, self.label_types[labels[first_tokens]], 0)
+        begins_label = self.label_begins[labels[first_tokens]]
+
+        previous_types = np.concatenate(([0], types[:-1]))
+        inside = types > 0
+        starts = inside & word_starts & (begins_label | (types != previous_types))
+        continues = inside & ~starts
+        ends = inside & ~np.concatenate((continues[1:], [False]))
+
+        start_positions, end_positions = np.flatnonzero(starts), np.flatnonzero(ends)
+        flat_offsets = offsets.reshape(-1, 2)
+        return (start_positions // width, types[start_positions],
+                flat_offsets[start_positions, 0], flat_offsets[end_positions, 1])
+
+    def _predict_batches(self, encoding):
+        """Runs the model over a tokenized window; yields (indexes, offsets, word_ids, predictions) per batch."""
+        lengths = np.fromiter((len(ids) for ids in encoding['input_ids']), dtype=np.int64,
+                              count=len(encoding['input_ids']))
+        order = np.argsort(lengths, kind='stable') if self.bucketing else np.arange(len(lengths))
+        for start in range(0, len(order), self.batch_size):
+            indexes = order[start:start + self.batch_size]
+            input_ids, attention_mask, offsets, word_ids = self._pad(encoding, indexes)
+            yield indexes, offsets, word_ids, self.backend.predict(input_ids, attention_mask)
+
+    def predict_texts(self, texts):
+        """Returns a list of entity spans ({'type', 'start', 'end', 'text'} dicts) per text."""
+        encoding = self.tokenizer(texts, truncation=True, max_length=self.max_length,
+                                  return_offsets_mapping=True, return_attention_mask=False)
+        results = [[] for _ in texts]
+        for indexes, offsets, word_ids, predictions in self._predict_batches(encoding):
+            rows, types, start_chars, end_chars = self.decode(predictions, offsets, word_ids)
+            for row, entity_type, start_char, end_char in zip(rows.tolist(), types.tolist(),
+                                                              start_chars.tolist(), end_chars.tolist()):
+                text_index = indexes[row]
+                results[text_index].append({'type': self.entity_types[entity_type], 'start': start_char,
+                                            'end': end_char, 'text': texts[text_index][start_char:end_char]})
+        return results
+
+    def predict_word_labels(self, sentences):
+        """
+        Predicts one BIO label per word of already split sentences (lists of words), taken from
+        each word's first sub-token, as for evaluation against CoNLL data. Words cut off by
+        `max_length` are labeled 'O'.
+        """
+        encoding = self.tokenizer(sentences, is_split_into_words=True, truncation=True, max_length=self.max_length,
+                                  return_offsets_mapping=True, return_attention_mask=False)
+        results = [['O'] * len(words) for words in sentences]
+        for indexes, _, word_ids, predictions in self._predict_batches(encoding):
+            previous_words = np.concatenate((np.full((len(indexes), 1), -1), word_ids[:, :-1]), axis=1)
+            rows, columns = np.nonzero((word_ids >= 0) & (word_ids != previous_words))
+            for row, word, label_id in zip(rows.tolist(), word_ids[rows, columns].tolist(),
+                                           predictions[rows, columns].tolist()):
+                results[indexes[row]][word] = self.backend.id2label[label_id]
+        return results
+
+    def annotate_stream(self, records, text_field='cleaned_text', output_field='ner_entities'):
+        """Yields the records of `records` in order, each with its entity spans in `output_field`."""
+        records = iter(records)
+        for window in iter(lambda: list(islice(records, self.sort_window)), []):
+            texts = [record.get(text_field) or '' for record in window]
+            for record, entities in zip(window, self.predict_texts(texts)):
+                record[output_field] = entities
+                yield record
+
+
+def read_jsonl(path, limit=None):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in islice(f, limit):
+            yield json.loads(line)
+
+
+def run_ner_inference(input_path=STRUCTURED_DATA_JSONL, output_path=NER_ENTITIES_JSONL, engine=None,
+                      text_field='cleaned_text', limit=None):
+    """
+    Streams structured messages through the NER model and writes them, with `ner_entities` added,
+    to `output_path` (atomically). Returns (number of messages, messages per second).
+    """
+    engine = engine or NerInferenceEngine()
+    start_time = time.perf_counter()
+    with BufferedJsonlWriter(output_path, mode='w', atomic=True) as writer:
+        for record in tqdm(engine.annotate_stream(read_jsonl(input_path, limit), text_field), desc="NER inference"):
+            writer.write(record)
+    elapsed = time.perf_counter() - start_time
+    rate = writer.records_written / elapsed if elapsed else 0.0
+    print(f"Annotated {writer.records_written} messages in {elapsed:.1f}s ({rate:.1f} messages/sec).")
+    return writer.records_written, rate
+
+
+def build_tiny_model(output_dir, texts, labels=NER_LABELS, vocab_size=4000, seed=42):
+    """
+    Saves a small, randomly initialised BERT token classifier and a WordPiece tokenizer trained on
+    `texts` to `output_dir`. Its predictions are meaningless, but it has the architecture and I/O of
+    the fine-tuned model, which makes it a stand-in for benchmarking without downloading anything.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+    from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast
+
+    special_tokens = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+    wordpiece = Tokenizer(models.WordPiece(unk_token='[UNK]'))
+    wordpiece.normalizer = normalizers.BertNormalizer(lowercase=False, strip_accents=False)
+    wordpiece.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    wordpiece.train_from_iterator(texts, trainers.WordPieceTrainer(vocab_size=vocab_size, special_tokens=special_tokens))
+    wordpiece.post_processor = processors.TemplateProcessing(
+        single='[CLS] $A [SEP]', pair='[CLS] $A [SEP] $B:1 [SEP]:1',
+        special_tokens=[(token, wordpiece.token_to_id(token)) for token in ('[CLS]', '[SEP]')])
+    tokenizer = BertTokenizerFast(tokenizer_object=wordpiece, do_lower_case=False, unk_token='[UNK]',
+                                  pad_token='[PAD]', cls_token='[CLS]', sep_token='[SEP]', mask_token='[MASK]')
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=wordpiece.get_vocab_size(), hidden_size=128, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=256, max_position_embeddings=512,
+                        num_labels=len(labels), id2label=dict(enumerate(labels)),
+                        label2id={label: index for index, label in enumerate(labels)})
+    model = BertForTokenClassification(config)
+    os.makedirs(output_dir, exist_ok=True)
+    model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    print(f"Saved a tiny benchmark model ({model.num_parameters()} parameters) to {output_dir}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the fine-tuned NER model over the structured messages.")
+    parser.add_argument('--model-dir', default=NER_MODEL_DIR)
+    parser.add_argument('--input', default=STRUCTURED_DATA_JSONL)
+    parser.add_argument('--output', default=NER_ENTITIES_JSONL)
+    parser.add_argument('--text-field', default='cleaned_text', help="Message field the model reads.")
+    parser.add_argument('--batch-size', type=int, default=NER_BATCH_SIZE)
+    parser.add_argument('--max-length', type=int, default=NER_MAX_LENGTH)
+    parser.add_argument('--threads', type=int, default=NER_NUM_THREADS, help="CPU threads (0 = library default).")
+    parser.add_argument('--no-bucketing', action='store_true',
+                        help="Batch messages in file order instead of by length (for comparison).")
+    parser.add_argument('--limit', type=int, help="Only annotate the first N messages.")
+    parser.add_argument('--build-tiny-model', action='store_true',
+                        help="First save a small random model trained on the input texts to --model-dir, for benchmarking.")
+    args = parser.parse_args()
+
+    if args.build_tiny_model:
+        build_tiny_model(args.model_dir, (record.get(args.text_field) or ''
+                                          for record in read_jsonl(args.input, args.limit)))
+    ner_engine = NerInferenceEngine(args.model_dir, batch_size=args.batch_size, max_length=args.max_length,
+                                    num_threads=args.threads, bucketing=not args.no_bucketing)
+    run_ner_inference(args.input, args.output, ner_engine, args.text_field, args.limit)
@@ -0,0 +1,191 @@
+# scripts/ner_onnx.py
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+from transformers import AutoTokenizer
+
+from scripts.config import NER_MODEL_DIR, NER_ONNX_DIR, NER_NUM_THREADS, STRUCTURED_DATA_JSONL
+from scripts.convert_to_conll import FINAL_CONLL_DATA_PATH, MESSAGE_HEADER_PATTERN
+from scripts.ner_inference import NerInferenceEngine, TorchNerBackend, read_jsonl
+
+ONNX_MODEL_FILE = 'model.onnx'
+QUANTIZED_MODEL_FILE = 'model.int8.onnx'
+ONNX_OPSET = 17
+
+# Backends compared by compare_backends, by name
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+
+def export_onnx(model_dir=NER_MODEL_DIR, onnx_dir=NER_ONNX_DIR, quantize=True):
+    """
+    Exports the fine-tuned model to `onnx_dir`/model.onnx, with the batch and sequence dimensions
+    left dynamic, and copies its tokenizer and config next to it so the directory is self-contained.
+    With `quantize`, a dynamically quantized copy (int8 weights of the linear layers, activations
+    quantized at run time) is written to model.int8.onnx as well.
+    """
+    import torch
+    from transformers import AutoModelForTokenClassification
+
+    # The attention implementation must be traceable (not SDPA's fused kernel selection)
+    model = AutoModelForTokenClassification.from_pretrained(model_dir, attn_implementation='eager')
+    model.eval()
+    os.makedirs(onnx_dir, exist_ok=True)
+    AutoTokenizer.from_pretrained(model_dir).save_pretrained(onnx_dir)
+    model.config.save_pretrained(onnx_dir)
+
+    onnx_path = os.path.join(onnx_dir, ONNX_MODEL_FILE)
+    dummy = torch.ones((2, 16), dtype=torch.int64)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in ('input_ids', 'attention_mask', 'logits')}
+    with torch.inference_mode():
+        torch.onnx.export(model, (dummy, dummy), onnx_path, input_names=['input_ids', 'attention_mask'],
+                          output_names=['logits'], dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET,
+                          dynamo=False) # TorchScript exporter; the keyword needs torch>=2.5
+    print(f"Exported {model_dir} to {onnx_path} ({os.path.getsize(onnx_path) / (1024 * 1024):.1f} MB)")
+    if quantize:
+        quantize_onnx(onnx_dir)
+
+
+def quantize_onnx(onnx_dir=NER_ONNX_DIR):
+    """Writes model.int8.onnx, a copy of model.onnx with dynamically quantized int8 weights."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantized_path = os.path.join(onnx_dir, QUANTIZED_MODEL_FILE)
+    quantize_dynamic(os.path.join(onnx_dir, ONNX_MODEL_FILE), quantized_path, weight_type=QuantType.QInt8)
+    print(f"Quantized model written to {quantized_path} "
+          f"({os.path.getsize(quantized_path) / (1024 * 1024):.1f} MB)")
+
+
+class OnnxNerBackend:
+    """
+    Runs an exported model with ONNX Runtime on the CPU; drop-in replacement for
+    TorchNerBackend (same predict() and id2label), so NerInferenceEngine works unchanged.
+    """
+
+    def __init__(self, onnx_dir=NER_ONNX_DIR, quantized=False, num_threads=NER_NUM_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_path = os.path.join(onnx_dir, QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        with open(os.path.join(onnx_dir, 'config.json'), 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        self.id2label = {int(label_id): label for label_id, label in config['id2label'].items()}
+
+    def predict(self, input_ids, attention_mask):
+        logits, = self.session.run(['logits'], {'input_ids': input_ids, 'attention_mask': attention_mask})
+        return logits.argmax(axis=-1)
+
+
+def make_engine(backend='torch', model_dir=NER_MODEL_DIR, onnx_dir=NER_ONNX_DIR, num_threads=NER_NUM_THREADS,
+                **engine_options):
+    """Builds a NerInferenceEngine on one of BACKENDS ('torch', 'onnx' or 'onnx-int8')."""
+    if backend == 'torch':
+        return NerInferenceEngine(model_dir, TorchNerBackend(model_dir, num_threads), **engine_options)
+    if backend in ('onnx', 'onnx-int8'):
+        return NerInferenceEngine(onnx_dir, OnnxNerBackend(onnx_dir, backend == 'onnx-int8', num_threads),
+                                  **engine_options)
+    raise ValueError(f"Unknown NER backend '{backend}'; expected one of {', '.join(BACKENDS)}.")
+
+
+def read_conll(path=FINAL_CONLL_DATA_PATH):
+    """Returns the sentences of a CoNLL file as (words, labels) lists."""
+    sentences, words, labels = [], [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or MESSAGE_HEADER_PATTERN.match(line):
+                if words:
+                    sentences.append((words, labels))
+                words, labels = [], []
+                continue
+            parts = line.split(' ')
+            if len(parts) >= 2:
+                words.append(parts[0])
+                labels.append(parts[-1])
+    if words:
+        sentences.append((words, labels))
+    return sentences
+
+
+def evaluate_conll(engine, sentences):
+    """Returns (seqeval entity-level F1, predicted labels) of the engine on CoNLL sentences."""
+    from seqeval.metrics import f1_score
+
+    predicted = engine.predict_word_labels([words for words, _ in sentences])
+    return f1_score([labels for _, labels in sentences], predicted), predicted
+
+
+def measure_latency(engine, texts):
+    """Per-message latency in milliseconds (one message per call), as an array."""
+    latencies = np.empty(len(texts))
+    for index, text in enumerate(texts):
+        start_time = time.perf_counter()
+        engine.predict_texts([text])
+        latencies[index] = (time.perf_counter() - start_time) * 1000
+    return latencies
+
+
+def compare_backends(backends=BACKENDS, conll_path=FINAL_CONLL_DATA_PATH, input_path=STRUCTURED_DATA_JSONL,
+                     model_dir=NER_MODEL_DIR, onnx_dir=NER_ONNX_DIR, num_threads=NER_NUM_THREADS,
+                     num_messages=2000, num_latency_messages=200):
+    """
+    Measures every backend on the same data: seqeval F1 on the labeled CoNLL file, how often its
+    word labels agree with the first backend's (the parity check: an exported model should agree
+    almost everywhere), batched throughput and single-message latency on structured messages.
+    Prints a table and returns the results as a list of dicts.
+    """
+    sentences = read_conll(conll_path) if conll_path and os.path.exists(conll_path) else []
+    texts = [record.get('cleaned_text') or '' for record in read_jsonl(input_path, num_messages)]
+    results, reference = [], None
+    for name in backends:
+        engine = make_engine(name, model_dir, onnx_dir, num_threads)
+        result = {'backend': name}
+        if sentences:
+            result['f1'], predicted = evaluate_conll(engine, sentences)
+            flat = [label for labels in predicted for label in labels]
+            reference = reference or flat
+            result['agreement'] = float(np.mean(np.array(flat) == np.array(reference)))
+        engine.predict_texts(texts[:engine.batch_size]) # Warm-up
+        start_time = time.perf_counter()
+        engine.predict_texts(texts)
+        result['messages_per_sec'] = len(texts) / (time.perf_counter() - start_time)
+        latencies = measure_latency(engine, texts[:num_latency_messages])
+        result['latency_p50_ms'], result['latency_p95_ms'] = np.percentile(latencies, [50, 95]).tolist()
+        results.append(result)
+
+    print(f"{'backend':<10} {'F1':>6} {'agree':>7} {'msg/s':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for result in results:
+        f1 = f"{result['f1']:.3f}" if 'f1' in result else '-'
+        agreement = f"{result['agreement']:.2%}" if 'agreement' in result else '-'
+        print(f"{result['backend']:<10} {f1:>6} {agreement:>7} {result['messages_per_sec']:>9.1f} "
+              f"{result['latency_p50_ms']:>8.2f} {result['latency_p95_ms']:>8.2f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the NER model to ONNX and compare inference backends.")
+    parser.add_argument('--model-dir', default=NER_MODEL_DIR)
+    parser.add_argument('--onnx-dir', default=NER_ONNX_DIR)
+    parser.add_argument('--threads', type=int, default=NER_NUM_THREADS, help="CPU threads (0 = library default).")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="Export the model to ONNX (and an int8 quantized copy).")
+    export_parser.add_argument('--no-quantize', action='store_true')
+    compare_parser = subparsers.add_parser('compare', help="Compare F1, throughput and latency of the backends.")
+    compare_parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    compare_parser.add_argument('--conll', default=FINAL_CONLL_DATA_PATH)
+    compare_parser.add_argument('--input', default=STRUCTURED_DATA_JSONL)
+    compare_parser.add_argument('--num-messages', type=int, default=2000)
+    compare_parser.add_argument('--num-latency-messages', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(args.model_dir, args.onnx_dir, quantize=not args.no_quantize)
+    else:
+        compare_backends(args.backends, args.conll, args.input, args.model_dir, args.onnx_dir, args.threads,
+                         args.num_messages, args.num_latency_messages)
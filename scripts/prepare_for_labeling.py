@@ -1,5 +1,8 @@
+import re
 import json
 import os
+import random
+import argparse
 
 # Define paths (adjust if your data/processed directory is different)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -7,14 +10,24 @@ PROCESSED_DATA_DIR = os.path.join(BASE_DIR, 'data', 'processed')
 STRUCTURED_DATA_JSONL = os.path.join(PROCESSED_DATA_DIR, 'structured_telegram_data.jsonl')
 MESSAGES_FOR_LABELING_TXT = os.path.join(PROCESSED_DATA_DIR, 'messages_for_labeling.txt')
 
-def extract_messages_for_labeling(num_messages=50):
+# Matches the message headers written below, e.g. "--- Message ID: 42 ---" or "--- Message ID: 42 (channel 1001) ---"
+MESSAGE_HEADER_PATTERN = re.compile(r"Message ID:\s*(\d+)(?:\s*\(channel\s*(-?\d+)\))?")
+# Lines of a labeled ID list (--labeled-id-lists): "42" or "1001:42" (channel_id:message_id)
+ID_LINE_PATTERN = re.compile(r"^(?:(-?\d+):)?(\d+)$")
+
+def channel_sort_key(channel_id):
+    """Deterministic channel order; messages without a channel_id come last."""
+    return (channel_id is None, channel_id or 0)
+
+def extract_messages_for_labeling(num_messages=50, output_path=MESSAGES_FOR_LABELING_TXT, input_path=STRUCTURED_DATA_JSONL):
     """
     Extracts a specified number of message texts from the structured JSONL file
     and saves them to a plain text file for manual labeling.
+    Returns the number of messages extracted.
     """
     extracted_count = 0
-    with open(STRUCTURED_DATA_JSONL, 'r', encoding='utf-8') as infile, \
-         open(MESSAGES_FOR_LABELING_TXT, 'w', encoding='utf-8') as outfile:
+    with open(input_path, 'r', encoding='utf-8') as infile, \
+         open(output_path, 'w', encoding='utf-8') as outfile:
         for line in infile:
             if extracted_count >= num_messages:
                 break
@@ -28,8 +41,163 @@ def extract_messages_for_labeling(num_messages=50):
                     extracted_count += 1
             except json.JSONDecodeError:
                 print(f"Skipping invalid JSON line: {line.strip()}")
-    print(f"Extracted {extracted_count} messages to '{MESSAGES_FOR_LABELING_TXT}' for labeling.")
+    print(f"Extracted {extracted_count} messages to '{output_path}' for labeling.")
+    print("Please open this file, copy messages, and manually label them.")
+    return extracted_count
+
+def load_labeled_ids(header_paths=(), id_list_paths=()):
+    """
+    Reads the IDs of already labeled messages. Files in `header_paths` are labeling files as written
+    by this script, of which only the "--- Message ID: ... ---" header lines are read (so numbers in
+    the message text, like prices or phone numbers, are never taken for IDs). Files in `id_list_paths`
+    hold one "message_id" or "channel_id:message_id" per line.
+    Returns (set of (channel_id, message_id), set of message_ids whose channel is unknown).
+    """
+    keyed_ids, bare_ids = set(), set()
+
+    def add(channel_id, message_id):
+        if channel_id is None:
+            bare_ids.add(int(message_id))
+        else:
+            keyed_ids.add((int(channel_id), int(message_id)))
+
+    for path in header_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                match = MESSAGE_HEADER_PATTERN.search(line) if line.startswith('---') else None
+                if match:
+                    message_id, channel_id = match.groups()
+                    add(channel_id, message_id)
+    for path in id_list_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                match = ID_LINE_PATTERN.match(line.strip())
+                if match:
+                    add(*match.groups())
+    return keyed_ids, bare_ids
+
+def allocate_quotas(available, total, rng):
+    """
+    Splits `total` as evenly as possible over the channels in `available` (channel -> number of
+    sampled candidates); what a small channel cannot fill is handed to the others.
+    """
+    quotas = {channel: 0 for channel in available}
+    open_channels = sorted((channel for channel, count in available.items() if count), key=channel_sort_key)
+    remaining = total
+    while remaining > 0 and open_channels:
+        share, extra = divmod(remaining, len(open_channels))
+        # Which channels receive the leftover messages of an uneven split is decided by the seed
+        rng.shuffle(open_channels)
+        for position, channel in enumerate(open_channels):
+            added = min(share + (1 if position < extra else 0), available[channel] - quotas[channel])
+            quotas[channel] += added
+            remaining -= added
+        open_channels = sorted((channel for channel in open_channels if quotas[channel] < available[channel]),
+                               key=channel_sort_key)
+    return quotas
+
+def sample_messages_for_labeling(num_messages=50, per_channel=None, seed=42, skip_duplicates=True,
+                                 labeled_ids_paths=(), require_price=False, require_phone=False,
+                                 input_path=STRUCTURED_DATA_JSONL, labeled_id_list_paths=()):
+    """
+    Draws a reproducible, channel-balanced sample of messages for labeling in one pass over the file.
+
+    Every channel keeps a reservoir (uniform random sample) of at most `per_channel` candidates,
+    or `num_messages` if per_channel is not set, so memory depends on the sample size and the
+    number of channels but not on the size of the file. At the end `num_messages` are split as
+    evenly as possible over the channels. Near-duplicates (messages with a duplicate_of),
+    messages in the labeling files `labeled_ids_paths` or the ID lists `labeled_id_list_paths`
+    (see load_labeled_ids) and, if requested, messages without an extracted
+    price or phone number are never candidates. The same file and seed give the same sample.
+    Returns the sampled message dicts in file order.
+    """
+    rng = random.Random(seed)
+    reservoir_size = per_channel or num_messages
+    keyed_ids, bare_ids = load_labeled_ids(labeled_ids_paths, labeled_id_list_paths)
+    reservoirs = {} # channel_id -> list of (line number, message dict)
+    seen = {} # channel_id -> number of candidates seen
+    skipped = {'duplicates': 0, 'labeled': 0, 'filtered': 0}
+
+    with open(input_path, 'r', encoding='utf-8') as infile:
+        for line_number, line in enumerate(infile):
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping invalid JSON line: {line.strip()}")
+                continue
+            if not data.get('cleaned_text'):
+                continue
+            channel_id, message_id = data.get('channel_id'), data.get('message_id')
+            if skip_duplicates and data.get('duplicate_of'):
+                skipped['duplicates'] += 1
+                continue
+            if message_id in bare_ids or (channel_id, message_id) in keyed_ids:
+                skipped['labeled'] += 1
+                continue
+            if (require_price and data.get('extracted_price') is None) or \
+               (require_phone and data.get('extracted_phone') is None):
+                skipped['filtered'] += 1
+                continue
+
+            # Reservoir sampling (Algorithm R), one reservoir per channel
+            candidate = (line_number, {key: data.get(key) for key in ('channel_id', 'message_id', 'cleaned_text')})
+            seen[channel_id] = seen.get(channel_id, 0) + 1
+            reservoir = reservoirs.setdefault(channel_id, [])
+            if len(reservoir) < reservoir_size:
+                reservoir.append(candidate)
+            else:
+                slot = rng.randrange(seen[channel_id])
+                if slot < reservoir_size:
+                    reservoir[slot] = candidate
+
+    channels = sorted(reservoirs, key=channel_sort_key)
+    quotas = allocate_quotas({channel: len(reservoirs[channel]) for channel in channels}, num_messages, rng)
+    sample = []
+    for channel in channels:
+        sample.extend(rng.sample(reservoirs[channel], quotas[channel]))
+    sample.sort(key=lambda candidate: candidate[0])
+
+    print(f"Sampled {len(sample)} messages from {len(reservoirs)} channels "
+          f"(skipped {skipped['duplicates']} near-duplicates, {skipped['labeled']} already labeled, "
+          f"{skipped['filtered']} without the required price/phone).")
+    for channel in channels:
+        print(f"  Channel {channel}: {quotas[channel]} of {seen[channel]} candidates")
+    return [data for _, data in sample]
+
+def write_messages_for_labeling(messages, output_path=MESSAGES_FOR_LABELING_TXT):
+    """Writes sampled messages in the labeling format, with the channel next to each message ID."""
+    with open(output_path, 'w', encoding='utf-8') as outfile:
+        for data in messages:
+            outfile.write(f"--- Message ID: {data['message_id']} (channel {data['channel_id']}) ---\n")
+            outfile.write(f"{data['cleaned_text']}\n\n")
+    print(f"Extracted {len(messages)} messages to '{output_path}' for labeling.")
     print("Please open this file, copy messages, and manually label them.")
 
 if __name__ == "__main__":
-    extract_messages_for_labeling(num_messages=50) # You can change this number
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Select messages from the structured data for manual NER labeling.")
+    parser.add_argument('--num-messages', type=int, default=50) # You can change this number
+    parser.add_argument('--mode', choices=['head', 'stratified'], default='head',
+                        help="'head' takes the first messages of the file; 'stratified' samples every channel.")
+    parser.add_argument('--per-channel', type=int, help="Stratified mode: at most this many messages per channel.")
+    parser.add_argument('--seed', type=int, default=42, help="Stratified mode: random seed for a reproducible sample.")
+    parser.add_argument('--keep-duplicates', action='store_true',
+                        help="Stratified mode: also sample messages marked as near-duplicates.")
+    parser.add_argument('--labeled-ids', nargs='*', default=[],
+                        help="Stratified mode: labeling files (with Message ID headers) of messages that are already labeled.")
+    parser.add_argument('--labeled-id-lists', nargs='*', default=[],
+                        help="Stratified mode: files with one message_id or channel_id:message_id per line "
+                             "of messages that are already labeled.")
+    parser.add_argument('--require-price', action='store_true', help="Stratified mode: only messages with a price.")
+    parser.add_argument('--require-phone', action='store_true', help="Stratified mode: only messages with a phone.")
+    parser.add_argument('--output', default=MESSAGES_FOR_LABELING_TXT)
+    args = parser.parse_args()
+
+    if args.mode == 'head':
+        extract_messages_for_labeling(num_messages=args.num_messages, output_path=args.output)
+    else:
+        messages = sample_messages_for_labeling(args.num_messages, args.per_channel, args.seed,
+                                                not args.keep_duplicates, args.labeled_ids,
+                                                args.require_price, args.require_phone,
+                                                labeled_id_list_paths=args.labeled_id_lists)
+        write_messages_for_labeling(messages, args.output)
@@ -0,0 +1,117 @@
+# scripts/preprocessing_cache.py
+import os
+import json
+import sqlite3
+import hashlib
+
+from scripts.config import PREPROCESSING_CACHE_DB, PREPROCESSING_CACHE_MAX_ENTRIES
+
+# SQLite limits the number of parameters per statement
+SQLITE_BATCH = 500
+
+# Hits only refresh an entry's last_used stamp once it is this many runs old. Rewriting the stamp on
+# every hit would cost more than recomputing the result; eviction is LRU at this granularity instead.
+REFRESH_AFTER_RUNS = 5
+
+
+def text_key(text):
+    """Content hash used as the cache key for a message text."""
+    # surrogatepass: JSON input may contain lone surrogates, which plain UTF-8 cannot encode
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class PreprocessingCache:
+    """
+    Persistent SQLite cache of per-message preprocessing results, keyed by a hash of the text.
+
+    The cache remembers the fingerprint of the AmharicPreprocessor configuration it was filled with
+    (see AmharicPreprocessor.config_fingerprint) and empties itself when that fingerprint changes.
+    Entries are stamped with the run that last used them (refreshed every REFRESH_AFTER_RUNS runs);
+    when the cache grows beyond `max_entries`, the least recently used entries are evicted on close().
+    """
+
+    def __init__(self, fingerprint, path=PREPROCESSING_CACHE_DB, max_entries=PREPROCESSING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.invalidated = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # check_same_thread=False: the pipeline may drive the cache from an executor thread (one at a time)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                          "text_hash BLOB PRIMARY KEY, fields TEXT NOT NULL, last_used INTEGER NOT NULL"
+                          ") WITHOUT ROWID")
+
+        if self._get_meta('fingerprint') != fingerprint:
+            if self._get_meta('fingerprint') is not None:
+                print("Preprocessing configuration changed; clearing the preprocessing cache.")
+                self.invalidated = True
+            self.conn.execute("DELETE FROM results")
+            self._set_meta('fingerprint', fingerprint)
+        self.run_id = int(self._get_meta('run_id') or 0) + 1
+        self._set_meta('run_id', str(self.run_id))
+        self.conn.commit()
+
+    def _get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def lookup(self, texts):
+        """Returns the cached fields for each text, or None where the text is not cached."""
+        keys = [text_key(text) for text in texts]
+        found = {}
+        for start in range(0, len(keys), SQLITE_BATCH):
+            batch = keys[start:start + SQLITE_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.conn.execute(f"SELECT text_hash, fields, last_used FROM results "
+                                     f"WHERE text_hash IN ({placeholders})", batch).fetchall()
+            stale_keys = []
+            for key, fields, last_used in rows:
+                found[key] = fields
+                if last_used <= self.run_id - REFRESH_AFTER_RUNS:
+                    stale_keys.append(key)
+            if stale_keys:
+                self.conn.execute(f"UPDATE results SET last_used = ? WHERE text_hash IN "
+                                  f"({','.join('?' * len(stale_keys))})", [self.run_id, *stale_keys])
+        results = [json.loads(found[key]) if key in found else None for key in keys]
+        hit_count = sum(1 for fields in results if fields is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def store(self, texts, fields_list):
+        """Caches freshly computed fields for the given texts (committed on close)."""
+        if texts:
+            self.conn.executemany("INSERT OR REPLACE INTO results (text_hash, fields, last_used) VALUES (?, ?, ?)",
+                                  [(text_key(text), json.dumps(fields, ensure_ascii=False), self.run_id)
+                                   for text, fields in zip(texts, fields_list)])
+
+    def evict(self):
+        """Removes the least recently used entries beyond max_entries."""
+        count = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute("DELETE FROM results WHERE text_hash IN "
+                              "(SELECT text_hash FROM results ORDER BY last_used LIMIT ?)", (excess,))
+            self.evicted += excess
+        self.conn.commit()
+
+    def close(self):
+        self.evict()
+        self.conn.close()
+
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100 * self.hits / lookups if lookups else 0.0
+        print(f"Preprocessing cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+              f"{self.evicted} evicted{', invalidated by config change' if self.invalidated else ''}.")
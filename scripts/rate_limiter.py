@@ -0,0 +1,208 @@
+# scripts/rate_limiter.py
+import time
+import random
+import socket
+import asyncio
+from collections import Counter, defaultdict
+
+from telethon.errors import FloodError, ServerError, TimedOutError, RpcCallFailError
+
+from scripts import metrics
+from scripts.config import TELEGRAM_REQUESTS_PER_SECOND, TELEGRAM_BURST, TELEGRAM_MAX_RETRIES, \
+                           TELEGRAM_BACKOFF_BASE, TELEGRAM_BACKOFF_MAX, TELEGRAM_MAX_FLOOD_WAIT
+
+# Telethon fetches history in requests of up to 100 messages
+MESSAGES_PER_REQUEST = 100
+
+
+class TokenBucket:
+    """
+    Async token bucket that allows `rate` requests per second with bursts of up to `capacity`.
+    The rate adapts: it is halved whenever Telegram asks us to wait (FloodWait)
+    and creeps back up towards `max_rate` with every successful request.
+    """
+
+    def __init__(self, rate=TELEGRAM_REQUESTS_PER_SECOND, capacity=TELEGRAM_BURST, min_rate=0.2):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    async def acquire(self):
+        """Waits until a request may be sent, honouring any active pause."""
+        # The lock makes waiters queue up in order instead of all waking at once
+        async with self._lock:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds`, e.g. for the duration of a FloodWait."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def slow_down(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        # Additive increase: regain the full rate over roughly 20 successful requests
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def classify_error(error):
+    """
+    Returns 'flood_wait', 'timeout' or 'transient' for retriable errors, and None otherwise.
+    Only network and server failures are transient: local OSErrors such as a full disk,
+    a missing file or a permission error would fail again on retry and are returned as None.
+    """
+    if isinstance(error, FloodError) and hasattr(error, 'seconds'):
+        return 'flood_wait'
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, TimedOutError)):
+        return 'timeout'
+    if isinstance(error, (ServerError, RpcCallFailError, ConnectionError, socket.gaierror, socket.herror)):
+        return 'transient'
+    return None
+
+
+class TelegramCallScheduler:
+    """
+    Shared rate-limiting and retry layer for Telethon calls (get_entity, iter_messages, download_media).
+
+    Every call takes a token from one shared TokenBucket. FloodWait errors pause the whole
+    bucket for the requested time (so all workers back off together) and lower the rate.
+    Timeouts and transient network/server errors are retried with exponential backoff and jitter.
+    Per-channel counters are kept in `stats`.
+    """
+
+    def __init__(self, bucket=None, max_retries=TELEGRAM_MAX_RETRIES, backoff_base=TELEGRAM_BACKOFF_BASE,
+                 backoff_max=TELEGRAM_BACKOFF_MAX, max_flood_wait=TELEGRAM_MAX_FLOOD_WAIT):
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_flood_wait = max_flood_wait
+        self.stats = defaultdict(Counter)
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff: a random delay up to base * 2^attempt, capped."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def handle_error(self, kind, channel, error, attempt):
+        """
+        Records a failed call and sleeps as required before the next attempt.
+        Re-raises the error if it is not retriable or the retry budget is used up.
+        """
+        counters = self.stats[channel]
+        category = classify_error(error)
+        metrics.count(f'telegram.{category or "fatal"}_errors')
+        if category is None:
+            counters[f'{kind}_errors'] += 1
+            raise error
+        if category == 'flood_wait':
+            counters['flood_waits'] += 1
+            counters['flood_wait_seconds'] += error.seconds
+            if error.seconds > self.max_flood_wait:
+                counters[f'{kind}_errors'] += 1
+                raise error
+            print(f"  -> FloodWait of {error.seconds}s on {kind} for {channel}. Pausing all requests.")
+            self.bucket.slow_down()
+            self.bucket.pause(error.seconds + 1)
+            # Flood waits are dictated by Telegram, so they do not use up the retry budget
+            return
+        counters['timeouts' if category == 'timeout' else 'transient_errors'] += 1
+        if attempt > self.max_retries:
+            counters[f'{kind}_errors'] += 1
+            raise error
+        counters['retries'] += 1
+        await asyncio.sleep(self.backoff_delay(attempt - 1))
+
+    async def call(self, kind, channel, func, *args, **kwargs):
+        """Awaits `func(*args, **kwargs)` under the rate limit, retrying retriable errors."""
+        attempt = 0
+        while True:
+            with metrics.timer('telegram.rate_limit_wait'):
+                await self.bucket.acquire()
+            self.stats[channel][f'{kind}_calls'] += 1
+            try:
+                with metrics.timer(f'telegram.{kind}', 1):
+                    result = await func(*args, **kwargs)
+            except Exception as e:
+                if classify_error(e) != 'flood_wait':
+                    attempt += 1
+                await self.handle_error(kind, channel, e, attempt)
+                continue
+            self.bucket.speed_up()
+            return result
+
+    async def iter_messages(self, client, entity, channel, **kwargs):
+        """
+        Rate-limited client.iter_messages() that survives FloodWait and transient errors.
+        After an error the iteration restarts right after the last message it yielded,
+        so no messages are skipped or repeated.
+        """
+        limit = kwargs.pop('limit', None)
+        reverse = kwargs.get('reverse', False)
+        yielded = 0
+        attempt = 0
+        timed = metrics.enabled()
+        while limit is None or yielded < limit:
+            remaining = None if limit is None else limit - yielded
+            since_token = 0
+            with metrics.timer('telegram.rate_limit_wait'):
+                await self.bucket.acquire()
+            self.stats[channel]['iter_messages_calls'] += 1
+            try:
+                fetch_start = time.perf_counter()
+                async for message in client.iter_messages(entity, limit=remaining, **kwargs):
+                    if timed:
+                        # Time spent waiting on Telethon for this message (a page fetch every 100 messages)
+                        metrics.add_time('telegram.iter_messages', time.perf_counter() - fetch_start, 1)
+                    # One token per history request Telethon makes under the hood
+                    since_token += 1
+                    if since_token >= MESSAGES_PER_REQUEST:
+                        with metrics.timer('telegram.rate_limit_wait'):
+                            await self.bucket.acquire()
+                        self.stats[channel]['iter_messages_calls'] += 1
+                        since_token = 0
+                    yielded += 1
+                    attempt = 0
+                    self.stats[channel]['messages'] += 1
+                    # Resume point: newer than this message when reverse, older otherwise
+                    kwargs['offset_id'] = message.id
+                    if reverse:
+                        kwargs['min_id'] = max(kwargs.get('min_id', 0), message.id)
+                    yield message
+                    fetch_start = time.perf_counter()
+            except Exception as e:
+                if classify_error(e) != 'flood_wait':
+                    attempt += 1
+                await self.handle_error('iter_messages', channel, e, attempt)
+                continue
+            self.bucket.speed_up()
+            return
+
+    def print_summary(self):
+        """Prints the per-channel call, retry and FloodWait counters."""
+        if not self.stats:
+            return
+        print("\nTelegram API call statistics:")
+        for channel, counters in self.stats.items():
+            summary = ", ".join(f"{name}={value}" for name, value in sorted(counters.items()))
+            print(f"  {channel}: {summary}")
+        print(f"  Current request rate: {self.bucket.rate:.2f}/s (max {self.bucket.max_rate:.2f}/s)")
@@ -0,0 +1,59 @@
+# scripts/scrape_checkpoint.py
+import os
+import json
+
+from scripts.config import SCRAPE_CHECKPOINT_JSON
+
+
+class ScrapeCheckpoint:
+    """
+    Stores the highest message_id ingested for each channel_id (its high-water mark).
+    The scraper uses it to fetch only messages newer than the previous run.
+    """
+
+    def __init__(self, path=SCRAPE_CHECKPOINT_JSON):
+        self.path = path
+        self.high_water_marks = {}
+        self.load()
+
+    def load(self):
+        """Loads the high-water marks from disk, if a checkpoint file exists."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"  -> WARNING: Could not read checkpoint {self.path}: {e}. Starting from scratch.")
+            return
+        # JSON object keys are always strings, channel ids are ints
+        self.high_water_marks = {int(channel_id): int(message_id) for channel_id, message_id in stored.items()}
+
+    def get(self, channel_id):
+        """Returns the last ingested message_id for a channel, or 0 if it was never scraped."""
+        return self.high_water_marks.get(channel_id, 0)
+
+    def update(self, channel_id, message_id):
+        """Raises the high-water mark of a channel. Call save() to persist it."""
+        if channel_id is None or message_id is None:
+            return
+        if message_id > self.high_water_marks.get(channel_id, 0):
+            self.high_water_marks[channel_id] = message_id
+
+    def save(self):
+        """Writes the checkpoint atomically so a crash never leaves a truncated file behind."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(k): v for k, v in self.high_water_marks.items()}, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """Forgets every high-water mark and removes the checkpoint file."""
+        self.high_water_marks = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,490 @@
+# scripts/search_index.py
+import os
+import json
+import time
+import shutil
+import argparse
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from scripts.config import STRUCTURED_DATA_JSONL, SEARCH_INDEX_DIR, SEARCH_SEGMENT_SIZE, SEARCH_MAX_SEGMENTS, \
+                           MESSAGE_STORE_DB
+from scripts.text_preprocessor import AmharicPreprocessor
+
+# Bump whenever the on-disk format changes, so old indexes are rebuilt instead of misread
+INDEX_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+SEGMENT_PREFIX = 'segment_'
+
+# One row per indexed message. `date` is in seconds since the epoch (MISSING_DATE when unknown)
+# and `price` is the extracted_price (NaN when there is none).
+DOC_DTYPE = np.dtype([('channel_id', '<i8'), ('message_id', '<i8'), ('date', '<i8'), ('price', '<f8')])
+# One row per term in UTF-8 byte order, plus a closing row holding the end offsets of the last term
+TERM_DTYPE = np.dtype([('term_offset', '<u8'), ('postings_offset', '<u8'), ('doc_freq', '<u4')])
+MISSING_DATE = np.iinfo(np.int64).min
+
+# Query words ending in this character match every term starting with the rest of the word (e.g. 'iphone*')
+PREFIX_MARKER = '*'
+
+
+def varint_lengths(values):
+    """Number of bytes each value takes as a varint (7 bits per byte)."""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= (np.uint64(1) << np.uint64(shift))
+    return lengths
+
+
+def encode_varints(values):
+    """
+    LEB128-encodes non-negative integers: 7 bits per byte, lowest bits first, with the high bit
+    set on every byte but a value's last. Small numbers (like the gaps between the ids of a
+    common term's documents) take one byte. Returns (encoded bytes as uint8 array, byte length per value).
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = varint_lengths(values)
+    owner = np.repeat(np.arange(len(values)), lengths)
+    position = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    encoded = (values[owner] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7F)
+    encoded |= np.where(position < lengths[owner] - 1, np.uint64(0x80), np.uint64(0))
+    return encoded.astype(np.uint8), lengths
+
+
+def decode_varints(data):
+    """Decodes a uint8 array of back-to-back varints (see encode_varints) into uint64 values."""
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    last = (data & 0x80) == 0
+    starts = np.concatenate([[0], np.flatnonzero(last)[:-1] + 1])
+    position = np.arange(len(data)) - np.repeat(starts, np.diff(np.append(starts, len(data))))
+    parts = (data & 0x7F).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return np.add.reduceat(parts, starts)
+
+
+def to_epoch_seconds(value):
+    """Seconds since the epoch of an ISO date string or datetime (naive ones are taken as UTC), None stays None."""
+    if value is None:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return int(timestamp.timestamp())
+
+
+def _date_seconds(date):
+    # datetime.fromisoformat is several times faster than pd.Timestamp, which matters once per indexed message
+    date = datetime.fromisoformat(date)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return int(date.timestamp())
+
+
+def _map_bytes(path):
+    # np.memmap cannot map an empty file
+    return np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+
+def write_segment(path, docs, terms, term_ids, doc_ids):
+    """
+    Writes one immutable index segment to the directory `path`:
+    - docs.npy: the DOC_DTYPE rows, a message's position being its document number in the segment;
+    - lexicon.bin: the distinct terms in UTF-8 byte order, back to back;
+    - terms.npy: per term, where it starts in lexicon.bin and where its postings start in postings.bin;
+    - postings.bin: per term, the ascending numbers of the documents containing it, as the first number
+      followed by the gaps between consecutive numbers, varint-encoded.
+    `terms` lists the distinct terms and (term_ids[i], doc_ids[i]) the distinct (term, document) pairs.
+    The segment is written next to `path` and renamed into place, so it is never seen half-written.
+    """
+    encoded_terms = [term.encode('utf-8') for term in terms]
+    order = sorted(range(len(terms)), key=encoded_terms.__getitem__)
+    rank = np.empty(len(terms), dtype=np.int64)
+    rank[order] = np.arange(len(terms))
+    term_ids = rank[np.asarray(term_ids, dtype=np.int64)]
+    doc_ids = np.asarray(doc_ids, dtype=np.int64)
+    pairs = np.lexsort((doc_ids, term_ids))
+    term_ids, doc_ids = term_ids[pairs], doc_ids[pairs]
+
+    # The first document of each term is stored as is, every later one as the gap to the previous
+    gaps = doc_ids.copy()
+    same_term = np.zeros(len(doc_ids), dtype=bool)
+    same_term[1:] = term_ids[1:] == term_ids[:-1]
+    gaps[same_term] -= doc_ids[:-1][same_term[1:]]
+    postings, lengths = encode_varints(gaps)
+
+    table = np.zeros(len(terms) + 1, dtype=TERM_DTYPE)
+    table['term_offset'][1:] = np.cumsum([len(term) for term in (encoded_terms[i] for i in order)], dtype=np.uint64)
+    table['postings_offset'][1:] = np.cumsum(np.bincount(term_ids, weights=lengths, minlength=len(terms))
+                                             .astype(np.uint64))
+    table['doc_freq'][:-1] = np.bincount(term_ids, minlength=len(terms))
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'docs.npy'), np.asarray(docs, dtype=DOC_DTYPE))
+    np.save(os.path.join(tmp_path, 'terms.npy'), table)
+    with open(os.path.join(tmp_path, 'lexicon.bin'), 'wb') as f:
+        f.write(b''.join(encoded_terms[i] for i in order))
+    with open(os.path.join(tmp_path, 'postings.bin'), 'wb') as f:
+        f.write(postings.tobytes())
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+class _Lexicon:
+    """The sorted terms of a segment as a read-only sequence of bytes, for bisect."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+
+class IndexSegment:
+    """
+    A segment written by write_segment, memory-mapped: opening one reads no postings, and a query
+    only touches the pages of the terms it looks up (a binary search over the lexicon, then one
+    slice of postings.bin per term).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.docs = np.load(os.path.join(path, 'docs.npy'), mmap_mode='r')
+        self.table = np.load(os.path.join(path, 'terms.npy'), mmap_mode='r')
+        self.lexicon = _Lexicon(_map_bytes(os.path.join(path, 'lexicon.bin')), self.table['term_offset'])
+        self.postings = _map_bytes(os.path.join(path, 'postings.bin'))
+
+    def term_range(self, term, prefix=False):
+        """(first, end) positions in the lexicon of `term`, or of every term starting with it when `prefix` is set."""
+        key = term.encode('utf-8')
+        first = bisect_left(self.lexicon, key)
+        if prefix:
+            # No UTF-8 encoded text contains the byte 0xFF, so this sorts after every term starting with key
+            return first, bisect_left(self.lexicon, key + b'\xff', first)
+        return first, first + (first < len(self.lexicon) and self.lexicon[first] == key)
+
+    def doc_freq(self, first, end):
+        return int(self.table['doc_freq'][first:end].sum())
+
+    def postings_for(self, first, end):
+        """Decodes the postings of the lexicon terms first..end-1; returns (document numbers, count per term)."""
+        offsets = self.table['postings_offset']
+        gaps = decode_varints(self.postings[offsets[first]:offsets[end]]).astype(np.int64)
+        counts = self.table['doc_freq'][first:end].astype(np.int64)
+        # Running sums of the gaps, restarted at the first document of each term
+        totals = np.cumsum(gaps)
+        term_starts = np.cumsum(counts) - counts
+        restart = totals[term_starts[counts > 0]] - gaps[term_starts[counts > 0]]
+        return totals - np.repeat(restart, counts[counts > 0]), counts
+
+    def terms(self):
+        """Every term of the segment, in lexicon order."""
+        data = self.lexicon.data.tobytes()
+        offsets = self.table['term_offset'].tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _intersect(smaller, larger):
+    """Intersection of two ascending arrays of distinct numbers (a binary search per element of the smaller one)."""
+    positions = np.searchsorted(larger, smaller)
+    found = positions < len(larger)
+    found[found] = larger[positions[found]] == smaller[found]
+    return smaller[found]
+
+
+class SegmentBuilder:
+    """Collects the messages of a new segment: their DOC_DTYPE rows and the (term, document) pairs of their tokens."""
+
+    def __init__(self):
+        self.term_ids = {}
+        self.docs = []
+        self.pair_terms = array('q')
+        self.pair_docs = array('q')
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, record):
+        doc_id = len(self.docs)
+        date = record.get('date')
+        price = record.get('extracted_price')
+        self.docs.append((record['channel_id'], record['message_id'], _date_seconds(date) if date else MISSING_DATE,
+                          float(price) if price is not None else np.nan))
+        term_ids = {self.term_ids.setdefault(token, len(self.term_ids))
+                    for token in (record.get('cleaned_text') or '').split()}
+        self.pair_terms.extend(term_ids)
+        self.pair_docs.extend([doc_id] * len(term_ids))
+
+    def write(self, path):
+        write_segment(path, self.docs, list(self.term_ids), np.frombuffer(self.pair_terms, dtype=np.int64),
+                      np.frombuffer(self.pair_docs, dtype=np.int64))
+
+
+def merge_segments(segments, path):
+    """Writes the documents of `segments`, in order, as one segment at `path`."""
+    term_ids, docs, pair_terms, pair_docs = {}, [], [], []
+    doc_offset = 0
+    for segment in segments:
+        mapping = np.array([term_ids.setdefault(term, len(term_ids)) for term in segment.terms()], dtype=np.int64)
+        doc_ids, counts = segment.postings_for(0, len(segment.lexicon))
+        pair_terms.append(np.repeat(mapping, counts))
+        pair_docs.append(doc_ids + doc_offset)
+        docs.append(np.asarray(segment.docs))
+        doc_offset += len(segment.docs)
+    write_segment(path, np.concatenate(docs), list(term_ids), np.concatenate(pair_terms), np.concatenate(pair_docs))
+
+
+def new_manifest():
+    return {'version': INDEX_VERSION, 'segments': [], 'next_segment': 1, 'last_message_ids': {}}
+
+
+def load_manifest(index_dir=SEARCH_INDEX_DIR):
+    """The index's manifest (its segments and the last indexed message_id per channel), None if there is no index."""
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, index_dir=SEARCH_INDEX_DIR):
+    """
+    Writes the manifest through a temporary file; replacing it is what makes new segments visible,
+    so readers see either the old or the new set of segments. Segments no longer listed are deleted
+    (readers that still have them open keep their memory maps).
+    """
+    tmp_path = os.path.join(index_dir, MANIFEST_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_FILE))
+    listed = {segment['name'] for segment in manifest['segments']}
+    for name in os.listdir(index_dir):
+        if name.startswith(SEGMENT_PREFIX) and name not in listed:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+
+def _add_segment(manifest, index_dir, write):
+    """Writes a new segment with write(path) and lists it in the manifest (not yet saved)."""
+    name = f"{SEGMENT_PREFIX}{manifest['next_segment']:06d}"
+    manifest['next_segment'] += 1
+    write(os.path.join(index_dir, name))
+    documents = len(np.load(os.path.join(index_dir, name, 'docs.npy'), mmap_mode='r'))
+    manifest['segments'].append({'name': name, 'documents': documents})
+
+
+def _merge_small_segments(manifest, index_dir, max_segments, segment_size):
+    small = [segment for segment in manifest['segments'] if segment['documents'] < segment_size]
+    if len(small) <= max_segments:
+        return
+    print(f"Merging {len(small)} small segments...")
+    opened = [IndexSegment(os.path.join(index_dir, segment['name'])) for segment in small]
+    manifest['segments'] = [segment for segment in manifest['segments'] if segment not in small]
+    _add_segment(manifest, index_dir, lambda path: merge_segments(opened, path))
+
+
+def update_search_index(input_path=STRUCTURED_DATA_JSONL, index_dir=SEARCH_INDEX_DIR, full_refresh=False,
+                        segment_size=SEARCH_SEGMENT_SIZE, max_segments=SEARCH_MAX_SEGMENTS):
+    """
+    Indexes the messages of `input_path` that are newer than the last message_id indexed for their
+    channel, as one or more new segments, so after a delta scrape only the new messages are indexed.
+    Messages indexed earlier are not re-read if their text changes; `full_refresh` rebuilds the
+    index from the file. Returns the number of messages added.
+    """
+    manifest = None if full_refresh else load_manifest(index_dir)
+    if manifest is not None and manifest.get('version') != INDEX_VERSION:
+        print(f"Search index format changed (version {manifest.get('version')} -> {INDEX_VERSION}); rebuilding it.")
+        manifest = None
+    if manifest is None:
+        manifest = new_manifest()
+    os.makedirs(index_dir, exist_ok=True)
+
+    # Filter on the ids indexed before this run, so messages of the same file never hide each other
+    seen_until = {int(channel_id): message_id for channel_id, message_id in manifest['last_message_ids'].items()}
+    last_message_ids = dict(seen_until)
+    builder, added = SegmentBuilder(), 0
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line in tqdm(f, desc=f"Indexing {os.path.basename(input_path)}"):
+            record = json.loads(line)
+            channel_id, message_id = record.get('channel_id'), record.get('message_id')
+            if channel_id is None or message_id is None or message_id <= seen_until.get(channel_id, -1):
+                continue
+            builder.add(record)
+            last_message_ids[channel_id] = max(message_id, last_message_ids.get(channel_id, message_id))
+            if len(builder) >= segment_size:
+                added += len(builder)
+                _add_segment(manifest, index_dir, builder.write)
+                builder = SegmentBuilder()
+    if len(builder):
+        added += len(builder)
+        _add_segment(manifest, index_dir, builder.write)
+    _merge_small_segments(manifest, index_dir, max_segments, segment_size)
+    manifest['last_message_ids'] = {str(channel_id): message_id for channel_id, message_id in last_message_ids.items()}
+    save_manifest(manifest, index_dir)
+    total = sum(segment['documents'] for segment in manifest['segments'])
+    print(f"Indexed {added} new messages; the index holds {total} messages in {len(manifest['segments'])} segments.")
+    return added
+
+
+def compact_search_index(index_dir=SEARCH_INDEX_DIR):
+    """Merges every segment of the index into one (the fastest layout to query)."""
+    manifest = load_manifest(index_dir)
+    if manifest is None or len(manifest['segments']) < 2:
+        return
+    opened = [IndexSegment(os.path.join(index_dir, segment['name'])) for segment in manifest['segments']]
+    manifest['segments'] = []
+    _add_segment(manifest, index_dir, lambda path: merge_segments(opened, path))
+    save_manifest(manifest, index_dir)
+    print(f"Merged {len(opened)} segments into {manifest['segments'][0]['name']}.")
+
+
+class SearchIndex:
+    """
+    Read side of the index: finds the messages whose cleaned_text contains every word of a query.
+
+    Query words go through the same AmharicPreprocessor as cleaned_text, so homophone spellings,
+    punctuation and case match the way they were indexed; stopwords are ignored. A word ending in
+    '*' matches every token starting with it. The segments are opened once, when the index is
+    created; create a new SearchIndex to see later updates.
+    """
+
+    def __init__(self, index_dir=SEARCH_INDEX_DIR, preprocessor=None):
+        manifest = load_manifest(index_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No search index at {index_dir}; build it with `python -m scripts.search_index update`.")
+        if manifest.get('version') != INDEX_VERSION:
+            raise ValueError(f"The search index at {index_dir} has an old format; rebuild it with `update --full-refresh`.")
+        self.index_dir = index_dir
+        self.preprocessor = preprocessor or AmharicPreprocessor()
+        self.segments = [IndexSegment(os.path.join(index_dir, segment['name'])) for segment in manifest['segments']]
+
+    def __len__(self):
+        return sum(len(segment.docs) for segment in self.segments)
+
+    def query_terms(self, query):
+        """The (token, is_prefix) pairs a query searches for."""
+        terms = []
+        for word in query.split():
+            prefix = word.endswith(PREFIX_MARKER)
+            token = self.preprocessor.preprocess_text(word.rstrip(PREFIX_MARKER))
+            if token and (token, prefix) not in terms:
+                terms.append((token, prefix))
+        return terms
+
+    def _segment_matches(self, segment, terms):
+        """Document numbers in `segment` containing every term (all documents if there are no terms)."""
+        if not terms:
+            return np.arange(len(segment.docs))
+        ranges = [segment.term_range(token, prefix) for token, prefix in terms]
+        # Start from the rarest term, so every intersection is against the smallest candidate set
+        ranges.sort(key=lambda term_range: segment.doc_freq(*term_range))
+        matches = None
+        for first, end in ranges:
+            doc_ids, counts = segment.postings_for(first, end)
+            if len(counts) > 1:
+                doc_ids = np.unique(doc_ids)
+            matches = doc_ids if matches is None else _intersect(matches, doc_ids)
+            if not len(matches):
+                break
+        return matches
+
+    def matches(self, query='', channel_id=None, start_date=None, end_date=None, min_price=None, max_price=None):
+        """
+        Returns the DOC_DTYPE rows of every message matching the query and filters: one channel_id or a
+        list of them, a date range (start inclusive, end exclusive, as ISO strings or datetimes) and an
+        extracted_price range. An empty query leaves just the filters; one of stopwords only matches nothing.
+        """
+        terms = self.query_terms(query)
+        if query.strip() and not terms:
+            return np.zeros(0, dtype=DOC_DTYPE)
+        start, end = to_epoch_seconds(start_date), to_epoch_seconds(end_date)
+        found = []
+        for segment in self.segments:
+            docs = segment.docs[self._segment_matches(segment, terms)]
+            keep = np.ones(len(docs), dtype=bool)
+            if channel_id is not None:
+                keep &= np.isin(docs['channel_id'], np.atleast_1d(channel_id))
+            if start is not None:
+                keep &= docs['date'] >= start
+            if end is not None:
+                keep &= (docs['date'] < end) & (docs['date'] != MISSING_DATE)
+            if min_price is not None:
+                keep &= docs['price'] >= min_price
+            if max_price is not None:
+                keep &= docs['price'] <= max_price
+            found.append(docs[keep])
+        return np.concatenate(found) if found else np.zeros(0, dtype=DOC_DTYPE)
+
+    def search(self, query='', limit=20, **filters):
+        """
+        Returns (number of matching messages, the `limit` newest of them as dicts with channel_id,
+        message_id, date and extracted_price). See matches() for the filters.
+        """
+        found = self.matches(query, **filters)
+        total = len(found)
+        if len(found) > limit:
+            found = found[np.argpartition(found['date'], len(found) - limit)[len(found) - limit:]]
+        hits = []
+        for doc in found[np.argsort(found['date'], kind='stable')[::-1]]:
+            date, price = int(doc['date']), float(doc['price'])
+            hits.append({
+                'channel_id': int(doc['channel_id']),
+                'message_id': int(doc['message_id']),
+                'date': datetime.fromtimestamp(date, timezone.utc).isoformat() if date != MISSING_DATE else None,
+                'extracted_price': None if np.isnan(price) else str(int(price) if price.is_integer() else price),
+            })
+        return total, hits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or query the inverted index over the cleaned message text.")
+    parser.add_argument('--index-dir', default=SEARCH_INDEX_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    update_parser = subparsers.add_parser('update', help="Index the messages added since the last update.")
+    update_parser.add_argument('--input', default=STRUCTURED_DATA_JSONL)
+    update_parser.add_argument('--full-refresh', action='store_true', help="Rebuild the index from scratch.")
+    subparsers.add_parser('compact', help="Merge all segments into one.")
+    search_parser = subparsers.add_parser('search', help="Find messages containing every query word.")
+    search_parser.add_argument('query', nargs='*', help="Words to look for; 'word*' matches a prefix.")
+    search_parser.add_argument('--channel', type=int, nargs='+', help="Only these channel_ids.")
+    search_parser.add_argument('--start-date', help="ISO date, inclusive.")
+    search_parser.add_argument('--end-date', help="ISO date, exclusive.")
+    search_parser.add_argument('--min-price', type=float)
+    search_parser.add_argument('--max-price', type=float)
+    search_parser.add_argument('--limit', type=int, default=20)
+    search_parser.add_argument('--db', default=MESSAGE_STORE_DB, help="Message store to show the text of the hits from.")
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        update_search_index(args.input, args.index_dir, args.full_refresh)
+    elif args.command == 'compact':
+        compact_search_index(args.index_dir)
+    else:
+        index = SearchIndex(args.index_dir)
+        start_time = time.perf_counter()
+        total, hits = index.search(' '.join(args.query), args.limit, channel_id=args.channel,
+                                   start_date=args.start_date, end_date=args.end_date,
+                                   min_price=args.min_price, max_price=args.max_price)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"{total} of {len(index)} messages match ({elapsed_ms:.1f} ms); newest {len(hits)}:")
+        store = None
+        if os.path.exists(args.db):
+            from scripts.message_store import MessageStore
+            store = MessageStore(args.db)
+        for hit in hits:
+            price = f" {hit['extracted_price']} ETB" if hit['extracted_price'] else ""
+            print(f"  [{hit['date']}] channel {hit['channel_id']} message {hit['message_id']}{price}")
+            message = store.get_message(hit['channel_id'], hit['message_id']) if store else None
+            if message and message.get('text'):
+                print(f"    {' '.join(message['text'].split())[:200]}")
+        if store:
+            store.close()
@@ -0,0 +1,244 @@
+# scripts/synthetic_corpus.py
+import os
+import random
+import argparse
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from tqdm import tqdm
+
+from scripts.config import AMHARIC_HOMOPHONE_MAP, SYNTHETIC_RAW_JSONL, SYNTHETIC_LABELED_RAW, \
+                           SYNTHETIC_LABELED_MESSAGES
+from scripts.jsonl_writer import BufferedJsonlWriter
+from scripts.text_preprocessor import AmharicPreprocessor
+
+# Products, locations and filler seen in the scraped channels; multi-word entries are one entity
+PRODUCTS = [
+    ["ጫማ"], ["የወንድ", "ጫማ"], ["የሴት", "ቦርሳ"], ["ስልክ"], ["ላፕቶፕ"], ["ሰዓት"], ["ሸሚዝ"], ["ቀሚስ"], ["ሱሪ"],
+    ["ጃኬት"], ["ብርድ", "ልብስ"], ["የቡና", "ማፍያ"], ["ብሌንደር"], ["ፀጉር", "ማድረቂያ"], ["የልጆች", "ልብስ"], ["ሽቶ"],
+    ["Samsung", "Galaxy", "A14"], ["iPhone", "13", "Pro"], ["iPhone", "14"], ["Nike", "Air", "Max"],
+    ["Adidas", "Samba"], ["HP", "EliteBook"], ["Dell", "Latitude"], ["AirPods"], ["JBL", "speaker"],
+]
+LOCATIONS = [["ቦሌ"], ["መገናኛ"], ["ፒያሳ"], ["አዲስ", "አበባ"], ["ሜክሲኮ"], ["ካሳንቺስ"], ["ሀያት"], ["አዳማ"],
+             ["ባህር", "ዳር"], ["ሀዋሳ"], ["ጀሞ"], ["ሰሚት"]]
+LOCATION_CUES = ["አድራሻ", "አድራሻችን", "📍", "ሱቃችን", "Address:"]
+FILLER = ["አዲስ", "ቆንጆ", "ጥራት", "ያለው", "ለሽያጭ", "ቀርቧል", "ይደውሉ", "ያዙ", "በቅናሽ", "ኦሪጅናል", "ቁጥር", "መጠን",
+          "ከለር", "ያለን", "ዋስትና", "ነፃ", "ዴሊቨሪ", "እና", "ነው", "በጣም", "ለበለጠ", "መረጃ", "ሰላም", "ውድ", "ደንበኞቻችን",
+          "Original", "quality", "size", "free", "delivery", "available", "new", "stock"]
+PRICE_KEYWORDS = ["ዋጋ", "ዋጋ:", "ዋጋው", "Price:"]
+CURRENCIES = ["ብር", "ETB", "birr", "Birr"]
+EMOJIS = ["📞", "🔥", "✅", "👉", "💯", "😍", "🛍", "⚡️", "👟", "📦", "🎁", "⭐️"]
+
+
+def homophone_variants(homophone_map=AMHARIC_HOMOPHONE_MAP):
+    """Normalized character -> the characters normalization merges into it (its variant spellings)."""
+    variants = {}
+    for source, target in homophone_map.items():
+        variants.setdefault(target, []).append(source)
+    return variants
+
+
+HOMOPHONE_VARIANTS = homophone_variants()
+
+SYNTHETIC_CHANNEL_BASE = 1_000_000_000
+SYNTHETIC_START_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def ethiopic_numeral(value):
+    """Writes 1-9999 in Ethiopic numerals, e.g. 1250 -> '፲፪፻፶' (the form parse_ethiopic_number reads)."""
+    def below_hundred(number):
+        tens, ones = divmod(number, 10)
+        return (chr(0x1371 + tens) if tens else '') + (chr(0x1368 + ones) if ones else '')
+    hundreds, rest = divmod(value, 100)
+    return ((below_hundred(hundreds) if hundreds > 1 else '') + '፻' if hundreds else '') + below_hundred(rest)
+
+
+class SyntheticPostGenerator:
+    """
+    Generates realistic e-commerce posts deterministically: the same seed always gives the same corpus.
+
+    A post names a product, usually with a price ('1,200 ብር', 'ዋጋ: 3500', 'ETB 450', '፭፻ ብር'), often
+    a location and a phone number ('0912345678', '+251912345678', '251912345678'), mixed with
+    Amharic and Latin filler, emojis, hashtags and line breaks. Amharic words are spelled with homophone variants at
+    `homophone_rate` (e.g. 'ሠላም' for 'ሰላም'), and `repost_rate` of the posts repeat a recent post of the
+    same channel with small edits, like the near-duplicates real channels produce.
+
+    Each post also comes with its labeled tokens: the post's cleaned_text tokens (as the labeling file
+    shows them) with the BIO labels of the products, prices and locations they came from.
+    """
+
+    def __init__(self, seed=42, num_channels=20, homophone_rate=0.1, repost_rate=0.05, days=365):
+        self.rng = random.Random(seed)
+        self.num_channels = num_channels
+        self.homophone_rate = homophone_rate
+        self.repost_rate = repost_rate
+        self.days = days
+        self.preprocessor = AmharicPreprocessor()
+        self.next_message_ids = [1] * num_channels
+        self.recent_posts = [deque(maxlen=50) for _ in range(num_channels)]
+
+    def spell(self, word):
+        """The word, with some characters replaced by homophone variants at homophone_rate."""
+        if self.rng.random() >= self.homophone_rate:
+            return word
+        return ''.join(self.rng.choice(HOMOPHONE_VARIANTS[char]) if char in HOMOPHONE_VARIANTS else char
+                       for char in word)
+
+    def price_segment(self):
+        rng = self.rng
+        amount = rng.choice((rng.randint(1, 99) * 100, rng.randint(1, 50) * 500, rng.randint(50, 99_000)))
+        style = rng.random()
+        if style < 0.35:
+            return [(f"{amount:,}", 'B-PRICE'), (rng.choice(CURRENCIES), 'I-PRICE')]
+        if style < 0.6:
+            return [(rng.choice(PRICE_KEYWORDS), 'O'), (f"{amount:,}" if rng.random() < 0.5 else str(amount), 'B-PRICE')]
+        if style < 0.75:
+            return [('ETB', 'B-PRICE'), (str(amount), 'I-PRICE')]
+        if style < 0.85:
+            return [(f"{amount}ብር", 'B-PRICE')]
+        if style < 0.95:
+            return [(rng.choice(PRICE_KEYWORDS), 'O'), (ethiopic_numeral(rng.randint(1, 99) * 100), 'B-PRICE'),
+                    ('ብር', 'I-PRICE')]
+        return [(f"{amount}.00", 'B-PRICE'), ('birr', 'I-PRICE')]
+
+    def phone_segment(self):
+        rng = self.rng
+        number = f"{rng.choice('97')}{rng.randint(10_000_000, 99_999_999)}"
+        phone = rng.choice((f"0{number}", f"+251{number}", f"0{number}", f"251{number}"))
+        return [(rng.choice(EMOJIS[:2]), 'O')] * (rng.random() < 0.5) + [(phone, 'O')]
+
+    def entity_segment(self, words, entity):
+        words = [self.spell(word) for word in words]
+        return [(word, ('B-' if index == 0 else 'I-') + entity) for index, word in enumerate(words)]
+
+    def fresh_post(self):
+        """(text, raw token/label pairs) of a new post."""
+        rng = self.rng
+        segments = [self.entity_segment(rng.choice(PRODUCTS), 'PRODUCT'),
+                    [(self.spell(word), 'O') for word in rng.choices(FILLER, k=rng.randint(2, 25))]]
+        if rng.random() < 0.85:
+            segments.append(self.price_segment())
+        if rng.random() < 0.6:
+            segments.append([(rng.choice(LOCATION_CUES), 'O')] + self.entity_segment(rng.choice(LOCATIONS), 'LOC'))
+        if rng.random() < 0.7:
+            segments.append(self.phone_segment())
+        if rng.random() < 0.3:
+            segments.append(self.entity_segment(rng.choice(PRODUCTS), 'PRODUCT'))
+        rng.shuffle(segments)
+        if rng.random() < 0.4:
+            segments.append([(f"#{rng.choice(('sale', 'ቅናሽ', 'shoes', 'ethiopia', 'addis'))}", 'O')])
+        tokens = [(rng.choice(EMOJIS), 'O')] * (rng.random() < 0.6)
+        for segment in segments:
+            tokens.extend(segment)
+            if rng.random() < 0.2:
+                tokens.append((rng.choice(EMOJIS), 'O'))
+        separators = ['\n' if rng.random() < 0.15 else ' ' for _ in tokens]
+        text = ''.join(token + separator for (token, _), separator in zip(tokens, separators)).strip()
+        return text, tokens
+
+    def repost(self, text, tokens):
+        """A recent post with one token dropped or an emoji added (a near-duplicate)."""
+        tokens = list(tokens)
+        if self.rng.random() < 0.5 and len(tokens) > 3:
+            del tokens[self.rng.randrange(len(tokens))]
+        else:
+            tokens.insert(self.rng.randrange(len(tokens) + 1), (self.rng.choice(EMOJIS), 'O'))
+        return ' '.join(token for token, _ in tokens), tokens
+
+    def labeled_tokens(self, tokens):
+        """
+        The cleaned_text tokens of a post with their labels. Tokens that preprocessing removes
+        (emojis, stopwords) are dropped; when an entity's first token is dropped, the next one starts it.
+        """
+        labeled, previous_label = [], 'O'
+        for token, label in tokens:
+            cleaned = self.preprocessor.preprocess_text(token)
+            if not cleaned:
+                continue
+            if label.startswith('I-') and previous_label[2:] != label[2:]:
+                label = 'B-' + label[2:]
+            for word in cleaned.split():
+                labeled.append((word, label))
+                label = 'I-' + label[2:] if label != 'O' else label
+            previous_label = labeled[-1][1]
+        return labeled
+
+    def message(self, index, count):
+        """The index-th of `count` messages as (raw message dict, raw token/label pairs)."""
+        rng = self.rng
+        channel = rng.randrange(self.num_channels)
+        recent = self.recent_posts[channel]
+        if recent and rng.random() < self.repost_rate:
+            text, tokens = self.repost(*rng.choice(recent))
+        else:
+            text, tokens = self.fresh_post()
+        recent.append((text, tokens))
+        message_id = self.next_message_ids[channel]
+        self.next_message_ids[channel] += 1
+        # Posts are spread evenly over `days`, so every channel's dates grow with its message ids
+        date = SYNTHETIC_START_DATE + timedelta(seconds=index * self.days * 86_400 // max(count, 1))
+        record = {
+            'channel_id': SYNTHETIC_CHANNEL_BASE + channel,
+            'message_id': message_id,
+            'date': date.isoformat(),
+            'text': text,
+            'views': int(rng.lognormvariate(6, 1)),
+            'forwards': rng.randint(0, 20),
+            'replies_count': rng.randint(0, 5),
+            'has_photo': False,
+            'image_path': None,
+            'has_document': False,
+            'document_name': None,
+            'document_path': None,
+            'media_download_error': False,
+        }
+        return record, tokens
+
+
+def generate_corpus(count, output_path=SYNTHETIC_RAW_JSONL, labeled_path=SYNTHETIC_LABELED_RAW,
+                    labeled_messages=SYNTHETIC_LABELED_MESSAGES, seed=42, num_channels=20, homophone_rate=0.1,
+                    repost_rate=0.05):
+    """
+    Writes `count` synthetic messages to `output_path` in the scraper's raw JSONL format (so Step 2
+    can run on them), and the labeled tokens of the first `labeled_messages` of them to
+    `labeled_path`, in the raw labeled format convert_to_conll.py reads (message headers as written
+    by prepare_for_labeling.py, one "token label" line per token). Returns the number of messages.
+    """
+    generator = SyntheticPostGenerator(seed, num_channels, homophone_rate, repost_rate)
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    labeled_file = open(labeled_path, 'w', encoding='utf-8') if labeled_path and labeled_messages else None
+    try:
+        with BufferedJsonlWriter(output_path, mode='w', atomic=True) as writer:
+            for index in tqdm(range(count), desc="Generating messages"):
+                record, tokens = generator.message(index, count)
+                writer.write(record)
+                if labeled_file is not None and index < labeled_messages:
+                    labeled_file.write(f"--- Message ID: {record['message_id']} (channel {record['channel_id']}) ---\n")
+                    labeled_file.writelines(f"{token} {label}\n" for token, label in generator.labeled_tokens(tokens))
+                    labeled_file.write('\n')
+    finally:
+        if labeled_file is not None:
+            labeled_file.close()
+    print(f"Wrote {writer.records_written} synthetic messages to {output_path}")
+    if labeled_file is not None:
+        print(f"Wrote the labeled tokens of {min(count, labeled_messages)} of them to {labeled_path}")
+    return writer.records_written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of Amharic e-commerce posts.")
+    parser.add_argument('--messages', type=int, default=100_000, help="Number of messages (e.g. 10000 to 10000000).")
+    parser.add_argument('--output', default=SYNTHETIC_RAW_JSONL)
+    parser.add_argument('--labeled-output', default=SYNTHETIC_LABELED_RAW)
+    parser.add_argument('--labeled-messages', type=int, default=SYNTHETIC_LABELED_MESSAGES,
+                        help="Also write the labeled tokens of this many messages (0 = none).")
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--homophone-rate', type=float, default=0.1,
+                        help="Share of Amharic words spelled with homophone variants.")
+    parser.add_argument('--repost-rate', type=float, default=0.05, help="Share of near-duplicate reposts.")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate_corpus(args.messages, args.output, args.labeled_output, args.labeled_messages, args.seed,
+                    args.channels, args.homophone_rate, args.repost_rate)
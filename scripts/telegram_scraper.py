@@ -2,6 +2,7 @@
 import os
 import json
 import asyncio
+import argparse
 from telethon import TelegramClient
 from telethon.tl.types import MessageMediaPhoto, DocumentAttributeFilename, DocumentAttributeVideo
 from tqdm.asyncio import tqdm
@@ -9,31 +10,99 @@ from datetime import datetime
 
 # Import paths and credentials from config.py
 from scripts.config import API_ID, API_HASH, PHONE_NUMBER, TELEGRAM_CHANNELS, \
-                           RAW_DATA_DIR, IMAGES_DIR, DOCUMENTS_DIR, RAW_MESSAGES_JSONL
+                           RAW_DATA_DIR, IMAGES_DIR, DOCUMENTS_DIR, RAW_MESSAGES_JSONL, \
+                           SCRAPER_CONCURRENCY, MESSAGE_LIMIT_PER_CHANNEL, MEDIA_DOWNLOAD_CONCURRENCY, \
+                           MESSAGE_STORE_DB
+from scripts.scrape_checkpoint import ScrapeCheckpoint
+from scripts.jsonl_writer import BufferedJsonlWriter
+from scripts.media_downloader import MediaDownloader, download_media_file, repair_failed_media
+from scripts.rate_limiter import TelegramCallScheduler
+from scripts.message_store import MessageStore
+from scripts import metrics
 
 # --- NOTE: The setup_telegram_client function has been removed. ---
 # The connection is now handled directly by 'async with TelegramClient' in ingest_telegram_data.
 
-async def get_channel_entities(client, channel_urls):
-    """Resolves channel entities from URLs."""
+async def get_channel_entities(client, channel_urls, concurrency=SCRAPER_CONCURRENCY, scheduler=None):
+    """
+    Resolves channel entities from URLs, up to `concurrency` lookups at a time.
+    Lookups go through `scheduler` (a TelegramCallScheduler) for rate limiting and retries.
+    """
     # The client is guaranteed to be connected here because ingest_telegram_data
     # uses 'async with TelegramClient' which ensures connection.
-    channel_entities = []
+    scheduler = scheduler or TelegramCallScheduler()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
     print("\nResolving channel entities...")
     with tqdm(total=len(channel_urls), desc="Resolving channels") as pbar:
-        for url in channel_urls:
-            try:
-                entity = await client.get_entity(url)
-                channel_entities.append(entity)
-            except Exception as e:
-                print(f"  -> ERROR: Could not resolve {url}: {e}")
-            pbar.update(1)
-    return channel_entities
+        async def resolve(url):
+            async with semaphore:
+                try:
+                    return await scheduler.call('get_entity', url, client.get_entity, url)
+                except Exception as e:
+                    print(f"  -> ERROR: Could not resolve {url}: {e}")
+                    return None
+                finally:
+                    pbar.update(1)
+
+        # gather() keeps the order of channel_urls, so the output order stays stable
+        resolved = await asyncio.gather(*(resolve(url) for url in channel_urls))
+    return [entity for entity in resolved if entity is not None]
+
+def photo_media_path(message, images_dir=IMAGES_DIR):
+    """Returns the storage path of a message's photo, keyed by its Telegram photo id."""
+    return os.path.join(images_dir, f"photo_{message.photo.id}.jpg")
+
+def document_media_path(message, documents_dir=DOCUMENTS_DIR):
+    """
+    Returns the original file name of a message's document and its storage path.
+    The path is keyed by the Telegram document id, so reposts of the same file share it.
+    """
+    document_filename = None
+
+    if hasattr(message.file, 'name') and message.file.name:
+        document_filename = message.file.name
+    else:
+        for attr in message.document.attributes:
+            if isinstance(attr, DocumentAttributeFilename):
+                document_filename = attr.file_name
+                break
+        if not document_filename:
+            for attr in message.document.attributes:
+                if isinstance(attr, DocumentAttributeVideo):
+                    ext = 'mp4'
+                    document_filename = f"video_{message.id}_{message.date.timestamp()}.{ext}"
+                    break
+        if not document_filename:
+            ext = message.document.mime_type.split('/')[-1] if message.document.mime_type else 'bin'
+            document_filename = f"doc_{message.id}_{message.date.timestamp()}.{ext}"
+
+    ext = os.path.splitext(document_filename)[1] or '.bin'
+    return document_filename, os.path.join(documents_dir, f"doc_{message.document.id}{ext}")
 
-async def process_message(message):
+async def save_media(message, path, media_downloader=None):
+    """
+    Hands a media file to the background downloader, or downloads it inline when
+    no downloader is given. Returns False if an inline download failed.
+    """
+    if media_downloader is not None:
+        await media_downloader.enqueue(message, path)
+        return True
+    try:
+        if not os.path.exists(path):
+            await download_media_file(message, path)
+        return True
+    except Exception as e:
+        print(f"  -> ERROR downloading media for message {message.id} to {path}: {e}")
+        return False
+
+async def process_message(message, media_downloader=None):
     """
     Processes a single Telegram message, extracts relevant data,
     and handles media downloads.
+    With a MediaDownloader, media is only queued here and the record already points
+    at its final, deduplicated path, so a non-null path does not yet mean the file exists.
+    Failed background downloads are logged to MEDIA_FAILURES_JSONL and reconciled with the
+    written records by repair_failed_media at the end of ingest_telegram_data.
     """
     data = {
         'channel_id': message.peer_id.channel_id if hasattr(message.peer_id, 'channel_id') else None,
@@ -46,114 +115,204 @@ async def process_message(message):
         'has_photo': False,
         'image_path': None,
         'has_document': False,
+        'document_name': None,
         'document_path': None,
         'media_download_error': False
     }
 
+    images_dir = media_downloader.images_dir if media_downloader is not None else IMAGES_DIR
+    documents_dir = media_downloader.documents_dir if media_downloader is not None else DOCUMENTS_DIR
+
     if message.photo:
         data['has_photo'] = True
-        image_filename = f"image_{message.id}_{message.date.timestamp()}.jpg"
-        image_path = os.path.join(IMAGES_DIR, image_filename)
-        try:
-            if not os.path.exists(image_path):
-                await message.download_media(file=image_path)
+        image_path = photo_media_path(message, images_dir)
+        if await save_media(message, image_path, media_downloader):
             data['image_path'] = image_path
-        except Exception as e:
-            print(f"  -> ERROR downloading image for message {message.id}: {e}")
-            data['image_path'] = None
+        else:
             data['media_download_error'] = True
 
     if message.document:
         data['has_document'] = True
-        document_filename = None
-
-        if hasattr(message.file, 'name') and message.file.name:
-            document_filename = message.file.name
-        else:
-            for attr in message.document.attributes:
-                if isinstance(attr, DocumentAttributeFilename):
-                    document_filename = attr.file_name
-                    break
-            if not document_filename:
-                for attr in message.document.attributes:
-                    if isinstance(attr, DocumentAttributeVideo):
-                        ext = 'mp4'
-                        document_filename = f"video_{message.id}_{message.date.timestamp()}.{ext}"
-                        break
-            if not document_filename:
-                ext = message.document.mime_type.split('/')[-1] if message.document.mime_type else 'bin'
-                document_filename = f"doc_{message.id}_{message.date.timestamp()}.{ext}"
-
-        document_path = os.path.join(DOCUMENTS_DIR, document_filename)
-        try:
-            if not os.path.exists(document_path):
-                await message.download_media(file=document_path)
+        document_filename, document_path = document_media_path(message, documents_dir)
+        data['document_name'] = document_filename
+        if await save_media(message, document_path, media_downloader):
             data['document_path'] = document_path
-        except Exception as e:
-            print(f"  -> ERROR downloading document for message {message.id} ({document_filename}): {e}")
-            data['document_path'] = None
+        else:
             data['media_download_error'] = True
 
     return data
 
-async def scrape_channel_messages(client, channel_entity):
-    """Fetches all messages from a single channel."""
-    all_messages = []
-    print(f"\nFetching historical messages from '{channel_entity.title}' (ID: {channel_entity.id})...")
-
-    # --- ADD THIS LINE FOR TESTING ---
-    # Limits the number of messages fetched per channel.
-    # Set a small number (e.g., 500) for quick testing.
-    # You can increase this later or remove it for full scraping if confident.
-    MESSAGE_LIMIT_PER_CHANNEL = 100 # You can set this to 100, 500, or 1000 for testing.
+async def iter_channel_messages(client, channel_entity, min_id=0, limit=MESSAGE_LIMIT_PER_CHANNEL, position=None,
+                                media_downloader=None, scheduler=None):
+    """
+    Yields processed messages from a single channel, oldest first, as they are fetched.
+    Only messages with an id greater than `min_id` are fetched, so passing the
+    channel's checkpoint turns this into a delta fetch.
+    `position` places this channel's progress bar when several channels are scraped at once.
+    FloodWaits and transient errors are absorbed by `scheduler`; only unrecoverable
+    errors end the channel early.
+    """
+    scheduler = scheduler or TelegramCallScheduler()
+    fetched_count = 0
+    print(f"\nFetching messages newer than ID {min_id} from '{channel_entity.title}' (ID: {channel_entity.id})...")
 
+    pbar = tqdm(total=limit, desc=f"  {channel_entity.title[:30]}",
+                unit="msg", position=position, leave=False)
     try:
-        # --- MODIFY THIS LINE TO INCLUDE THE LIMIT ---
-        async for message in client.iter_messages(channel_entity, reverse=True, limit=MESSAGE_LIMIT_PER_CHANNEL):
-            processed_data = await process_message(message)
-            all_messages.append(processed_data)
+        # With reverse=True, offset_id is the id to start *after*, so both bounds point at the checkpoint
+        async for message in scheduler.iter_messages(client, channel_entity, channel_entity.id,
+                                                     reverse=True, limit=limit, min_id=min_id, offset_id=min_id):
+            processed_data = await process_message(message, media_downloader)
+            fetched_count += 1
+            pbar.update(1)
+            yield processed_data
     except Exception as e:
         print(f"  -> An error occurred while scraping '{channel_entity.title}': {e}")
     finally:
-        print(f"\n  -> Fetched {len(all_messages)} messages from '{channel_entity.title}'.")
-    return all_messages
+        pbar.close()
+        print(f"\n  -> Fetched {fetched_count} messages from '{channel_entity.title}'.")
+
+async def scrape_channel_messages(client, channel_entity, min_id=0, limit=MESSAGE_LIMIT_PER_CHANNEL, position=None,
+                                  media_downloader=None, scheduler=None):
+    """Fetches messages from a single channel into a list (see iter_channel_messages)."""
+    return [msg async for msg in iter_channel_messages(client, channel_entity, min_id, limit, position,
+                                                       media_downloader, scheduler)]
+
+def make_checkpoint_committer(checkpoint, message_store=None):
+    """
+    Returns an on_flush callback for BufferedJsonlWriter that advances the checkpoint
+    only for records that have already been written to disk.
+    With a MessageStore, each batch is upserted into it before the checkpoint moves.
+    """
+    def commit(batch):
+        if message_store is not None:
+            message_store.upsert_messages(batch)
+        for msg_data in batch:
+            checkpoint.update(msg_data['channel_id'], msg_data['message_id'])
+        checkpoint.save()
+    return commit
 
-async def ingest_telegram_data():
+async def scrape_channels_concurrently(client, channel_entities, checkpoint, writer, concurrency=SCRAPER_CONCURRENCY,
+                                       media_downloader=None, scheduler=None, limit=MESSAGE_LIMIT_PER_CHANNEL,
+                                       message_sink=None):
+    """
+    Scrapes several channels at once with a pool of asyncio workers sharing one client.
+    Messages are streamed into `writer` as they arrive instead of being collected in memory,
+    and their media is handed to `media_downloader` if one is given.
+    Every message is also passed to the coroutine `message_sink`, if given; a sink that waits
+    (e.g. on a full queue) slows scraping down to its pace.
+    Returns the number of messages scraped per channel, in the order of `channel_entities`.
+    """
+    scraped_counts = [0] * len(channel_entities)
+    queue = asyncio.Queue()
+    for index, entity in enumerate(channel_entities):
+        queue.put_nowait((index, entity))
+
+    num_workers = max(1, min(concurrency, len(channel_entities)))
+    with tqdm(total=len(channel_entities), desc="Scraping channels", position=0) as pbar:
+        async def worker(worker_id):
+            while True:
+                try:
+                    index, entity = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                # Each worker owns one progress bar row below the overall bar
+                async for msg_data in iter_channel_messages(client, entity, min_id=checkpoint.get(entity.id),
+                                                            limit=limit, position=worker_id + 1,
+                                                            media_downloader=media_downloader,
+                                                            scheduler=scheduler):
+                    writer.write(msg_data)
+                    metrics.count('scraper.messages')
+                    if message_sink is not None:
+                        await message_sink(msg_data)
+                    scraped_counts[index] += 1
+                pbar.update(1)
+
+        tasks = [asyncio.ensure_future(worker(worker_id)) for worker_id in range(num_workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # After a failure the other workers must not keep scraping into a closed writer
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return scraped_counts
+
+async def ingest_telegram_data(concurrency=SCRAPER_CONCURRENCY, full_refresh=False,
+                               media_concurrency=MEDIA_DOWNLOAD_CONCURRENCY, message_store_path=MESSAGE_STORE_DB,
+                               message_sink=None):
     """
     Main function to orchestrate Telegram data ingestion.
     Connects to Telegram, resolves channels, scrapes messages,
-    and saves them to a JSONL file.
+    and appends them to a JSONL file.
+    Up to `concurrency` channels are resolved and scraped at the same time, while
+    media is downloaded in the background by `media_concurrency` workers.
+    Only messages newer than each channel's checkpoint are fetched, unless
+    `full_refresh` is set, which discards the raw file and checkpoint first.
+    Unless `message_store_path` is None, every message is also upserted into the SQLite
+    message store, so scraping the same messages again never duplicates them there.
+    Each scraped message is also awaited into `message_sink` (see scrape_channels_concurrently);
+    an error raised by the sink stops the ingestion and is re-raised to the caller.
     """
-    # Remove existing raw data file for a clean ingestion
-    if os.path.exists(RAW_MESSAGES_JSONL):
-        os.remove(RAW_MESSAGES_JSONL)
-        print(f"Removed existing {RAW_MESSAGES_JSONL} for a clean ingestion.")
+    sink_failure = None
+
+    async def sink(message_data):
+        nonlocal sink_failure
+        try:
+            await message_sink(message_data)
+        except Exception as e:
+            sink_failure = e
+            raise
+
+    checkpoint = ScrapeCheckpoint()
+    if full_refresh:
+        # Remove existing raw data file for a clean ingestion
+        if os.path.exists(RAW_MESSAGES_JSONL):
+            os.remove(RAW_MESSAGES_JSONL)
+            print(f"Removed existing {RAW_MESSAGES_JSONL} for a clean ingestion.")
+        checkpoint.reset()
+    elif checkpoint.high_water_marks:
+        print(f"Resuming from checkpoint for {len(checkpoint.high_water_marks)} channels.")
 
     # Use async with for robust client management
     # The client will automatically connect on 'async with' entry
     # and disconnect on 'async with' exit (even if errors occur)
     print("Telegram client connecting...")
     try:
-        async with TelegramClient('telegram_scraper_session', API_ID, API_HASH, timeout=60) as client:
+        # flood_sleep_threshold=0 makes Telethon raise every FloodWait instead of sleeping on it
+        # silently, so the shared scheduler can pause all workers together
+        async with TelegramClient('telegram_scraper_session', API_ID, API_HASH, timeout=60,
+                                  flood_sleep_threshold=0) as client:
             print("Telegram client connected.")
 
-            channel_entities = await get_channel_entities(client, TELEGRAM_CHANNELS)
+            scheduler = TelegramCallScheduler()
+            channel_entities = await get_channel_entities(client, TELEGRAM_CHANNELS, concurrency, scheduler)
 
-            all_scraped_messages = []
-            for entity in channel_entities:
-                if entity:
-                    messages = await scrape_channel_messages(client, entity)
-                    all_scraped_messages.extend(messages)
-                else:
-                    print(f"Skipping a channel that could not be resolved.")
-
-            # Save all scraped messages to a JSONL file
-            with open(RAW_MESSAGES_JSONL, 'a', encoding='utf-8') as f:
-                for msg_data in all_scraped_messages:
-                    f.write(json.dumps(msg_data, ensure_ascii=False) + '\n')
-            print(f"\nSuccessfully saved {len(all_scraped_messages)} raw messages to {RAW_MESSAGES_JSONL}")
+            media_downloader = MediaDownloader(concurrency=media_concurrency, scheduler=scheduler)
+            media_downloader.start()
+            message_store = MessageStore(message_store_path) if message_store_path else None
+            try:
+                # Records are flushed in batches while scraping; the store and checkpoint follow each flush.
+                # Leaving the 'with' block (even on error) writes out whatever is still buffered.
+                with BufferedJsonlWriter(RAW_MESSAGES_JSONL, mode='a',
+                                         on_flush=make_checkpoint_committer(checkpoint, message_store)) as writer:
+                    await scrape_channels_concurrently(client, channel_entities, checkpoint, writer, concurrency,
+                                                       media_downloader, scheduler,
+                                                       message_sink=sink if message_sink is not None else None)
+                print(f"\nSuccessfully appended {writer.records_written} new raw messages to {RAW_MESSAGES_JSONL}")
+            finally:
+                # Let the queued media drain while the client is still connected
+                await media_downloader.close()
+                if media_downloader.failed:
+                    repair_failed_media(RAW_MESSAGES_JSONL, media_downloader.failures_path, message_store)
+                scheduler.print_summary()
+                if message_store is not None:
+                    message_store.close()
 
     except Exception as e:
+        if e is sink_failure:
+            # The consumer of the messages failed; its caller has to stop as well
+            raise
         # This catches errors during connection, scraping, or saving
         print(f"An error occurred during data ingestion: {e}")
     # --- NOTE: The manual 'finally' block for client disconnection has been removed. ---
@@ -165,4 +324,25 @@ if __name__ == '__main__':
     os.makedirs(RAW_DATA_DIR, exist_ok=True)
     os.makedirs(IMAGES_DIR, exist_ok=True)
     os.makedirs(DOCUMENTS_DIR, exist_ok=True)
-    asyncio.run(ingest_telegram_data())
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Scrape the configured Telegram channels.")
+    parser.add_argument('--concurrency', type=int, default=SCRAPER_CONCURRENCY,
+                        help="Number of channels scraped at the same time.")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help="Ignore the checkpoint and re-download every channel from the start.")
+    parser.add_argument('--media-concurrency', type=int, default=MEDIA_DOWNLOAD_CONCURRENCY,
+                        help="Number of media files downloaded at the same time.")
+    parser.add_argument('--no-store', action='store_true',
+                        help="Only append to the raw JSONL file, not to the SQLite message store.")
+    parser.add_argument('--repair-media', action='store_true',
+                        help="Only mark raw messages whose logged media download failed, without scraping.")
+    args = parser.parse_args()
+    if args.repair_media:
+        store = None if args.no_store else MessageStore(MESSAGE_STORE_DB)
+        repair_failed_media(RAW_MESSAGES_JSONL, message_store=store)
+        if store is not None:
+            store.close()
+    else:
+        asyncio.run(ingest_telegram_data(concurrency=args.concurrency, full_refresh=args.full_refresh,
+                                         media_concurrency=args.media_concurrency,
+                                         message_store_path=None if args.no_store else MESSAGE_STORE_DB))
\ No newline at end of file
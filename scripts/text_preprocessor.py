@@ -1,12 +1,100 @@
 # scripts/text_preprocessor.py
 import re
-import string
-from scripts.config import CHARS_TO_REMOVE, AMHARIC_STOPWORDS, PRICE_PATTERN, PHONE_PATTERN
+import json
+import hashlib
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from scripts.config import CHARS_TO_REMOVE, AMHARIC_STOPWORDS, AMHARIC_HOMOPHONE_MAP, \
+                           PREPROCESS_WORKERS, PREPROCESS_CHUNK_SIZE
+from scripts.entity_extractor import EntityExtractor, PRICE_KEYWORD_WINDOW, format_amount
+from scripts import metrics
+
+# Characters kept by remove_emojis_and_symbols: Ethiopic, word characters, whitespace and basic punctuation
+KEPT_CHARS_PATTERN = r'[\u1200-\u137F\u1369-\u1371\s\w.,!?-]'
+
+# Ethiopic (fidel) blocks whose entries are precomputed in the normalization table
+ETHIOPIC_RANGES = [(0x1200, 0x139F), (0x2D80, 0x2DDF), (0xAB00, 0xAB2F), (0x1E7E0, 0x1E7FF)]
+
+# Upper bound on memoized tokens before the token cache is reset
+TOKEN_CACHE_SIZE = 200_000
+
+# Bump whenever a code change alters what process_text returns, so cached results are invalidated
+PREPROCESSOR_VERSION = 3
+
+# process_text result for messages without text
+EMPTY_FIELDS = (None, None, None, [])
+
+
+class NormalizationTable(dict):
+    """
+    str.translate() table that fuses character removal, emoji/symbol removal and
+    homophone merging into one lookup per character.
+    ASCII, Latin-1 and all Ethiopic blocks are filled in up front; any other code point
+    is classified the first time it is seen and then cached.
+    Every fidel has an entry, but only the pairs in AMHARIC_HOMOPHONE_MAP are merged:
+    extending the merges to whole homophone series is deferred, since it changes the output.
+    """
+
+    def __init__(self, chars_to_remove, homophone_map):
+        super().__init__()
+        self.chars_to_remove = set(chars_to_remove)
+        self.homophone_map = homophone_map
+        self.kept_chars_pattern = re.compile(KEPT_CHARS_PATTERN)
+        for codepoint in range(0x100):
+            self[codepoint]
+        for first, last in ETHIOPIC_RANGES:
+            for codepoint in range(first, last + 1):
+                self[codepoint]
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if char in self.chars_to_remove or not self.kept_chars_pattern.match(char):
+            value = None # None deletes the character in str.translate
+        else:
+            value = self.homophone_map.get(char, char)
+        self[codepoint] = value
+        return value
+
+
+class TokenCache(dict):
+    """
+    Memoizes the fully normalized form of each whitespace-separated token.
+    Every preprocessing step works character by character and never touches whitespace,
+    so a token always normalizes the same way; stopwords and tokens that end up empty map to ''.
+    """
+
+    def __init__(self, table, stopwords, max_size=TOKEN_CACHE_SIZE):
+        super().__init__()
+        self.table = table
+        self.stopwords = stopwords
+        self.max_size = max_size
+
+    def __missing__(self, token):
+        normalized = token.translate(self.table)
+        if not normalized or normalized in self.stopwords:
+            normalized = ''
+        else:
+            normalized = normalized.lower()
+        if len(self) >= self.max_size:
+            self.clear()
+        self[token] = normalized
+        return normalized
+
 
 class AmharicPreprocessor:
-    def __init__(self, chars_to_remove=CHARS_TO_REMOVE, stopwords=AMHARIC_STOPWORDS):
+    def __init__(self, chars_to_remove=CHARS_TO_REMOVE, stopwords=AMHARIC_STOPWORDS,
+                 homophone_map=AMHARIC_HOMOPHONE_MAP):
+        # Constructor arguments are kept so worker processes can build an identical instance
+        self.init_args = (chars_to_remove, list(stopwords), dict(homophone_map))
         self.chars_to_remove_pattern = re.compile(f"[{re.escape(chars_to_remove)}]")
         self.stopwords = set(stopwords)
+        self.homophone_map = dict(homophone_map)
+        # Fused single-pass engine used by preprocess_text (built once per instance)
+        self.normalization_table = NormalizationTable(chars_to_remove, self.homophone_map)
+        self.token_cache = TokenCache(self.normalization_table, self.stopwords)
+        # Single-scan price/phone/currency extraction shared by process_text and the extract_* helpers
+        self.entity_extractor = EntityExtractor()
 
     def clean_text(self, text):
         """Removes unwanted characters and extra spaces."""
@@ -24,28 +112,16 @@ class AmharicPreprocessor:
         # Ethiopic Unicode range: \u1200-\u137F (and other ranges if needed)
         # For simplicity, a broad removal of non-standard chars
         # This regex keeps Amharic characters, English letters, numbers, and basic punctuation.
-        cleaned_text = re.sub(r'[^\u1200-\u137F\u1369-\u1371\s\w.,!?-]', '', text)
+        cleaned_text = re.sub(r'[^\u1200-\u137F\u1369-\u1371\s\w.,!?-]', '', text) # Complement of KEPT_CHARS_PATTERN
         return cleaned_text
 
     def normalize_amharic_text(self, text):
         """Normalizes Amharic characters (e.g., merging similar-looking characters)."""
         if not isinstance(text, str):
             return ""
-        # Example normalizations (expand as needed based on common variations)
-        text = text.replace("ሀ", "ሃ") # ha
-        text = text.replace("ሑ", "ሁ") # hu
-        text = text.replace("ሒ", "ሂ") # hi
-        text = text.replace("ኅ", "ህ") # he
-        text = text.replace("ኈ", "ሆ") # ho
-        text = text.replace("ሠ", "ሰ") # se
-        text = text.replace("ሸ", "ሰ") # se (if sh is considered same as s)
-        text = text.replace("ዐ", "አ") # a'in
-        text = text.replace("ዒ", "ኢ") # i'in
-        text = text.replace("ዑ", "ኡ") # u'in
-        text = text.replace("ዓ", "አ") # a'in
-        text = text.replace("ፅ", "ጽ") # ts'i
-        text = text.replace("ጾ", "ፆ") # tso
-        # More complex normalizations might involve character mapping tables
+        # Character merges come from AMHARIC_HOMOPHONE_MAP in config.py
+        for source, target in self.homophone_map.items():
+            text = text.replace(source, target)
         return text
 
     def remove_stopwords(self, text):
@@ -56,8 +132,8 @@ class AmharicPreprocessor:
         filtered_words = [word for word in words if word not in self.stopwords]
         return " ".join(filtered_words)
 
-    def preprocess_text(self, text):
-        """Applies all preprocessing steps in order."""
+    def preprocess_text_stepwise(self, text):
+        """Applies all preprocessing steps one after another (reference for preprocess_text)."""
         text = self.clean_text(text)
         text = self.remove_emojis_and_symbols(text)
         text = self.normalize_amharic_text(text)
@@ -65,26 +141,177 @@ class AmharicPreprocessor:
         text = text.lower() # Convert to lowercase (Amharic doesn't have case, but good for consistency)
         return text
 
+    def preprocess_text(self, text):
+        """
+        Applies all preprocessing steps in a single pass.
+        Produces exactly the same output as preprocess_text_stepwise: each token is looked up
+        in the token cache, and only unseen tokens go through the fused translate table.
+        """
+        if not isinstance(text, str):
+            return ""
+        return " ".join(filter(None, map(self.token_cache.__getitem__, text.split())))
+
+    def extract_entities(self, text):
+        """Returns every price, phone number and currency marker in text, with offsets (see EntityExtractor)."""
+        return self.entity_extractor.extract(text)
+
     def extract_price(self, text):
-        """Extracts potential price information from text."""
+        """Extracts the first price in text as a digits-only string (e.g. '5000')."""
         if not isinstance(text, str):
             return None
-        matches = re.findall(PRICE_PATTERN, text)
-        if matches:
-            # Return the first found price, removing commas for numeric conversion
-            return matches[0].replace(',', '')
-        return None
+        return format_amount(self.entity_extractor.first_value(self.extract_entities(text), 'PRICE'))
 
     def extract_phone_number(self, text):
-        """Extracts potential phone numbers from text."""
+        """Extracts the first phone number in text, normalized to the local form (e.g. '0912345678')."""
         if not isinstance(text, str):
             return None
-        matches = re.findall(PHONE_PATTERN, text)
-        if matches:
-            # For simplicity, return the first found number and clean it
-            phone = re.sub(r'[^\d]', '', matches[0])
-            return phone
-        return None
+        return self.entity_extractor.first_value(self.extract_entities(text), 'PHONE')
+
+    def config_fingerprint(self):
+        """
+        Hash of everything that determines process_text's output: the characters to remove,
+        stopwords, homophone map, the entity extractor's compiled pattern and PREPROCESSOR_VERSION.
+        """
+        chars_to_remove, stopwords, homophone_map = self.init_args
+        config = {
+            'version': PREPROCESSOR_VERSION,
+            'chars_to_remove': chars_to_remove,
+            'stopwords': sorted(set(stopwords)),
+            'homophone_map': homophone_map,
+            # The compiled scan embeds the phone, amount and currency patterns from config.py
+            'entity_pattern': self.entity_extractor.pattern.pattern,
+            'price_keywords': self.entity_extractor.price_keywords,
+            'price_keyword_window': PRICE_KEYWORD_WINDOW,
+        }
+        return hashlib.sha256(json.dumps(config, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def process_text(self, text):
+        """
+        Returns (cleaned_text, extracted_price, extracted_phone, entities) for one raw message text.
+        The text is scanned for entities once; the first price and phone are taken from that scan.
+        """
+        if not text:
+            return EMPTY_FIELDS
+        entities = self.extract_entities(text)
+        first_value = self.entity_extractor.first_value
+        return (self.preprocess_text(text), format_amount(first_value(entities, 'PRICE')),
+                first_value(entities, 'PHONE'), entities)
+
+    def process_text_timed(self, text):
+        """process_text that records the time of each step in the run metrics (see metrics.py)."""
+        if not text:
+            return EMPTY_FIELDS
+        with metrics.timer('preprocess.extract_entities', 1):
+            entities = self.extract_entities(text)
+        with metrics.timer('preprocess.normalize', 1):
+            cleaned_text = self.preprocess_text(text)
+        first_value = self.entity_extractor.first_value
+        return cleaned_text, format_amount(first_value(entities, 'PRICE')), first_value(entities, 'PHONE'), entities
+
+    def process_record(self, message_data):
+        """Adds cleaned_text, extracted_price, extracted_phone and entities to a raw message dict and returns it."""
+        apply_processed_fields(message_data, self.process_text(message_data.get('text')))
+        return message_data
+
+    def process_stream(self, records, workers=PREPROCESS_WORKERS, chunk_size=PREPROCESS_CHUNK_SIZE, cache=None):
+        """
+        Enriches an iterable of raw message dicts and yields them in input order.
+        With workers > 1, chunks of message texts are fanned out to a process pool in which
+        every worker holds one AmharicPreprocessor built with the same arguments as this one.
+        Only a few chunks per worker are in flight at a time, so memory stays bounded
+        even for very long streams. Results are identical to the serial path.
+        With a PreprocessingCache, each chunk is looked up first and only the misses are computed.
+        """
+        records = iter(records)
+        chunks = iter(lambda: list(islice(records, chunk_size)), [])
+
+        if workers <= 1:
+            # Chosen once, so the untimed path carries no instrumentation at all
+            process_text = self.process_text_timed if metrics.enabled() else self.process_text
+            for chunk in chunks:
+                cached, miss_texts = self._lookup_chunk(chunk, cache)
+                computed = [process_text(text) for text in miss_texts]
+                yield from self._merge_chunk(chunk, cached, miss_texts, computed, cache)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=self.init_args) as executor:
+            pending = deque()
+            for chunk in chunks:
+                cached, miss_texts = self._lookup_chunk(chunk, cache)
+                pending.append((chunk, cached, miss_texts,
+                                executor.submit(_process_texts, miss_texts, metrics.enabled())))
+                # Keep every worker busy, but never queue more than two chunks per worker
+                if len(pending) > 2 * workers:
+                    chunk, cached, miss_texts, future = pending.popleft()
+                    yield from self._merge_chunk(chunk, cached, miss_texts, _worker_result(future), cache)
+            while pending:
+                chunk, cached, miss_texts, future = pending.popleft()
+                yield from self._merge_chunk(chunk, cached, miss_texts, _worker_result(future), cache)
+
+    def _lookup_chunk(self, chunk, cache):
+        """
+        Returns the already known fields per message (None where they still have to be computed)
+        and the texts that have to be computed.
+        """
+        texts = [message_data.get('text') for message_data in chunk]
+        cached = [None if text else EMPTY_FIELDS for text in texts]
+        if cache is not None:
+            to_lookup = [i for i, text in enumerate(texts) if text]
+            with metrics.timer('preprocess.cache_lookup', len(to_lookup)):
+                for i, fields in zip(to_lookup, cache.lookup([texts[i] for i in to_lookup])):
+                    cached[i] = fields
+        miss_texts = [text for text, fields in zip(texts, cached) if fields is None]
+        metrics.count('preprocess.messages', len(chunk))
+        metrics.count('preprocess.computed', len(miss_texts))
+        return cached, miss_texts
+
+    def _merge_chunk(self, chunk, cached, miss_texts, computed, cache):
+        """Applies cached and freshly computed fields to a chunk's messages, caching the new results."""
+        if cache is not None:
+            with metrics.timer('preprocess.cache_store', len(miss_texts)):
+                cache.store(miss_texts, computed)
+        computed = iter(computed)
+        for message_data, fields in zip(chunk, cached):
+            apply_processed_fields(message_data, fields if fields is not None else next(computed))
+        return chunk
+
+    def preprocess_batch(self, records, workers=PREPROCESS_WORKERS, chunk_size=PREPROCESS_CHUNK_SIZE, cache=None):
+        """Enriches a batch of raw message dicts (see process_stream) and returns them as a list."""
+        return list(self.process_stream(records, workers, chunk_size, cache))
+
+
+def apply_processed_fields(message_data, fields):
+    """Stores the (cleaned_text, extracted_price, extracted_phone, entities) tuple on a message dict."""
+    (message_data['cleaned_text'], message_data['extracted_price'],
+     message_data['extracted_phone'], message_data['entities']) = fields
+
+
+# --- Process pool workers ---
+# Each worker process builds its preprocessor once and reuses it for every chunk.
+_worker_preprocessor = None
+
+def _init_worker(chars_to_remove, stopwords, homophone_map):
+    global _worker_preprocessor
+    _worker_preprocessor = AmharicPreprocessor(chars_to_remove, stopwords, homophone_map)
+
+def _process_texts(texts, timed=False):
+    """Returns the chunk's results and, if `timed`, a snapshot of the step timings for the parent's metrics."""
+    if not timed:
+        return [_worker_preprocessor.process_text(text) for text in texts], None
+    # A forked worker inherits the parent's registry, so start from an empty one for every chunk
+    metrics.METRICS.enable()
+    results = [_worker_preprocessor.process_text_timed(text) for text in texts]
+    snapshot = metrics.METRICS.snapshot()
+    metrics.METRICS.disable()
+    return results, snapshot
+
+def _worker_result(future):
+    results, snapshot = future.result()
+    if snapshot is not None:
+        metrics.METRICS.merge(snapshot)
+    return results
+
 
 # Example usage (for testing within the module)
 if __name__ == '__main__':
@@ -108,4 +335,7 @@ if __name__ == '__main__':
     print(f"Extracted Price: {price}")
 
     phone = preprocessor.extract_phone_number(sample_text)
-    print(f"Extracted Phone: {phone}")
\ No newline at end of file
+    print(f"Extracted Phone: {phone}")
+
+    entities = preprocessor.extract_entities(sample_text)
+    print(f"Entities: {entities}")
\ No newline at end of file
@@ -0,0 +1,218 @@
+# scripts/vendor_scorecard.py
+import os
+import json
+import argparse
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from scripts.entity_extractor import parse_ethiopic_number
+from scripts.config import STRUCTURED_DATA_JSONL, NER_ENTITIES_JSONL, VENDOR_AGGREGATES_PARQUET, \
+                           LENDING_SCORE_WEIGHTS, SCORECARD_CHUNK_SIZE
+
+# Message fields the scorecard reads; entities come from the NER model when available
+POST_COLUMNS = ['channel_id', 'message_id', 'date', 'text', 'views']
+ENTITY_FIELDS = ('ner_entities', 'entities')
+
+# Running totals kept per vendor, summed/min'ed/max'ed when a delta is folded in
+SUM_COLUMNS = ['total_posts', 'total_views', 'price_sum', 'price_count']
+# The vendor's most viewed post so far, replaced as a whole when a new post has more views
+TOP_COLUMNS = ['top_message_id', 'top_views', 'top_text', 'top_product', 'top_price']
+
+# Ethiopic numerals (digits, tens, ፻ and ፼), converted as a whole by parse_ethiopic_number
+ETHIOPIC_NUMERAL_PATTERN = r'[\u1369-\u137C]+'
+
+
+def parse_price(prices):
+    """
+    Parses a Series of price strings ('1,300', '45.000', '5,500 ETB', '፲፪፻ ብር') into floats, with
+    NaN for non-strings and unparsable values; the notebook's parse_price as pandas string operations.
+    The notebook only mapped the digits ፩-፱ (and listed '፰' twice); here whole Ethiopic numerals,
+    including tens, ፻ and ፼, are converted with entity_extractor.parse_ethiopic_number.
+    """
+    cleaned = (pd.Series(prices, dtype=object).str.lower()
+               .str.replace('ብር', '', regex=False)
+               .str.replace('etb', '', regex=False)
+               .str.replace(ETHIOPIC_NUMERAL_PATTERN, lambda match: str(parse_ethiopic_number(match.group())),
+                            regex=True)
+               .str.replace(r'[^\d.]', '', regex=True)) # Drops thousands separators and any other text
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def entity_frame(posts, field):
+    """
+    One row (type, text, value) per entity in the posts' `field` lists, indexed by the post's row label.
+    `value` is the normalized value of regex entities and missing for NER spans, which only have text.
+    """
+    if field not in posts:
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in ('type', 'text', 'value')})
+    entities = posts[field].explode().dropna()
+    return pd.DataFrame({'type': entities.str.get('type'), 'text': entities.str.get('text'),
+                         'value': entities.str.get('value')}, index=entities.index)
+
+
+def price_values(price_entities):
+    """Prices of PRICE entities as floats: their normalized `value` when present, else parsed from `text`."""
+    values = pd.to_numeric(price_entities['value'], errors='coerce')
+    return values.fillna(parse_price(price_entities['text']))
+
+
+def aggregate_posts(posts):
+    """
+    Computes the per-vendor (channel_id) aggregates of a DataFrame of posts with groupby operations:
+    post and view totals, first/last post date, last message_id, the sum and count of parsed
+    PRICE entities, and the most viewed post with its first product and price.
+    """
+    posts = posts.reset_index(drop=True)
+    posts['views'] = posts['views'].fillna(0)
+    posts['date'] = pd.to_datetime(posts['date'], utc=True, format='ISO8601')
+    groups = posts.groupby('channel_id')
+    aggregates = groups.agg(total_posts=('message_id', 'size'), total_views=('views', 'sum'),
+                            first_date=('date', 'min'), last_date=('date', 'max'),
+                            last_message_id=('message_id', 'max'))
+
+    entity_field = next((field for field in ENTITY_FIELDS if field in posts), None)
+    entities = entity_frame(posts, entity_field)
+    prices = price_values(entities.loc[entities['type'] == 'PRICE'])
+    price_stats = prices.groupby(posts['channel_id'].loc[prices.index].to_numpy()).agg(['sum', 'count'])
+    aggregates['price_sum'] = price_stats['sum'].reindex(aggregates.index, fill_value=0.0)
+    aggregates['price_count'] = price_stats['count'].reindex(aggregates.index, fill_value=0)
+
+    # idxmax returns the first post with the most views, like the notebook
+    top_rows = groups['views'].idxmax().to_numpy()
+    first_product = entities.loc[entities['type'] == 'PRODUCT', 'text'].groupby(level=0).first()
+    first_price = prices.groupby(level=0).first()
+    aggregates['top_message_id'] = posts['message_id'].to_numpy()[top_rows]
+    aggregates['top_views'] = posts['views'].to_numpy()[top_rows]
+    aggregates['top_text'] = posts['text'].to_numpy()[top_rows]
+    aggregates['top_product'] = first_product.reindex(top_rows).to_numpy()
+    aggregates['top_price'] = first_price.reindex(top_rows).to_numpy()
+    return aggregates
+
+
+def merge_aggregates(stored, delta):
+    """Folds the aggregates of new posts (`delta`) into `stored`; vendors missing from either side are kept."""
+    if stored is None or stored.empty:
+        return delta
+    combined = pd.concat([stored, delta])
+    merged = combined.groupby(level=0).agg({**{column: 'sum' for column in SUM_COLUMNS},
+                                            'first_date': 'min', 'last_date': 'max', 'last_message_id': 'max'})
+    # On equal views the stored top post wins, as it was posted first
+    combined = combined.reset_index()
+    top_rows = combined.groupby('channel_id')['top_views'].idxmax().to_numpy()
+    for column in TOP_COLUMNS:
+        merged[column] = combined[column].to_numpy()[top_rows]
+    return merged[stored.columns]
+
+
+def vendor_metrics(aggregates):
+    """Turns the aggregates into the notebook's vendor analytics table (one row per channel_id)."""
+    total_posts = aggregates['total_posts']
+    span_days = (aggregates['last_date'] - aggregates['first_date']).dt.days
+    # One post counts as one post a week; posts all on one day as that many a day
+    posts_per_week = np.select([total_posts == 1, span_days == 0],
+                               [1.0, total_posts * 7.0],
+                               total_posts / span_days.where(span_days > 0) * 7)
+    return pd.DataFrame({
+        'Total Posts': total_posts,
+        'Posting Frequency (Posts/Week)': posts_per_week,
+        'Average Views per Post': aggregates['total_views'] / total_posts,
+        'Top Performing Post': aggregates['top_text'].fillna('N/A'),
+        'Top Post Product': aggregates['top_product'].fillna('N/A'),
+        'Top Post Price (ETB)': aggregates['top_price'],
+        'Average Price Point (ETB)': aggregates['price_sum'] / aggregates['price_count'].where(aggregates['price_count'] > 0),
+    }, index=aggregates.index)
+
+
+def lending_scorecard(metrics, weights=LENDING_SCORE_WEIGHTS):
+    """
+    Scores vendors by their views, posting frequency and average price, each divided by its
+    maximum over all vendors and weighted by `weights`. Returns the scorecard, best vendor first.
+    """
+    max_views = metrics['Average Views per Post'].max()
+    normalized_views = metrics['Average Views per Post'] / max_views if max_views > 0 else 0
+    max_frequency = metrics['Posting Frequency (Posts/Week)'].max()
+    normalized_frequency = metrics['Posting Frequency (Posts/Week)'] / max_frequency if max_frequency > 0 else 0
+    prices = metrics['Average Price Point (ETB)']
+    max_price = prices.max() if prices.notna().any() else 1.0
+    normalized_price = (prices / max_price if max_price > 0 else prices * 0).fillna(0)
+
+    scorecard = pd.DataFrame({
+        'Avg. Views/Post': metrics['Average Views per Post'],
+        'Posts/Week': metrics['Posting Frequency (Posts/Week)'],
+        'Avg. Price (ETB)': prices,
+        'Lending Score': (normalized_views * weights['views'] + normalized_frequency * weights['frequency']
+                          + normalized_price * weights['price']),
+    }, index=metrics.index)
+    return scorecard.sort_values('Lending Score', ascending=False)
+
+
+def read_post_chunks(input_path, chunk_size=SCORECARD_CHUNK_SIZE):
+    """Yields the messages of a structured JSONL file as DataFrames of at most `chunk_size` rows."""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for lines in iter(lambda: list(islice(f, chunk_size)), []):
+            records = [json.loads(line) for line in lines]
+            columns = POST_COLUMNS + [field for field in ENTITY_FIELDS if field in records[0]]
+            yield pd.DataFrame.from_records(records, columns=columns)
+
+
+def load_aggregates(path=VENDOR_AGGREGATES_PARQUET):
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+
+def save_aggregates(aggregates, path=VENDOR_AGGREGATES_PARQUET):
+    """Writes the aggregates through a temporary file, so a crash never leaves them half-written."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    aggregates.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def update_vendor_aggregates(input_path, aggregates_path=VENDOR_AGGREGATES_PARQUET, full_refresh=False,
+                             chunk_size=SCORECARD_CHUNK_SIZE):
+    """
+    Folds the messages of `input_path` that are newer than a vendor's stored last_message_id
+    into the stored aggregates and saves them, so after a delta scrape only the new messages
+    are aggregated. Views of messages aggregated earlier are not refreshed; `full_refresh`
+    recomputes everything from the file. Returns the aggregates (None if there are no messages).
+    """
+    stored = None if full_refresh else load_aggregates(aggregates_path)
+    # Filter on the ids stored before this run, so chunks from the same file never hide each other
+    seen_until = stored['last_message_id'] if stored is not None else pd.Series(dtype='int64')
+    new_messages = 0
+    for posts in read_post_chunks(input_path, chunk_size):
+        known = posts['channel_id'].map(seen_until)
+        posts = posts[known.isna() | (posts['message_id'] > known)]
+        if posts.empty:
+            continue
+        stored = merge_aggregates(stored, aggregate_posts(posts))
+        new_messages += len(posts)
+    if stored is None:
+        print(f"No messages to aggregate in {input_path}.")
+        return None
+    save_aggregates(stored, aggregates_path)
+    print(f"Folded {new_messages} new messages into the aggregates of {len(stored)} vendors.")
+    return stored
+
+
+if __name__ == '__main__':
+    default_input = NER_ENTITIES_JSONL if os.path.exists(NER_ENTITIES_JSONL) else STRUCTURED_DATA_JSONL
+    parser = argparse.ArgumentParser(description="Build the vendor scorecard for micro-lending.")
+    parser.add_argument('--input', default=default_input,
+                        help="Structured messages, preferably with the NER model's entities (ner_inference.py).")
+    parser.add_argument('--aggregates', default=VENDOR_AGGREGATES_PARQUET)
+    parser.add_argument('--full-refresh', action='store_true', help="Recompute the aggregates from scratch.")
+    parser.add_argument('--output', help="Also save the scorecard as CSV.")
+    args = parser.parse_args()
+
+    vendor_aggregates = update_vendor_aggregates(args.input, args.aggregates, args.full_refresh)
+    if vendor_aggregates is not None:
+        final_scorecard = lending_scorecard(vendor_metrics(vendor_aggregates))
+        print("\n--- Final Vendor Scorecard for Micro-Lending ---")
+        print(final_scorecard.to_string())
+        if args.output:
+            final_scorecard.to_csv(args.output)
+            print(f"Scorecard saved to {args.output}")
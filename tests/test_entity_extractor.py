@@ -0,0 +1,53 @@
+# tests/test_entity_extractor.py
+import pytest
+
+from scripts.entity_extractor import EntityExtractor, format_amount, parse_amount
+
+
+@pytest.fixture(scope='module')
+def extractor():
+    return EntityExtractor()
+
+
+def entity_values(extractor, text):
+    return [(entity['type'], entity['value']) for entity in extractor.extract(text)]
+
+
+@pytest.mark.parametrize('text', [
+    "251912345678",
+    "ዋጋ 251912345678",
+    "+251912345678",
+    "+251 912345678",
+    "0912345678",
+    "ዋጋ 0912345678",
+    "ETB 0912345678",
+])
+def test_phone_numbers_are_never_prices(extractor, text):
+    values = entity_values(extractor, text)
+    assert ('PHONE', '0912345678') in values
+    assert all(kind != 'PRICE' for kind, _ in values)
+
+
+def test_prices_next_to_phones(extractor):
+    assert entity_values(extractor, "ዋጋ 5,000 ብር ይደውሉ +251 711223344") == [
+        ('PRICE', 5000), ('PHONE', '0711223344')]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("1,200", 1200),
+    ("12345678901234567890", 12345678901234567890),
+    ("1,200.50", '1200.50'),
+    ("5.00", '5.00'),
+    ("፲፪፻", 1200),
+])
+def test_parse_amount_keeps_precision(text, expected):
+    assert parse_amount(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("ዋጋ 1,200.50 ብር", '1200.50'),
+    ("5.00 ETB", '5.00'),
+    ("12345678901234567890 ብር", '12345678901234567890'),
+])
+def test_extracted_price_keeps_historical_form(extractor, text, expected):
+    assert format_amount(extractor.first_value(extractor.extract(text), 'PRICE')) == expected
@@ -0,0 +1,32 @@
+# tests/test_synthetic_corpus.py
+import re
+
+from scripts.entity_extractor import EntityExtractor, normalize_phone
+from scripts.synthetic_corpus import SyntheticPostGenerator
+
+PHONE_TOKEN_PATTERN = re.compile(r"^\+?\d{9,}$")
+
+
+def test_generated_phones_extract_as_phones():
+    generator = SyntheticPostGenerator(seed=7)
+    extractor = EntityExtractor()
+    for _ in range(2000):
+        phone = generator.phone_segment()[-1][0]
+        # Right after a price keyword is where a phone could be taken for a price
+        entities = extractor.extract(f"ዋጋ {phone}")
+        assert [(entity['type'], entity['text']) for entity in entities] == [('PHONE', phone)]
+        assert entities[0]['value'] == normalize_phone(phone)
+
+
+def test_phones_in_generated_posts_are_never_prices():
+    generator = SyntheticPostGenerator(seed=11, repost_rate=0)
+    extractor = EntityExtractor()
+    for index in range(2000):
+        record, tokens = generator.message(index, 2000)
+        entities = extractor.extract(record['text'])
+        phones = {entity['text'] for entity in entities if entity['type'] == 'PHONE'}
+        price_texts = ' '.join(entity['text'] for entity in entities if entity['type'] == 'PRICE')
+        for token, _ in tokens:
+            if PHONE_TOKEN_PATTERN.match(token):
+                assert token in phones
+                assert token not in price_texts
@@ -0,0 +1,42 @@
+# tests/test_text_preprocessor.py
+import pytest
+
+from scripts.text_preprocessor import AmharicPreprocessor
+
+# Fixed inputs covering homophone merges, emojis/symbols, mixed scripts, stopwords and whitespace
+SAMPLE_TEXTS = [
+    "ሀሎ ሠላም ዐዲስ ፅጌ ጾም ኅብረት ሑሴን",
+    "ዋጋ 5,000 ብር 🔥🔥 ስልክ 0911234567 ✅",
+    "Samsung Galaxy A54 ዋጋ ፦ 25000ብር!!! 📱 @shop_channel #ad",
+    "እና  ነው\tበ\nላይ   ግን",
+    "Hello WORLD ሽያጭ ❤️ 100% ORIGINAL",
+    "ጫማ — size 42 — 1,500 birr • Bole, Addis Ababa",
+    "",
+    "   ",
+]
+
+
+@pytest.fixture(scope='module')
+def preprocessor():
+    return AmharicPreprocessor()
+
+
+@pytest.mark.parametrize('text', SAMPLE_TEXTS)
+def test_preprocess_text_matches_stepwise(preprocessor, text):
+    assert preprocessor.preprocess_text(text) == preprocessor.preprocess_text_stepwise(text)
+
+
+def test_preprocess_text_matches_stepwise_with_warm_cache(preprocessor):
+    # Second pass hits the token cache for every token
+    first = [preprocessor.preprocess_text(text) for text in SAMPLE_TEXTS]
+    second = [preprocessor.preprocess_text(text) for text in SAMPLE_TEXTS]
+    assert first == second == [preprocessor.preprocess_text_stepwise(text) for text in SAMPLE_TEXTS]
+
+
+def test_process_stream_parallel_matches_serial(preprocessor):
+    records = [{'id': i, 'text': SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + f" {i}"} for i in range(50)]
+    records += [{'id': 50, 'text': None}, {'id': 51}]
+    serial = list(preprocessor.process_stream([dict(r) for r in records], workers=1, chunk_size=7))
+    parallel = list(preprocessor.process_stream([dict(r) for r in records], workers=2, chunk_size=7))
+    assert [r['id'] for r in parallel] == [r['id'] for r in records]
+    assert parallel == serial